@@ -0,0 +1,84 @@
+"""
+Micro-benchmark: listing paths and signatures of a large context JSON, loaded whole and through context_reader.py.
+
+Generates a tree of Python modules padded to --kb kilobytes each, writes it
+with build_code_json.py, then runs, each in a fresh interpreter: json.load()
+of the document followed by collecting every function's signature; the
+same through a ContextReader, which only keeps offsets and never reads
+full_content or source_code; and listing the paths alone through the
+reader. The reader's peak RSS should stay in the tens of MB while
+json.load() grows with the artifact. The builder runs in a subprocess too:
+Linux carries a process's peak RSS across exec, so the benchmark itself
+must stay small for the children's peaks to be their own.
+
+Usage: python benchmarks/bench_context_reader.py [--files N] [--kb N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each mode runs as `python -c MODE_PREAMBLE + body ARTIFACT` and prints "<seconds> <signatures> <peak RSS in KB>".
+MODE_PREAMBLE = """
+import json, resource, sys, time
+sys.path.insert(0, {repo_root!r})
+import context_reader
+start = time.perf_counter()
+"""
+MODES = {
+    "json.load": """
+with open(sys.argv[1], encoding="utf-8") as f:
+    files = json.load(f)["files"]
+signatures = [(path, name, function["signature"]) for path, entry in files.items() for name, function in entry.get("functions", {}).items()]
+""",
+    "reader": """
+reader = context_reader.ContextReader(sys.argv[1])
+signatures = [(path, name, function["signature"]) for path in reader for name, function in reader[path].get("functions", {}).items()]
+""",
+    "reader, paths only": """
+reader = context_reader.ContextReader(sys.argv[1])
+signatures = list(reader)
+""",
+}
+MODE_EPILOGUE = """
+print(time.perf_counter() - start, len(signatures), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def write_module(root, index, kilobytes, files_per_dir=100):
+    package = os.path.join(root, f"pkg{index // files_per_dir}")
+    os.makedirs(package, exist_ok=True)
+    functions = "".join(f'def func_{index}_{i}(a, b={i}):\n    """Returns "{i}"."""\n    return a + b\n\n\n' for i in range(10))
+    padding = f"# Padding line of module {index} with a \"quoted\" word and a \\ backslash.\n"
+    with open(os.path.join(package, f"mod{index}.py"), "w", encoding="utf-8") as f:
+        f.write(functions + padding * (kilobytes * 1024 // len(padding)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=4000, help="Number of modules in the tree.")
+    parser.add_argument("--kb", type=int, default=64, help="Approximate size of each module in KB.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        root = os.path.join(work_dir, "tree")
+        for i in range(args.files):
+            write_module(root, i, args.kb)
+        artifact = os.path.join(work_dir, "context.json")
+        subprocess.run([sys.executable, os.path.join(REPO_ROOT, "build_code_json.py"), root, "-o", artifact],
+                       stdout=subprocess.DEVNULL, check=True)
+        print(f"{args.files} files, artifact of {os.path.getsize(artifact) / 1e6:.0f} MB")
+        print(f"{'mode':>20} {'seconds':>8} {'items':>8} {'peak RSS MB':>12}")
+        for label, body in MODES.items():
+            script = MODE_PREAMBLE.format(repo_root=REPO_ROOT) + body + MODE_EPILOGUE
+            output = subprocess.run([sys.executable, "-c", script, artifact], capture_output=True, text=True, check=True).stdout
+            seconds, items, rss_kb = output.split()
+            print(f"{label:>20} {float(seconds):>8.2f} {int(items):>8} {int(rss_kb) / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
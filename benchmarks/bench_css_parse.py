@@ -0,0 +1,46 @@
+"""
+Micro-benchmark: parse_css_file on css/style.css repeated up to 1000 times.
+
+Reports the parse time and the cost per rule for each size. The tokenizer
+tracks line numbers incrementally, so microseconds-per-rule should stay
+roughly flat as the stylesheet grows (linear cost); the old regex parser
+recounted newlines from the top of the file for every rule (quadratic).
+
+Usage: python benchmarks/bench_css_parse.py [--repeat N] [--stylesheet PATH]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+import context_core  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions per size (best is reported).")
+    parser.add_argument("--stylesheet", default=os.path.join(REPO_ROOT, "css", "style.css"), help="Stylesheet to scale up.")
+    args = parser.parse_args()
+
+    with open(args.stylesheet, encoding="utf-8") as f:
+        stylesheet = f.read()
+    if not stylesheet.endswith("\n"):
+        stylesheet += "\n"
+
+    print(f"{'copies':>7} {'KiB':>8} {'rules':>8} {'best (ms)':>10} {'us/rule':>8}")
+    for copies in (1, 10, 100, 1000):
+        source = stylesheet * copies
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = context_core.parse_css_file("synthetic.css", source)
+            best = min(best, time.perf_counter() - start)
+        rule_count = len(result["rules"])
+        print(f"{copies:>7} {len(source) / 1024:>8.0f} {rule_count:>8} {best * 1000:>10.1f} {best * 1e6 / max(1, rule_count):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
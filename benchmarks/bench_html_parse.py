@@ -0,0 +1,178 @@
+"""
+Micro-benchmark: the single-pass HTML extraction against the find_all/select passes it replaced.
+
+Generates server-rendered-style pages (nested layout, forms, links, images
+and hx-* elements) of growing size, parses each into a BeautifulSoup tree
+with lxml, and times context_core.extract_html_details() against a copy of
+the previous extraction on that tree. Extraction removes the comments from
+the soup, so every timed run gets a freshly parsed one; those parses are
+what the soup column reports. Both extractions must produce the same
+file_data. The previous passes walked each hit up to the root, so their
+cost grew faster than the page; the single pass should stay linear.
+
+Usage: python benchmarks/bench_html_parse.py [--repeat N]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import context_core  # noqa: E402
+from context_core import BeautifulSoup, Comment  # noqa: E402
+
+
+def make_page(num_sections):
+    """Builds a synthetic page with num_sections repeated card sections."""
+    parts = ['<!DOCTYPE html>\n<html><head><title>Synthetic page</title>\n',
+             '<style>.card { padding: 1em; }</style></head>\n<body>\n<header id="top"><nav class="main">\n']
+    parts.extend(f'  <a href="/page/{i}">Page {i}</a>\n' for i in range(20))
+    parts.append('</nav></header>\n<main id="content">\n')
+    for s in range(num_sections):
+        parts.append(
+            f'<section id="section-{s}" class="card list">\n'
+            f'  <!-- section {s} -->\n'
+            f'  <div class="row"><div class="col"><div class="inner">\n'
+            f'    <h2>Heading {s}</h2><p>Some <b>bold</b> and <i>italic</i> text for section {s}.</p>\n'
+            f'    <img src="/img/{s}.png" alt="Image {s}" width="64" height="64">\n'
+            f'    <a href="/item/{s}" class="more">Read more</a>\n'
+            f'    <div hx-get="/fragment/{s}" hx-trigger="revealed" hx-swap="outerHTML">Loading {s}...</div>\n'
+            f'    <form id="form-{s}" action="/submit/{s}" method="post" hx-post="/submit/{s}">\n'
+            f'      <input type="text" name="title" placeholder="Title" required>\n'
+            f'      <select name="kind"><option>a</option><option>b</option></select>\n'
+            f'      <textarea name="body"></textarea><button type="submit">Save</button>\n'
+            f'    </form>\n'
+            f'  </div></div></div>\n'
+            f'</section>\n'
+        )
+    parts.append('</main>\n<footer id="bottom">Footer</footer>\n</body></html>\n')
+    return "".join(parts)
+
+def _previous_ancestry(tag, stop_at_tag=None):
+    path = []
+    for parent in tag.parents:
+        if stop_at_tag and parent is stop_at_tag: break
+        if parent.name in ['html', 'body'] and parent.parent is None: break
+        if parent.name is None: continue
+        tag_repr = parent.name
+        if parent.get('id'): tag_repr += f"#{parent['id']}"
+        classes = parent.get('class')
+        if isinstance(classes, list) and classes: tag_repr += f".{'.'.join(classes)}"
+        path.append(tag_repr)
+    path.reverse()
+    return path
+
+
+def previous_extraction(soup, filepath, file_data):
+    """The previous extraction: one find_all/select pass per detail, ancestry walked up per hit."""
+    for comment_node in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        comment_node.extract()
+
+    if soup.title and soup.title.string:
+        file_data["title"] = soup.title.string.strip()
+
+    for form in soup.find_all('form'):
+        form_data = {"id": form.get('id'), "action": form.get('action'), "method": form.get('method'), "inputs": [], "ancestry_path": _previous_ancestry(form, soup.body)}
+        for input_tag in form.select('input, textarea, select'):
+            form_data["inputs"].append({
+                "tag": input_tag.name, "type": input_tag.get('type'), "name": input_tag.get('name'),
+                "id": input_tag.get('id'), "value": input_tag.get('value'),
+                "placeholder": input_tag.get('placeholder'), "required": input_tag.get('required') is not None
+            })
+        file_data["forms"].append(form_data)
+
+    for link in soup.find_all('a'):
+        link_data = {"text": link.get_text(strip=True), "href": link.get('href'), "ancestry_path": _previous_ancestry(link, soup.body)}
+        if link_data["text"] or link_data["href"]: file_data["links"].append(link_data)
+
+    for img in soup.find_all('img'):
+        img_data = {"src": img.get('src'), "alt": img.get('alt'), "width": img.get('width'), "height": img.get('height'), "ancestry_path": _previous_ancestry(img, soup.body)}
+        if img_data["src"]: file_data["images"].append(img_data)
+
+    htmx_attrs_regex = re.compile(r'^hx-.+')
+    for element in soup.find_all(lambda tag: any(htmx_attrs_regex.match(attr) for attr in tag.attrs if isinstance(attr, str))):
+        file_data["htmx_elements"].append({
+            "tag": element.name, "id": element.get('id'), "classes": element.get('class'),
+            "hx_attributes": {attr: value for attr, value in element.attrs.items() if isinstance(attr, str) and htmx_attrs_regex.match(attr)},
+            "text_snippet": (element.get_text(strip=True)[:100] + "...") if element.get_text(strip=True) else None,
+            "ancestry_path": _previous_ancestry(element, soup.body)
+        })
+
+    # The synthetic pages have no <script> elements and the previous <script> handling only
+    # differed in calling the JavaScript parser, so it is left out here.
+    for style_tag in soup.find_all('style'):
+        if style_tag.string:
+            start_line_html = style_tag.sourceline if hasattr(style_tag, 'sourceline') and isinstance(style_tag.sourceline, int) else None
+            end_line_html = (start_line_html + len(str(style_tag).splitlines()) - 1) if start_line_html is not None else None
+            file_data["inline_styles"].append({
+                "type": style_tag.get('type', 'text/css'), "content": style_tag.string.strip(),
+                "start_lineno_html": start_line_html, "end_lineno_html": end_line_html,
+                "ancestry_path": _previous_ancestry(style_tag, soup.body)
+            })
+
+    relevant_selectors_body_children = 'body > div, body > section, body > article, body > main, body > aside, body > nav, body > header, body > footer, body > form, body > ul, body > ol, body > table, body > h1, body > h2, body > h3'
+    if soup.body:
+        for element in soup.body.select(relevant_selectors_body_children):
+            file_data["body_structure_preview"].append({
+                "tag": element.name, "id": element.get('id'), "classes": element.get('class'),
+                "text_snippet": (element.get_text(strip=True)[:100] + "...") if element.get_text(strip=True) else None,
+                "ancestry_path": _previous_ancestry(element, soup.body)
+            })
+        if not file_data["body_structure_preview"]: # Fallback
+            for element in soup.body.select('div[id], section[id], article[id], nav[id], header[id], footer[id], form[id]'):
+                preview_data = {
+                    "tag": element.name, "id": element.get('id'), "classes": element.get('class'),
+                    "text_snippet": (element.get_text(strip=True)[:100] + "...") if element.get_text(strip=True) else None,
+                    "ancestry_path": _previous_ancestry(element, soup.body)
+                }
+                if preview_data not in file_data["body_structure_preview"]:
+                    file_data["body_structure_preview"].append(preview_data)
+
+
+def empty_file_data(page):
+    return {
+        "path": "synthetic.html", "type": "html", "title": None, "forms": [], "links": [],
+        "images": [], "htmx_elements": [], "scripts": [], "inline_styles": [],
+        "body_structure_preview": [], "start_lineno": 1, "end_lineno": len(page.splitlines()), "full_content": page
+    }
+
+
+def time_extraction(page, extract):
+    """Parses page, then times extract on the fresh soup; returns (soup seconds, extraction seconds, file_data)."""
+    start = time.perf_counter()
+    soup = BeautifulSoup(page, 'lxml')
+    soup_seconds = time.perf_counter() - start
+    file_data = empty_file_data(page)
+    start = time.perf_counter()
+    extract(soup, "synthetic.html", file_data)
+    return soup_seconds, time.perf_counter() - start, file_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions per size (best is reported).")
+    args = parser.parse_args()
+
+    if not context_core.HTML_PARSING_AVAILABLE:
+        sys.exit("beautifulsoup4/lxml are not installed; nothing to benchmark.")
+
+    print(f"{'sections':>9} {'KiB':>7} {'soup (ms)':>10} {'previous (ms)':>14} {'single pass (ms)':>17} {'speedup':>8} {'whole call':>11}")
+    for num_sections in (10, 100, 500, 2000):
+        page = make_page(num_sections)
+        best_soup = best_previous = best_new = float("inf")
+        for _ in range(args.repeat):
+            soup_seconds, new_seconds, new_data = time_extraction(page, context_core.extract_html_details)
+            best_soup, best_new = min(best_soup, soup_seconds), min(best_new, new_seconds)
+            soup_seconds, previous_seconds, previous_data = time_extraction(page, previous_extraction)
+            best_soup, best_previous = min(best_soup, soup_seconds), min(best_previous, previous_seconds)
+            if new_data != previous_data:
+                sys.exit(f"The extractions differ at {num_sections} sections.")
+        whole_call = (best_soup + best_previous) / (best_soup + best_new)
+        print(f"{num_sections:>9} {len(page) / 1024:>7.0f} {best_soup * 1000:>10.1f} {best_previous * 1000:>14.1f} {best_new * 1000:>17.1f} "
+              f"{best_previous / best_new:>7.1f}x {whole_call:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Micro-benchmark: cost of the JavaScript AST walk on large synthetic scripts.
+
+Generates bundle-like scripts (functions, object-literal methods, classes,
+nested callbacks and addEventListener calls) of growing size, parses each
+once with esprima and times _extract_javascript_items on the tree. esprima's
+own parse time is reported alongside for scale. With the table-driven,
+explicit-stack walker the walk should stay a small, linear share of the total.
+
+Usage: python benchmarks/bench_js_walk.py [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import context_core  # noqa: E402
+
+
+def make_script(num_blocks):
+    """Builds a synthetic script out of num_blocks repeated bundle-style sections."""
+    parts = []
+    for b in range(num_blocks):
+        parts.append(
+            f"function handler{b}(event) {{\n"
+            f"    var items = [1, 2, 3].map(function (x) {{ return x * {b}; }});\n"
+            f"    for (var i = 0; i < items.length; i++) {{ if (items[i] > {b}) {{ console.log(items[i]); }} }}\n"
+            f"    return items;\n"
+            f"}}\n"
+            f"var module{b} = {{\n"
+            f"    init: function () {{ this.ready = true; }},\n"
+            f"    render: (data) => `<li>${{data.name}}</li>`,\n"
+            f"    nested: {{ depth: {{ value: {b}, check: function () {{ return this.value > 0 ? 'yes' : 'no'; }} }} }}\n"
+            f"}};\n"
+            f"class Widget{b} extends Base {{\n"
+            f"    constructor(el) {{ super(el); this.el = el; }}\n"
+            f"    bind() {{ this.el.addEventListener('click', (e) => {{ try {{ handler{b}(e); }} catch (err) {{ throw err; }} }}); }}\n"
+            f"}}\n"
+            f"document.getElementById('btn{b}').addEventListener('keyup', handler{b});\n"
+        )
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions per size (best is reported).")
+    args = parser.parse_args()
+
+    if not context_core.JS_PARSING_AVAILABLE:
+        sys.exit("esprima is not installed; nothing to benchmark.")
+    esprima = context_core.esprima
+
+    print(f"{'blocks':>7} {'lines':>7} {'items':>7} {'parse (ms)':>11} {'walk (ms)':>10} {'walk us/line':>13}")
+    for num_blocks in (10, 100, 500, 2000):
+        source = make_script(num_blocks)
+        line_count = source.count("\n")
+        start = time.perf_counter()
+        tree = esprima.parseScript(source, {"loc": True, "range": True, "comment": False, "tokens": False})
+        parse_time = time.perf_counter() - start
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            items = context_core._extract_javascript_items(tree, source)
+            best = min(best, time.perf_counter() - start)
+        item_count = len(items["functions"]) + len(items["event_listeners"])
+        print(f"{num_blocks:>7} {line_count:>7} {item_count:>7} {parse_time * 1000:>11.1f} {best * 1000:>10.1f} {best * 1e6 / line_count:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Micro-benchmark: reading one file's entry from the JSON document and from sharded NDJSON.
+
+Generates a tree of small Python modules, writes it as the single JSON
+document and as NDJSON split over --shards files with its byte-offset
+index, then reads a few entries back both ways: json.load() of the whole
+document, against load_ndjson_index() plus read_ndjson_entry(), which
+seeks to the one record. Peak memory is measured with tracemalloc. The
+NDJSON reader should need a fraction of the document's memory, since it
+only holds the index and the record it reads.
+
+Usage: python benchmarks/bench_ndjson.py [--files N] [--shards N] [--reads N]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import build_code_json  # noqa: E402
+
+
+def write_module(root, index, files_per_dir=100):
+    package = os.path.join(root, f"pkg{index // files_per_dir}")
+    os.makedirs(package, exist_ok=True)
+    with open(os.path.join(package, f"mod{index}.py"), "w", encoding="utf-8") as f:
+        f.write(f'"""Module {index}."""\n\n\ndef first_{index}(a, b=1):\n    """Adds."""\n    return a + b\n\n\n'
+                f"class Thing{index}:\n    def method(self):\n        return {index}\n" + "# padding\n" * 40)
+
+
+def measure(func):
+    """Returns (seconds, peak traced bytes, result) of one call."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=20000, help="Number of modules in the tree.")
+    parser.add_argument("--shards", type=int, default=8, help="NDJSON shards.")
+    parser.add_argument("--reads", type=int, default=5, help="Entries read back.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        root = os.path.join(work_dir, "tree")
+        for i in range(args.files):
+            write_module(root, i)
+        document = os.path.join(work_dir, "context.json")
+        ndjson = os.path.join(work_dir, "context.ndjson")
+        with contextlib.redirect_stdout(io.StringIO()): # The builders' summaries
+            build_code_json.build_project_structure_json(root, document)
+            build_code_json.build_project_structure_json(root, ndjson, ndjson=True, shards=args.shards)
+        with open(document, encoding="utf-8") as f:
+            paths = random.Random(0).sample(sorted(json.load(f)["files"]), args.reads)
+
+        def from_document():
+            with open(document, encoding="utf-8") as f:
+                files = json.load(f)["files"]
+            return [files[path] for path in paths]
+
+        def from_ndjson():
+            index = build_code_json.load_ndjson_index(build_code_json.ndjson_index_filename(ndjson))
+            return [build_code_json.read_ndjson_entry(index, path) for path in paths]
+
+        shard_bytes = sum(os.path.getsize(name) for name in build_code_json.ndjson_shard_filenames(ndjson, args.shards))
+        print(f"{args.files} files: document {os.path.getsize(document) / 1e6:.1f} MB; NDJSON {shard_bytes / 1e6:.1f} MB in {args.shards} shards, "
+              f"index {os.path.getsize(build_code_json.ndjson_index_filename(ndjson)) / 1e6:.1f} MB")
+        print(f"\nReading {args.reads} entries:")
+        print(f"{'reader':>24} {'seconds':>8} {'peak MB':>8}")
+        results = []
+        for label, func in (("json.load(document)", from_document), ("NDJSON index + seek", from_ndjson)):
+            seconds, peak, entries = measure(func)
+            results.append(entries)
+            print(f"{label:>24} {seconds:>8.3f} {peak / 1e6:>8.1f}")
+        print(f"\nSame entries: {results[0] == results[1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Micro-benchmark: writing the database and the JSON document in one run.
+
+Generates a tree of small Python, CSS and JavaScript files, then produces
+both artifacts twice: with two builds, build_code_db.py and then
+build_code_json.py, each walking and parsing the tree on its own, and with
+one build_code_db.py build that also writes the JSON through a
+build_code_json.JsonSink (what --json does). Reading and parsing dominate,
+so the combined run should take well under the two builds together.
+
+Usage: python benchmarks/bench_outputs.py [--repeat N] [--files N] [--jobs N]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import build_code_db  # noqa: E402
+import build_code_json  # noqa: E402
+
+
+def write_module(root, index, files_per_dir=100):
+    package = os.path.join(root, f"pkg{index // files_per_dir}")
+    os.makedirs(package, exist_ok=True)
+    with open(os.path.join(package, f"mod{index}.py"), "w", encoding="utf-8") as f:
+        f.write(f'"""Module {index}."""\nimport os\n\n\ndef first_{index}(a, b=1):\n    """Adds."""\n    return a + b\n\n\n'
+                f"class Thing{index}:\n    def method(self):\n        return os.sep\n")
+    if index % 10 == 0:
+        with open(os.path.join(package, f"style{index}.css"), "w", encoding="utf-8") as f:
+            f.write(f".c{index} {{ color: red; }}\n@media print {{ .c{index} {{ display: none; }} }}\n")
+        with open(os.path.join(package, f"app{index}.js"), "w", encoding="utf-8") as f:
+            f.write(f"export function run{index}() {{ return {index}; }}\nclass W{index} {{ go() {{}} }}\n")
+
+
+def separate(root, work_dir, jobs):
+    build_code_db.build_project_database(root, os.path.join(work_dir, "separate.db"), jobs=jobs, bulk=True)
+    build_code_json.build_project_structure_json(root, os.path.join(work_dir, "separate.json"), jobs=jobs)
+
+
+def combined(root, work_dir, jobs):
+    json_sink = build_code_json.JsonSink(os.path.join(work_dir, "combined.json"))
+    build_code_db.build_project_database(root, os.path.join(work_dir, "combined.db"), jobs=jobs, bulk=True, extra_sinks=[json_sink])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions per mode (best is reported).")
+    parser.add_argument("--files", type=int, default=10000, help="Number of Python modules in the tree.")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes used to read and parse files.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        root = os.path.join(work_dir, "tree")
+        for i in range(args.files):
+            write_module(root, i)
+        print(f"{'mode':>10} {'seconds':>8}")
+        results = {}
+        for label, func in (("separate", separate), ("combined", combined)):
+            best = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()): # The builders' summaries
+                    func(root, work_dir, args.jobs)
+                best = min(best, time.perf_counter() - start)
+            results[label] = best
+            print(f"{label:>10} {best:>8.2f}")
+        with open(os.path.join(work_dir, "separate.json"), "rb") as f:
+            separate_size = len(f.read())
+        with open(os.path.join(work_dir, "combined.json"), "rb") as f:
+            combined_size = len(f.read())
+        print(f"\nCombined run: {results['combined'] / results['separate']:.2f}x the time of the two separate builds "
+              f"(JSON documents of {separate_size:,} and {combined_size:,} bytes).")
+
+
+if __name__ == "__main__":
+    main()
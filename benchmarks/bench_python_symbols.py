@@ -0,0 +1,116 @@
+"""
+Micro-benchmark: the single-pass symbol collector against the top-level-only pass.
+
+Times python_symbols.PythonSymbolCollector, which finds imports, classes and
+functions at any depth, against a copy of the loop it replaced, which only
+looked at the module's top-level statements and the methods directly in
+top-level classes and formatted imports with ast.unparse(). Both run on the
+same parsed tree and SourceLines table (ast.parse() is timed separately), on
+the largest modules given, by default this repository's and the standard
+library's. The collector should cost no more than the top-level pass even
+though it also handles nested definitions.
+
+Usage: python benchmarks/bench_python_symbols.py [--repeat N] [--count N] [PATH ...]
+"""
+
+import argparse
+import ast
+import gc
+import glob
+import os
+import sys
+import sysconfig
+import textwrap
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import python_symbols  # noqa: E402
+from python_symbols import get_docstring, get_signature, get_source_segment  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def top_level_pass(tree, content, source_lines):
+    """The previous extraction: top-level statements only, imports via ast.unparse()."""
+    imports, functions, classes = [], {}, {}
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.append(ast.unparse(node).strip())
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            source_seg = get_source_segment(content, node, source_lines)
+            functions[node.name] = {
+                "type": "function", "name": node.name, "signature": get_signature(node), "docstring": get_docstring(node),
+                "source_code": textwrap.dedent(source_seg) if source_seg else None,
+                "start_lineno": node.lineno, "end_lineno": node.end_lineno,
+            }
+        elif isinstance(node, ast.ClassDef):
+            source_seg = get_source_segment(content, node, source_lines)
+            class_data = {
+                "type": "class", "name": node.name, "docstring": get_docstring(node), "methods": {},
+                "source_code": textwrap.dedent(source_seg) if source_seg else None,
+                "start_lineno": node.lineno, "end_lineno": node.end_lineno,
+            }
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    method_seg = get_source_segment(content, item, source_lines)
+                    class_data["methods"][item.name] = {
+                        "type": "method", "name": item.name, "signature": get_signature(item), "docstring": get_docstring(item),
+                        "source_code": textwrap.dedent(method_seg) if method_seg else None,
+                        "start_lineno": item.lineno, "end_lineno": item.end_lineno,
+                    }
+            classes[node.name] = class_data
+    return imports, functions, classes
+
+
+def collector_pass(tree, content, source_lines):
+    collector = python_symbols.PythonSymbolCollector(content, source_lines)
+    collector.visit(tree)
+    return collector.imports, collector.functions, collector.classes
+
+
+def symbol_count(functions, classes):
+    return len(functions) + len(classes) + sum(len(c["methods"]) for c in classes.values())
+
+
+def best_time(repeat, func, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=20, help="Timing repetitions per module (best is reported).")
+    parser.add_argument("--count", type=int, default=12, help="Number of largest modules to time.")
+    parser.add_argument("paths", nargs="*", help="Python files to choose from (default: this repository and the standard library).")
+    args = parser.parse_args()
+
+    paths = args.paths or (glob.glob(os.path.join(REPO_DIR, "*.py")) + glob.glob(os.path.join(sysconfig.get_paths()["stdlib"], "*.py")))
+    paths = sorted(paths, key=os.path.getsize, reverse=True)[:args.count]
+
+    gc.disable() # Collections triggered by the parse trees would land in random timings
+    print(f"{'module':>24} {'lines':>6} {'parse':>7} {'top-level pass':>21} {'collector':>21}")
+    print(f"{'':>24} {'':>6} {'(ms)':>7} {'(ms)':>9} {'symbols':>11} {'(ms)':>9} {'symbols':>11}")
+    totals = [0.0, 0.0]
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            content = f.read()
+        parse_seconds = best_time(args.repeat, ast.parse, content)
+        tree = ast.parse(content)
+        source_lines = python_symbols.SourceLines(content)
+        row = []
+        for index, func in enumerate((top_level_pass, collector_pass)):
+            seconds = best_time(args.repeat, func, tree, content, source_lines)
+            _, functions, classes = func(tree, content, source_lines)
+            totals[index] += seconds
+            row.append(f"{seconds * 1000:>9.2f} {symbol_count(functions, classes):>11}")
+        print(f"{os.path.basename(path):>24} {content.count(chr(10)):>6} {parse_seconds * 1000:>7.2f} {' '.join(row)}")
+    gc.enable()
+    print(f"\nTotal: top-level pass {totals[0] * 1000:.1f} ms, collector {totals[1] * 1000:.1f} ms ({totals[1] / totals[0]:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
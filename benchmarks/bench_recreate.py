@@ -0,0 +1,56 @@
+"""
+Micro-benchmark: recreating a large project tree from its context database.
+
+Generates a tree of small Python modules, builds it with zlib compression,
+then recreates it with recreate_structure.py from one thread and from a
+pool, and once more with --skip-unchanged over the populated output, which
+reads and hashes files instead of rewriting them (their mtimes are kept).
+
+Usage: python benchmarks/bench_recreate.py [--files N] [--threads N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import build_code_db  # noqa: E402
+import recreate_structure  # noqa: E402
+
+
+def write_module(root, index, files_per_dir=100):
+    package = os.path.join(root, f"pkg{index // files_per_dir}")
+    os.makedirs(package, exist_ok=True)
+    with open(os.path.join(package, f"mod{index}.py"), "w", encoding="utf-8") as f:
+        f.write(f"def first_{index}():\n    return {index}\n\n\nclass Thing{index}:\n    def method(self):\n        return {index}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=100000, help="Number of modules in the tree.")
+    parser.add_argument("--threads", type=int, default=recreate_structure.DEFAULT_THREADS, help="Writer threads of the pooled runs.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        root = os.path.join(work_dir, "tree")
+        db_path = os.path.join(work_dir, "context.db")
+        for i in range(args.files):
+            write_module(root, i)
+        build_code_db.build_project_database(root, db_path, bulk=True, compress="zlib", verbose=False)
+
+        print(f"\nRecreating {args.files} files:")
+        print(f"{'run':>28} {'seconds':>8}")
+        runs = (("1 thread", "single", 1, False),
+                (f"{args.threads} threads", "pooled", args.threads, False),
+                (f"{args.threads} threads, unchanged", "pooled", args.threads, True))
+        for label, output_name, threads, skip_unchanged in runs:
+            start = time.perf_counter()
+            counts = recreate_structure.recreate_structure(db_path, os.path.join(work_dir, output_name),
+                                                           threads=threads, skip_unchanged=skip_unchanged)
+            print(f"{label:>28} {time.perf_counter() - start:>8.2f}  ({counts['written']} written, {counts['unchanged']} unchanged)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Micro-benchmark: building one database per commit of a history.
+
+Generates a git repository whose commits each modify a few of its Python
+modules, then builds a database for every commit twice: by checking each
+commit out and scanning the working tree, and with --rev, which lists each
+tree with `git ls-tree`, streams blobs through one `git cat-file --batch`
+process and reuses the results of files the previous commit already had.
+The --rev builds should cost roughly what each commit's diff does rather
+than what the whole tree does.
+
+Usage: python benchmarks/bench_revisions.py [--commits N] [--files N] [--changes N]
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import build_code_db  # noqa: E402
+
+GIT_IDENTITY = ["-c", "user.name=bench", "-c", "user.email=bench@example.com"]
+
+
+def git(repo, *args):
+    return subprocess.run(["git", "-C", repo, *GIT_IDENTITY, *args], check=True, stdout=subprocess.PIPE).stdout
+
+
+def write_module(repo, index, version):
+    """Writes a module with a few functions and a class; version changes one function body."""
+    package = os.path.join(repo, "src", f"pkg{index // 50}")
+    os.makedirs(package, exist_ok=True)
+    with open(os.path.join(package, f"mod{index}.py"), "w", encoding="utf-8") as f:
+        f.write(f'"""Module {index}."""\nimport os\n\n')
+        for j in range(10):
+            f.write(f"def func_{j}(a, b=2):\n    \"\"\"Function {j}.\"\"\"\n    return a + b * {version if j == 0 else j}\n\n")
+        f.write(f"class Thing{index}:\n    def method(self):\n        return os.sep\n")
+
+
+def make_history(repo, commits, files, changes):
+    """Creates the repository: one commit with every file, then commits that each rewrite `changes` files."""
+    git(repo, "init", "-q")
+    for i in range(files):
+        write_module(repo, i, 0)
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", "initial")
+    rng = random.Random(0)
+    for version in range(1, commits):
+        for i in rng.sample(range(files), changes):
+            write_module(repo, i, version)
+        git(repo, "commit", "-q", "-a", "-m", f"change {version}")
+    return git(repo, "rev-list", "--reverse", "HEAD").decode("ascii").split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--commits", type=int, default=30, help="Number of commits in the history.")
+    parser.add_argument("--files", type=int, default=500, help="Number of modules in the tree.")
+    parser.add_argument("--changes", type=int, default=5, help="Modules rewritten by each commit.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        repo = os.path.join(work_dir, "repo")
+        os.makedirs(repo)
+        commits = make_history(repo, args.commits, args.files, args.changes)
+        output_dir = os.path.join(work_dir, "out")
+        os.makedirs(output_dir)
+
+        start = time.perf_counter()
+        for commit in commits:
+            git(repo, "checkout", "-q", commit)
+            build_code_db.build_project_database(repo, os.path.join(output_dir, f"checkout-{commit[:12]}.db"), verbose=False)
+        checkout_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        build_code_db.build_revision_databases(repo, commits, os.path.join(output_dir, "rev-{commit}.db"))
+        rev_seconds = time.perf_counter() - start
+
+    print(f"\n{len(commits)} commits of {args.files} modules, {args.changes} rewritten per commit:")
+    print(f"{'mode':>10} {'total (s)':>10} {'per commit (ms)':>16}")
+    for mode, seconds in (("checkout", checkout_seconds), ("--rev", rev_seconds)):
+        print(f"{mode:>10} {seconds:>10.2f} {seconds / len(commits) * 1000:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
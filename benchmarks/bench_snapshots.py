@@ -0,0 +1,75 @@
+"""
+Micro-benchmark: diffing two snapshots of a large project.
+
+Generates a tree of small Python modules, builds it with --snapshot, rewrites
+a fraction of the modules, adds and deletes a few, updates the database
+incrementally with a second snapshot, then times context_snapshots'
+diff between the two. Unchanged files are compared by content reference
+only, so the diff should stay well under a second at 100k files.
+
+Usage: python benchmarks/bench_snapshots.py [--repeat N] [--files N] [--changed-percent P]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import build_code_db  # noqa: E402
+import content_codec  # noqa: E402
+import context_snapshots  # noqa: E402
+
+
+def write_module(root, index, version, files_per_dir=100):
+    package = os.path.join(root, f"pkg{index // files_per_dir}")
+    os.makedirs(package, exist_ok=True)
+    with open(os.path.join(package, f"mod{index}.py"), "w", encoding="utf-8") as f:
+        f.write(f"def first_{index}():\n    return {version}\n\n\nclass Thing{index}:\n    def method(self):\n        return {index}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions of the diff (best is reported).")
+    parser.add_argument("--files", type=int, default=100000, help="Number of modules in the tree.")
+    parser.add_argument("--changed-percent", type=float, default=1.0, help="Share of modules rewritten between the snapshots.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        root = os.path.join(work_dir, "tree")
+        db_path = os.path.join(work_dir, "context.db")
+        for i in range(args.files):
+            write_module(root, i, 0)
+        start = time.perf_counter()
+        build_code_db.build_project_database(root, db_path, bulk=True, snapshot="before", verbose=False)
+        print(f"Initial build and snapshot of {args.files} files: {time.perf_counter() - start:.1f}s")
+
+        rng = random.Random(0)
+        changed = rng.sample(range(args.files), max(1, int(args.files * args.changed_percent / 100)))
+        for i in changed:
+            write_module(root, i, 1)
+        for i in range(args.files, args.files + 10):
+            write_module(root, i, 0)
+        for i in range(10):
+            os.remove(os.path.join(root, "pkg0", f"mod{i}.py"))
+        start = time.perf_counter()
+        build_code_db.build_project_database(root, db_path, incremental=True, snapshot="after", verbose=False)
+        print(f"Incremental update and snapshot: {time.perf_counter() - start:.1f}s")
+
+        conn = content_codec.connect(db_path)
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = context_snapshots.diff_snapshots(conn, "before", "after")
+            best = min(best, time.perf_counter() - start)
+        conn.close()
+        files, symbols = result["files"], result["symbols"]
+        print(f"Diff: {len(files['added'])} files added, {len(files['removed'])} removed, {len(files['changed'])} changed; "
+              f"{len(symbols['added'])} symbols added, {len(symbols['removed'])} removed, {len(symbols['changed'])} changed")
+        print(f"Best of {args.repeat}: {best * 1000:.1f} ms (database {os.path.getsize(db_path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Micro-benchmark: per-file cost of parse_python_file versus module size.
+
+Generates synthetic modules with a growing number of decorated methods and
+reports the time per source line. With the shared SourceLines table the
+microseconds-per-line figure should stay roughly flat as modules grow
+(linear cost); the old per-symbol splitlines approach grew with module size.
+
+Usage: python benchmarks/bench_source_segments.py [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import python_symbols  # noqa: E402
+
+
+def make_module(num_classes, methods_per_class=10):
+    """Builds a synthetic module with decorated classes and methods."""
+    parts = ['"""Synthetic module."""\nimport os\n\n']
+    for c in range(num_classes):
+        parts.append(f"@register\nclass Generated{c}(object):\n    \"\"\"Class {c}.\"\"\"\n\n")
+        for m in range(methods_per_class):
+            parts.append(
+                f"    @property\n    def method_{m}(self, value: int = {m}) -> int:\n"
+                f"        \"\"\"Method {m}.\"\"\"\n        total = value * {m}\n        return total\n\n"
+            )
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions per size (best is reported).")
+    args = parser.parse_args()
+
+    print(f"{'classes':>8} {'lines':>8} {'symbols':>8} {'best (ms)':>10} {'us/line':>8}")
+    for num_classes in (10, 30, 100, 300):
+        source = make_module(num_classes)
+        line_count = source.count("\n")
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = python_symbols.parse_python_file("synthetic.py", source)
+            best = min(best, time.perf_counter() - start)
+        symbols = len(result["classes"]) + sum(len(c["methods"]) for c in result["classes"].values())
+        print(f"{num_classes:>8} {line_count:>8} {symbols:>8} {best * 1000:>10.1f} {best * 1e6 / line_count:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark: walking a tree dominated by git-ignored build output.
+
+Generates a small source tree next to a large generated directory that the
+project's .gitignore excludes, then times the walk with the ignore rules
+applied (the generated directory is pruned before os.walk enters it) and
+with --no-gitignore behaviour (every generated file is listed and
+classified). The pruned walk should cost about the same however large the
+ignored output grows.
+
+Usage: python benchmarks/bench_walk.py [--repeat N] [--files N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import context_core  # noqa: E402
+import ignore_rules  # noqa: E402
+
+
+def make_tree(root, generated_files, source_files=100, files_per_dir=50):
+    """Writes source_files small modules and generated_files ignored artifacts under root."""
+    with open(os.path.join(root, ".gitignore"), "w", encoding="utf-8") as f:
+        f.write("# Build output\n/target/\n*.log\n")
+    for i in range(source_files):
+        package = os.path.join(root, "src", f"pkg{i // files_per_dir}")
+        os.makedirs(package, exist_ok=True)
+        with open(os.path.join(package, f"mod{i}.py"), "w", encoding="utf-8") as f:
+            f.write(f"def f{i}():\n    return {i}\n")
+    for i in range(generated_files):
+        out_dir = os.path.join(root, "target", "debug", f"deps{i // files_per_dir}")
+        os.makedirs(out_dir, exist_ok=True)
+        open(os.path.join(out_dir, f"artifact{i}.js"), "w").close()
+
+
+def walk(root, use_gitignore):
+    """Walks and classifies the tree the way the builders do; returns the number of paths listed."""
+    path_filter = ignore_rules.PathFilter(
+        root, context_core.EXCLUDED_DIRS, context_core.EXCLUDED_FILENAMES, context_core.BINARY_EXTENSIONS,
+        context_core.IGNORED_TEXT_EXTENSIONS, context_core.MANAGED_EXTENSIONS, context_core.MANAGED_FILENAMES,
+        context_core.INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES, use_gitignore=use_gitignore)
+    listed = 0
+    for subdir, dirs, files_in_dir in os.walk(root):
+        rules = path_filter.enter_directory(os.path.relpath(subdir, root).replace("\\", "/"), files_in_dir)
+        dirs[:] = [d for d in dirs if rules.classify_dir(d) is None]
+        for file_name in files_in_dir:
+            if rules.classify_file(file_name)[0] != ignore_rules.IGNORED:
+                listed += 1
+    return listed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions per size (best is reported).")
+    parser.add_argument("--files", type=int, default=20000, help="Largest number of ignored generated files.")
+    args = parser.parse_args()
+
+    print(f"{'ignored':>8} {'mode':>12} {'listed':>8} {'best (ms)':>10}")
+    for generated_files in (args.files // 100, args.files // 10, args.files):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, generated_files)
+            for mode, use_gitignore in (("gitignore", True), ("no-gitignore", False)):
+                best = float("inf")
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    listed = walk(root, use_gitignore)
+                    best = min(best, time.perf_counter() - start)
+                print(f"{generated_files:>8} {mode:>12} {listed:>8} {best * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
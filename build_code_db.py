@@ -2,139 +2,42 @@
 
 import os
 import json
-import sys
-import ast
-import textwrap
 from datetime import datetime
-import re # For basic CSS parsing
-import traceback # For detailed error logging
 import sqlite3 ### DB MOD ###: Import the SQLite3 library
-
-# Attempt to import HTML/CSS parsers, print warnings if not available
-try:
-    from bs4 import BeautifulSoup
-    from bs4 import Comment # Needed to exclude comments
-    import lxml # BeautifulSoup backend for speed
-    HTML_PARSING_AVAILABLE = True
-except ImportError:
-    print("Warning: beautifulsoup4 or lxml not found. HTML parsing will be skipped.")
-    print("Install with: pip install beautifulsoup4 lxml")
-    HTML_PARSING_AVAILABLE = False
-
-# Attempt to import JS parser
-try:
-    import esprima
-    JS_PARSING_AVAILABLE = True
-except ImportError:
-    print("Warning: esprima library not found. JavaScript parsing within <script> tags will be skipped.")
-    print("Install with: pip install esprima")
-    JS_PARSING_AVAILABLE = False
-
-
-# --- Configuration: Define File and Directory Handling ---
-# These lists and sets control which files and directories are included,
-# excluded, or handled specially during the project scan.
-# Place these prominently at the top so a new user can easily find and modify them.
-
-# Define directories to exclude from traversal (os.walk will not enter these).
-# This is suitable for dependency folders, build outputs, IDE configs, etc.
-# These directories (and their contents) will NOT appear in the 'directory_tree'.
-EXCLUDED_DIRS = {
-    '__pycache__', '.git', '.svn', '.hg', # Version control and cache
-    'node_modules', 'venv', '.venv', '__pypackages__', 'vendor', # Dependency directories
-    'dist', 'build', # Build/distribution directories
-    '.idea', '.vscode', '__pydevd_remote_debug_server__', # IDE specific directories
-    'chat_sessions', 'chat_logs',# Add other directories here as needed (e.g., 'logs', 'tmp', 'instance_data')
-}
-
-# Define specific filenames to exclude regardless of the directory they are in.
-# (These files will be listed in the directory_tree but WILL NOT have an entry
-# in the 'files' dictionary, nor will their content be read).
-EXCLUDED_FILENAMES = {
-    os.path.basename(__file__), # Exclude this script itself by name
-    '.env', # Explicitly exclude environment variable files
-    'build_code_json.py', 'create_context.py', 'recreate_structure.py',# Add other specific filenames here (e.g., 'package-lock.json' if not managed by INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES)
-    'htmx.min.js' # Example, could also be handled by MANAGED_EXTENSIONS
-}
-
-# Define file extensions for files that are likely binary or sensitive.
-# (These files will be listed in the directory_tree but WILL NOT have an entry
-# in the 'files' dictionary, nor will their content be read).
-BINARY_EXTENSIONS = {
-    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg', '.ico', # Images
-    '.mp4', '.mp3', '.avi', '.mov', '.webm', # Media
-    '.pdf', '.docx', '.xlsx', '.pptx', # Documents
-    '.bin', '.exe', '.dll', '.so', '.dylib', '.o', '.a', '.lib', '.class', '.pyc', '.pyd', # Binaries/Compiled
-    '.zip', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.rar', '.7z', # Archives
-    '.sqlite', '.db', '.sql', # Databases/SQL dumps (often binary or large text dumps)
-    '.pem', '.key', '.cer', '.crt', '.pfx', '.p12', # Keys/Certificates
-    '.lock', '.tmp', '.bak', '.swp', # Lock/Temp/Backup/Swap files
-    '.DS_Store', '.env.enc', # macOS specific / Encrypted files
-    # Add other binary or sensitive extensions here
-}
-
-# Define file extensions for text files whose *content* should generally be ignored,
-# preventing them from having an entry in the 'files' dictionary by default.
-# Useful for very large logs, generated code/data, or non-critical configuration files
-# whose content isn't needed for understanding the core project code logic.
-# Use INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES to override this for specific important files.
-IGNORED_TEXT_EXTENSIONS = {
-     '.json', '.jsonl', # Data/Log files (unless specifically in INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES)
-     '.log', '.csv', '.tsv', # Data/Log files
-     '.txt', # Generic text files (unless specifically in INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES)
-     '.md', '.markdown', # Markdown (consider parsing if structure is needed, or add to INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES)
-     '.yml', '.yaml', '.toml', '.ini', # Configuration files (consider parsing or adding to INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES)
-     '.gitignore', '.dockerignore', '.eslintignore', # Ignore rules files
-     '.editorconfig', '.gitattributes', # Config files
-     # Dependency manifests - use INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES for key ones like requirements.txt or package.json
-     'package-lock.json', 'yarn.lock',
-     'Gemfile.lock', 'pom.xml', 'build.gradle', # Build/dependency definition files
-     # Add other extensions here
-}
-
-# Define specific filenames whose *content* SHOULD be included in the 'files' dictionary,
-# even if their extension is listed in IGNORED_TEXT_EXTENSIONS.
-# This is the "allow list" for content inclusion of otherwise ignored text file types.
-INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES = {
-    'requirements.txt',
-    'package.json',
-    'Gemfile',
-    # Add other specific project-critical config/text filenames here
-    # e.g., 'main_config.json', 'settings.ini'
-}
-
-
-# Define file extensions for files whose *content* should NOT be stored fully,
-# but which *should* still have an entry in the 'files' dictionary with metadata.
-# Useful for large static assets (like minified JS libraries, bundled CSS) that you want
-# the LLM to know exist, but whose source you don't need to manage or diff.
-# Their presence in the 'files' dict means they are 'acknowledged'.
-MANAGED_EXTENSIONS = {
-    '.min.js', '.bundle.js', '.css.map', '.js.map', # Example minified/bundled/map files
-    # Add other extensions here for files whose content should be omitted
-}
-
-# Define specific filenames that should be 'managed' regardless of extension.
-# (These files will have an entry in 'files' but with null content and metadata).
-MANAGED_FILENAMES = {
-    # Add specific filenames here if needed, e.g., 'large_asset.data'
-}
-
-
-# Define file extensions for files that should be read and parsed for structured information.
-# The full content of these files WILL be stored in the JSON, along with the parsed details.
-PARSEABLE_CODE_EXTENSIONS = {
-    '.py',
-    '.html', '.htm',
-    '.css'
-    # Add other code/markup language extensions here (e.g., '.js', '.jsx', '.ts', '.tsx', '.vue')
-    # Note: If a .json file is in INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES and you want to parse its structure,
-    # you could add '.json' here and create a simple parse_json_file function.
-}
+import argparse
+import tempfile
+import time
+
+import context_core # The walk, the parsers and the configuration sets, shared with build_code_json.py
+import parse_cache # Shared on-disk cache of parser output
+import context_search # Optional FTS5 search index
+import source_spans # Offset-based symbol sources
+import content_codec # Optional compression of file contents
+import ignore_rules # .gitignore-aware path filtering for the walk
+import file_watcher # inotify/polling change notification for --watch
+import git_source # Trees and blobs of a git revision for --rev
+import context_snapshots # Named snapshots kept across builds, and diffs between them
+import build_code_json # The legacy JSON document, written in the same run with --json
+
+# The configuration sets that decide which files are walked, read and parsed
+# (EXCLUDED_DIRS, BINARY_EXTENSIONS, MANAGED_EXTENSIONS, ...) and the parsers
+# themselves live in context_core.py, shared with build_code_json.py.
+
+# Bump this whenever the schema or the parsed output changes, so that an
+# incremental run against a database written by an older version falls back
+# to a full rebuild instead of mixing stale and fresh rows.
+SCHEMA_VERSION = 7
 
 ### DB MOD ###: New function to create the database schema
 def create_schema(cursor):
     """Creates the necessary tables and indexes for the project context database."""
+    create_tables(cursor)
+    create_indexes(cursor)
+    print("Database schema created and indexed.")
+
+
+def create_tables(cursor):
+    """Creates the project context tables without their secondary indexes."""
     # Metadata and Directory Tree
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS metadata (
@@ -143,8 +46,11 @@ def create_schema(cursor):
     )''')
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS directory_tree (
-        path TEXT PRIMARY KEY
-    )''')
+        path TEXT PRIMARY KEY, -- Directories end in '/'
+        parent TEXT, -- Containing directory ('' at the top level, NULL for './')
+        is_dir INTEGER NOT NULL DEFAULT 0,
+        fingerprint TEXT -- Directories: Merkle hash of their listed children, see _directory_fingerprint()
+    ) WITHOUT ROWID''')
 
     # Core File Table
     cursor.execute('''
@@ -157,7 +63,10 @@ def create_schema(cursor):
         end_lineno INTEGER,
         message TEXT,
         error TEXT,
-        docstring TEXT
+        docstring TEXT,
+        size INTEGER, -- Fingerprint used by incremental rebuilds
+        mtime_ns INTEGER,
+        content_hash TEXT
     )''')
 
     # Python Specific Tables
@@ -173,23 +82,31 @@ def create_schema(cursor):
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         file_id INTEGER NOT NULL,
         name TEXT,
+        qualname TEXT, -- e.g. 'Outer.Inner' or 'func.<locals>.Helper'
+        parent TEXT, -- qualname of the enclosing class or function, NULL at module level
         docstring TEXT,
         source_code TEXT,
         start_lineno INTEGER,
         end_lineno INTEGER,
+        source_start INTEGER, -- Offsets into files.full_content when source_code is NULL (see source_spans.py)
+        source_end INTEGER,
         FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
     )''')
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS python_functions (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         file_id INTEGER NOT NULL,
-        class_id INTEGER, -- NULL for top-level functions
+        class_id INTEGER, -- Enclosing class for methods, NULL for other functions
         name TEXT,
+        qualname TEXT,
+        parent TEXT,
         signature TEXT,
         docstring TEXT,
         source_code TEXT,
         start_lineno INTEGER,
         end_lineno INTEGER,
+        source_start INTEGER,
+        source_end INTEGER,
         FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE,
         FOREIGN KEY (class_id) REFERENCES python_classes (id) ON DELETE CASCADE
     )''')
@@ -220,6 +137,9 @@ def create_schema(cursor):
         source_code TEXT,
         start_lineno INTEGER,
         end_lineno INTEGER,
+        source_start INTEGER,
+        source_end INTEGER,
+        at_rule_context TEXT, -- JSON list of enclosing at-rule preludes (e.g. "@media ..."), NULL at top level
         FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
     )''')
     cursor.execute('''
@@ -230,901 +150,912 @@ def create_schema(cursor):
         FOREIGN KEY (rule_id) REFERENCES css_rules (id) ON DELETE CASCADE
     )''')
 
-    # Create Indexes for performance
+    # JavaScript Specific Tables (standalone .js/.mjs files; inline scripts use js_parsed_items)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS js_classes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        name TEXT,
+        superclass TEXT,
+        source_code TEXT,
+        start_lineno INTEGER,
+        end_lineno INTEGER,
+        source_start INTEGER,
+        source_end INTEGER,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS js_functions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        class_id INTEGER, -- NULL unless the function is a class method
+        function_type TEXT, -- 'function_declaration', 'function_expression', 'arrow_function_expression'
+        name TEXT,
+        source_code TEXT,
+        start_lineno INTEGER,
+        end_lineno INTEGER,
+        source_start INTEGER,
+        source_end INTEGER,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE,
+        FOREIGN KEY (class_id) REFERENCES js_classes (id) ON DELETE CASCADE
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS js_imports (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        import_kind TEXT, -- 'import' or 'require'
+        module TEXT,
+        specifiers TEXT, -- JSON list of {"imported", "local"}
+        source_code TEXT,
+        start_lineno INTEGER,
+        end_lineno INTEGER,
+        source_start INTEGER,
+        source_end INTEGER,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS js_exports (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        export_kind TEXT, -- 'named', 'default' or 'all'
+        names TEXT, -- JSON list of exported names
+        module TEXT, -- Re-export source, if any
+        source_code TEXT,
+        start_lineno INTEGER,
+        end_lineno INTEGER,
+        source_start INTEGER,
+        source_end INTEGER,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS js_event_listeners (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        target TEXT,
+        event_type TEXT,
+        handler_name TEXT,
+        handler_type TEXT,
+        handler_source TEXT,
+        source_code TEXT,
+        start_lineno INTEGER,
+        end_lineno INTEGER,
+        source_start INTEGER,
+        source_end INTEGER,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    )''')
+
+    content_codec.create_tables(cursor)
+    create_source_views(cursor)
+
+
+# Columns of the tables whose rows may store their source as offsets into files.full_content.
+SOURCE_TABLE_COLUMNS = {
+    'python_classes': ['id', 'file_id', 'name', 'qualname', 'parent', 'docstring', 'source_code', 'start_lineno', 'end_lineno'],
+    'python_functions': ['id', 'file_id', 'class_id', 'name', 'qualname', 'parent', 'signature', 'docstring', 'source_code', 'start_lineno', 'end_lineno'],
+    'css_rules': ['id', 'file_id', 'source_code', 'start_lineno', 'end_lineno', 'at_rule_context'],
+    'js_classes': ['id', 'file_id', 'name', 'superclass', 'source_code', 'start_lineno', 'end_lineno'],
+    'js_functions': ['id', 'file_id', 'class_id', 'function_type', 'name', 'source_code', 'start_lineno', 'end_lineno'],
+    'js_imports': ['id', 'file_id', 'import_kind', 'module', 'specifiers', 'source_code', 'start_lineno', 'end_lineno'],
+    'js_exports': ['id', 'file_id', 'export_kind', 'names', 'module', 'source_code', 'start_lineno', 'end_lineno'],
+    'js_event_listeners': ['id', 'file_id', 'target', 'event_type', 'handler_name', 'handler_type', 'handler_source', 'source_code', 'start_lineno', 'end_lineno'],
+}
+
+
+def create_source_views(cursor, compressed=False):
+    """
+    Creates a <table>_expanded view for each table in SOURCE_TABLE_COLUMNS that
+    always has source_code filled in, whether the row stored the text itself
+    or only offsets into its file's content (builds with source_offsets=True),
+    plus files_expanded. With compressed=True the views decompress file
+    contents, and reading them needs content_codec's decompress() function.
+    """
+    content = 'decompress(f.full_content)' if compressed else 'f.full_content'
+    file_columns = ['id', 'path', 'type', f'{content} AS full_content', 'start_lineno', 'end_lineno', 'message', 'error', 'docstring', 'size', 'mtime_ns', 'content_hash']
+    cursor.execute("DROP VIEW IF EXISTS files_expanded")
+    cursor.execute(f"CREATE VIEW files_expanded AS SELECT {', '.join(c if ' AS ' in c else 'f.' + c for c in file_columns)} FROM files f")
+    for table, columns in SOURCE_TABLE_COLUMNS.items():
+        select_list = ', '.join(
+            source_spans.SOURCE_SQL.format(t='t', content=content) + ' AS source_code' if column == 'source_code' else f't.{column}'
+            for column in columns)
+        cursor.execute(f"DROP VIEW IF EXISTS {table}_expanded")
+        cursor.execute(f"CREATE VIEW {table}_expanded AS SELECT {select_list} FROM {table} t JOIN files f ON f.id = t.file_id")
+
+
+def create_indexes(cursor):
+    """
+    Creates the secondary indexes. Bulk builds call this once after loading,
+    which is much cheaper than maintaining the B-trees row by row.
+    """
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_path ON files (path)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_directory_tree_parent ON directory_tree (parent)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_py_classes_file_id ON python_classes (file_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_py_functions_file_id ON python_functions (file_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_html_elements_file_id ON html_elements (file_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_css_rules_file_id ON css_rules (file_id)')
-    print("Database schema created and indexed.")
-
-
-### DB MOD ###: New function to insert parsed data into the database
-def insert_file_data(cursor, file_details):
-    """Inserts the parsed file details dictionary into the database."""
-    if not file_details or not file_details.get('path'):
-        return
-
-    # 1. Insert into the main 'files' table
-    cursor.execute('''
-        INSERT INTO files (path, type, full_content, start_lineno, end_lineno, message, error, docstring)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        file_details.get('path'),
-        file_details.get('type'),
-        file_details.get('full_content'),
-        file_details.get('start_lineno'),
-        file_details.get('end_lineno'),
-        file_details.get('message'),
-        file_details.get('error'),
-        file_details.get('docstring')
-    ))
-    file_id = cursor.lastrowid
-
-    # 2. Insert data into type-specific tables
-    file_type = file_details.get('type')
-    if file_type == 'python':
-        for imp in file_details.get('imports', []):
-            cursor.execute('INSERT INTO python_imports (file_id, import_statement) VALUES (?, ?)', (file_id, imp))
-        for func_name, func_data in file_details.get('functions', {}).items():
-            cursor.execute('''
-                INSERT INTO python_functions (file_id, class_id, name, signature, docstring, source_code, start_lineno, end_lineno)
-                VALUES (?, NULL, ?, ?, ?, ?, ?, ?)
-            ''', (file_id, func_data['name'], func_data['signature'], func_data['docstring'], func_data['source_code'], func_data['start_lineno'], func_data['end_lineno']))
-        for class_name, class_data in file_details.get('classes', {}).items():
-            cursor.execute('''
-                INSERT INTO python_classes (file_id, name, docstring, source_code, start_lineno, end_lineno)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (file_id, class_data['name'], class_data['docstring'], class_data['source_code'], class_data['start_lineno'], class_data['end_lineno']))
-            class_id = cursor.lastrowid
-            for meth_name, meth_data in class_data.get('methods', {}).items():
-                cursor.execute('''
-                    INSERT INTO python_functions (file_id, class_id, name, signature, docstring, source_code, start_lineno, end_lineno)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (file_id, class_id, meth_data['name'], meth_data['signature'], meth_data['docstring'], meth_data['source_code'], meth_data['start_lineno'], meth_data['end_lineno']))
-
-    elif file_type == 'html':
-        # These keys in file_details hold lists of dictionaries
-        html_element_types = ['forms', 'links', 'images', 'htmx_elements', 'scripts', 'inline_styles', 'body_structure_preview']
-        for plural_type in html_element_types:
-            singular_type = plural_type[:-1] if plural_type.endswith('s') else plural_type
-            for item_data in file_details.get(plural_type, []):
-                # Special handling for scripts with nested parsed_js
-                if singular_type == 'script' and 'parsed_js' in item_data and item_data['parsed_js']:
-                    # Make a copy to avoid modifying the original dict if it's used elsewhere
-                    item_data_copy = item_data.copy()
-                    parsed_js_data = item_data_copy.pop('parsed_js')
-                    
-                    # Insert the script element itself
-                    cursor.execute('INSERT INTO html_elements (file_id, element_type, data) VALUES (?, ?, ?)',
-                                   (file_id, singular_type, json.dumps(item_data_copy)))
-                    element_id = cursor.lastrowid
-
-                    # Insert the parsed JS items linked to the script element
-                    for js_func in parsed_js_data.get('functions', []):
-                        cursor.execute('INSERT INTO js_parsed_items (html_element_id, item_type, data) VALUES (?, ?, ?)',
-                                        (element_id, 'function', json.dumps(js_func)))
-                    for js_listener in parsed_js_data.get('event_listeners', []):
-                        cursor.execute('INSERT INTO js_parsed_items (html_element_id, item_type, data) VALUES (?, ?, ?)',
-                                        (element_id, 'event_listener', json.dumps(js_listener)))
-                else:
-                # For all other element types, just dump the data
-                    cursor.execute('INSERT INTO html_elements (file_id, element_type, data) VALUES (?, ?, ?)',
-                                (file_id, singular_type, json.dumps(item_data)))
-
-
-    elif file_type == 'css':
-        for rule_data in file_details.get('rules', []):
-            cursor.execute('INSERT INTO css_rules (file_id, source_code, start_lineno, end_lineno) VALUES (?, ?, ?, ?)',
-                           (file_id, rule_data['source_code'], rule_data['start_lineno'], rule_data['end_lineno']))
-            rule_id = cursor.lastrowid
-            for selector in rule_data.get('selectors', []):
-                cursor.execute('INSERT INTO css_selectors (rule_id, selector_text) VALUES (?, ?)', (rule_id, selector))
-
-# --- Helper Functions for Python AST Parsing ---
-# (Original functions are preserved without changes)
-
-def get_docstring(node):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_js_classes_file_id ON js_classes (file_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_js_functions_file_id ON js_functions (file_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_js_imports_file_id ON js_imports (file_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_js_exports_file_id ON js_exports (file_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_js_event_listeners_file_id ON js_event_listeners (file_id)')
+    # Parent keys of ON DELETE CASCADE: without them, replacing a file scans these tables once per deleted parent row.
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_py_functions_class_id ON python_functions (class_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_js_functions_class_id ON js_functions (class_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_css_selectors_rule_id ON css_selectors (rule_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_js_parsed_items_element_id ON js_parsed_items (html_element_id)')
+
+
+### DB MOD ###: Bulk loader used to insert parsed data into the database
+class BulkInserter:
+    """
+    Buffers rows per table and writes them with executemany.
+
+    Row ids for parent tables (files, python_classes, html_elements, css_rules, js_classes)
+    are assigned client-side, continuing from the table's AUTOINCREMENT sequence,
+    so child rows can reference their parents without a round trip for
+    cursor.lastrowid. Buffers are flushed in foreign-key order once
+    flush_threshold rows are pending, and always on flush(); committing is left
+    to the caller so a whole build stays in one transaction.
     """
-    Safely extracts the docstring from a Python AST node (FunctionDef, ClassDef, Module).
-
-    Args:
-        node: An AST node object.
 
-    Returns:
-        The docstring string, or None if no docstring is found or the node type is not applicable.
+    # Insert statements in parent-before-child order (foreign keys are enforced).
+    TABLE_SQL = {
+        'files': 'INSERT INTO files (id, path, type, full_content, start_lineno, end_lineno, message, error, docstring, size, mtime_ns, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        'python_imports': 'INSERT INTO python_imports (file_id, import_statement) VALUES (?, ?)',
+        'python_classes': 'INSERT INTO python_classes (id, file_id, name, qualname, parent, docstring, source_code, start_lineno, end_lineno, source_start, source_end) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        'python_functions': 'INSERT INTO python_functions (file_id, class_id, name, qualname, parent, signature, docstring, source_code, start_lineno, end_lineno, source_start, source_end) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        'html_elements': 'INSERT INTO html_elements (id, file_id, element_type, data) VALUES (?, ?, ?, ?)',
+        'js_parsed_items': 'INSERT INTO js_parsed_items (html_element_id, item_type, data) VALUES (?, ?, ?)',
+        'css_rules': 'INSERT INTO css_rules (id, file_id, source_code, start_lineno, end_lineno, at_rule_context, source_start, source_end) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        'css_selectors': 'INSERT INTO css_selectors (rule_id, selector_text) VALUES (?, ?)',
+        'js_classes': 'INSERT INTO js_classes (id, file_id, name, superclass, source_code, start_lineno, end_lineno, source_start, source_end) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        'js_functions': 'INSERT INTO js_functions (file_id, class_id, function_type, name, source_code, start_lineno, end_lineno, source_start, source_end) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        'js_imports': 'INSERT INTO js_imports (file_id, import_kind, module, specifiers, source_code, start_lineno, end_lineno, source_start, source_end) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        'js_exports': 'INSERT INTO js_exports (file_id, export_kind, names, module, source_code, start_lineno, end_lineno, source_start, source_end) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        'js_event_listeners': 'INSERT INTO js_event_listeners (file_id, target, event_type, handler_name, handler_type, handler_source, source_code, start_lineno, end_lineno, source_start, source_end) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        'directory_tree': 'INSERT OR REPLACE INTO directory_tree (path, parent, is_dir, fingerprint) VALUES (?, ?, ?, ?)',
+        'metadata': 'INSERT INTO metadata (key, value) VALUES (?, ?)',
+    }
+    ID_TABLES = ('files', 'python_classes', 'html_elements', 'css_rules', 'js_classes')
+
+    def __init__(self, cursor, flush_threshold=50000, content_codec=None):
+        self.cursor = cursor
+        self.content_codec = content_codec # Encodes files.full_content when set
+        self.flush_threshold = flush_threshold
+        self.rows = {table: [] for table in self.TABLE_SQL}
+        self.pending = 0
+        self.next_ids = {table: self._next_id(table) for table in self.ID_TABLES}
+
+    def _next_id(self, table):
+        """Returns the first id that AUTOINCREMENT would not hand out again for the table."""
+        max_id = self.cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+        seq = self.cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        return max(max_id, seq[0] if seq else 0) + 1
+
+    def _new_id(self, table):
+        row_id = self.next_ids[table]
+        self.next_ids[table] = row_id + 1
+        return row_id
+
+    def add(self, table, row):
+        """Queues a single row (a tuple matching TABLE_SQL[table]) for insertion."""
+        self.rows[table].append(row)
+        self.pending += 1
+        if self.pending >= self.flush_threshold:
+            self.flush()
+
+    def flush(self):
+        """Writes all buffered rows, parents before children."""
+        for table, sql in self.TABLE_SQL.items():
+            rows = self.rows[table]
+            if rows:
+                self.cursor.executemany(sql, rows)
+                rows.clear()
+        self.pending = 0
+
+    def add_file(self, file_details, fingerprint=None):
+        """
+        Queues the parsed file details dictionary and all of its type-specific rows.
+
+        fingerprint is an optional (size, mtime_ns, content_hash) tuple stored
+        alongside the file row so incremental rebuilds can detect changes.
+        Returns the id assigned to the file row, or None if nothing was queued.
+        """
+        if not file_details or not file_details.get('path'):
+            return None
+        size, mtime_ns, content_hash = fingerprint if fingerprint else (None, None, None)
+
+        # 1. The main 'files' row
+        file_id = self._new_id('files')
+        full_content = file_details.get('full_content')
+        if self.content_codec is not None:
+            full_content = self.content_codec.encode(full_content)
+        self.add('files', (
+            file_id,
+            file_details.get('path'),
+            file_details.get('type'),
+            full_content,
+            file_details.get('start_lineno'),
+            file_details.get('end_lineno'),
+            file_details.get('message'),
+            file_details.get('error'),
+            file_details.get('docstring'),
+            size,
+            mtime_ns,
+            content_hash
+        ))
+
+        # 2. Rows for the type-specific tables
+        file_type = file_details.get('type')
+        if file_type == 'python':
+            for imp in file_details.get('imports', []):
+                self.add('python_imports', (file_id, imp))
+            for func_name, func_data in file_details.get('functions', {}).items():
+                self.add('python_functions', (file_id, None, func_data['name'], func_data['qualname'], func_data['parent'], func_data['signature'], func_data['docstring'], func_data['source_code'], func_data['start_lineno'], func_data['end_lineno'], func_data.get('source_start'), func_data.get('source_end')))
+            for class_name, class_data in file_details.get('classes', {}).items():
+                class_id = self._new_id('python_classes')
+                self.add('python_classes', (class_id, file_id, class_data['name'], class_data['qualname'], class_data['parent'], class_data['docstring'], class_data['source_code'], class_data['start_lineno'], class_data['end_lineno'], class_data.get('source_start'), class_data.get('source_end')))
+                for meth_name, meth_data in class_data.get('methods', {}).items():
+                    self.add('python_functions', (file_id, class_id, meth_data['name'], meth_data['qualname'], meth_data['parent'], meth_data['signature'], meth_data['docstring'], meth_data['source_code'], meth_data['start_lineno'], meth_data['end_lineno'], meth_data.get('source_start'), meth_data.get('source_end')))
+
+        elif file_type == 'html':
+            # These keys in file_details hold lists of dictionaries
+            html_element_types = ['forms', 'links', 'images', 'htmx_elements', 'scripts', 'inline_styles', 'body_structure_preview']
+            for plural_type in html_element_types:
+                singular_type = plural_type[:-1] if plural_type.endswith('s') else plural_type
+                for item_data in file_details.get(plural_type, []):
+                    element_id = self._new_id('html_elements')
+                    # Special handling for scripts with nested parsed_js
+                    if singular_type == 'script' and 'parsed_js' in item_data and item_data['parsed_js']:
+                        # Make a copy to avoid modifying the original dict if it's used elsewhere
+                        item_data_copy = item_data.copy()
+                        parsed_js_data = item_data_copy.pop('parsed_js')
+
+                        # The script element itself, then the parsed JS items linked to it
+                        self.add('html_elements', (element_id, file_id, singular_type, json.dumps(item_data_copy)))
+                        for js_func in parsed_js_data.get('functions', []):
+                            self.add('js_parsed_items', (element_id, 'function', json.dumps(js_func)))
+                        for js_listener in parsed_js_data.get('event_listeners', []):
+                            self.add('js_parsed_items', (element_id, 'event_listener', json.dumps(js_listener)))
+                    else:
+                        # For all other element types, just dump the data
+                        self.add('html_elements', (element_id, file_id, singular_type, json.dumps(item_data)))
+
+        elif file_type == 'css':
+            for rule_data in file_details.get('rules', []):
+                rule_id = self._new_id('css_rules')
+                at_rule_context = rule_data.get('at_rule_context')
+                self.add('css_rules', (rule_id, file_id, rule_data['source_code'], rule_data['start_lineno'], rule_data['end_lineno'], json.dumps(at_rule_context) if at_rule_context else None, rule_data.get('source_start'), rule_data.get('source_end')))
+                for selector in rule_data.get('selectors', []):
+                    self.add('css_selectors', (rule_id, selector))
+
+        elif file_type == 'javascript':
+            class_ids = []
+            for class_data in file_details.get('classes', []):
+                class_id = self._new_id('js_classes')
+                class_ids.append(class_id)
+                self.add('js_classes', (class_id, file_id, class_data['name'], class_data['superclass'], class_data['source_code'], class_data['start_lineno'], class_data['end_lineno'], class_data.get('source_start'), class_data.get('source_end')))
+            for func_data in file_details.get('functions', []):
+                class_index = func_data.get('class_index')
+                self.add('js_functions', (file_id, class_ids[class_index] if class_index is not None else None, func_data['type'], func_data['name'], func_data['source_code'], func_data['start_lineno'], func_data['end_lineno'], func_data.get('source_start'), func_data.get('source_end')))
+            for imp in file_details.get('imports', []):
+                self.add('js_imports', (file_id, imp['kind'], imp['module'], json.dumps(imp['specifiers']), imp['source_code'], imp['start_lineno'], imp['end_lineno'], imp.get('source_start'), imp.get('source_end')))
+            for exp in file_details.get('exports', []):
+                self.add('js_exports', (file_id, exp['kind'], json.dumps(exp['names']), exp['module'], exp['source_code'], exp['start_lineno'], exp['end_lineno'], exp.get('source_start'), exp.get('source_end')))
+            for listener in file_details.get('event_listeners', []):
+                self.add('js_event_listeners', (file_id, listener['target'], str(listener['event_type']), listener['handler_name'], listener['handler_type'], listener['handler_source'], listener['source_code'], listener['start_lineno'], listener['end_lineno'], listener.get('source_start'), listener.get('source_end')))
+        return file_id
+
+
+def insert_file_data(cursor, file_details, fingerprint=None):
     """
-    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Module)):
-        return ast.get_docstring(node)
-    return None
+    Inserts the parsed file details dictionary into the database immediately.
 
-def get_signature(node):
+    Convenience wrapper around BulkInserter for one-off inserts; builds should
+    keep a single BulkInserter for the whole run instead.
     """
-    Constructs a string representation of a Python function or method signature
-    from its AST node. Includes parameters with annotations and defaults, and return annotation.
+    inserter = BulkInserter(cursor)
+    inserter.add_file(file_details, fingerprint)
+    inserter.flush()
 
-    Args:
-        node: An AST node of type ast.FunctionDef, ast.AsyncFunctionDef, or ast.Lambda.
 
-    Returns:
-        A string representing the signature (e.g., "(self, name: str) -> None"),
-        or None if the node type is not a function/method/lambda.
+# --- Helpers for File Fingerprints (Incremental Rebuilds) ---
+
+def _load_existing_fingerprints(cursor, parents=None):
+    """
+    Loads {path: (file_id, size, mtime_ns, content_hash)} from an existing database,
+    or returns None if the database was not written by this schema version.
+    With parents, a list of directory_tree paths, only the files directly in those directories are loaded.
     """
-    if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+    try:
+        row = cursor.execute("SELECT value FROM metadata WHERE key = 'schema_version'").fetchone()
+        if not row or row[0] != str(SCHEMA_VERSION):
+            return None
+        if parents is None:
+            rows = cursor.execute("SELECT id, path, size, mtime_ns, content_hash FROM files")
+        else:
+            rows = cursor.execute("""
+                SELECT f.id, f.path, f.size, f.mtime_ns, f.content_hash FROM directory_tree d JOIN files f ON f.path = d.path
+                WHERE d.parent IN (SELECT value FROM json_each(?))""", (json.dumps(parents),))
+        return {
+            path: (file_id, size, mtime_ns, content_hash)
+            for file_id, path, size, mtime_ns, content_hash in rows
+        }
+    except sqlite3.Error:
         return None
 
-    args = []
-    unparse_available = sys.version_info >= (3, 9)
-    def safe_unparse(n):
-        if unparse_available:
-            try: return ast.unparse(n).strip()
-            except Exception: pass
-        if isinstance(n, ast.Name): return n.id
-        if isinstance(n, ast.Constant): return repr(n.value)
-        return f"<{type(n).__name__}>"
-
-    if hasattr(ast.arguments, 'posonlyargs') and node.args.posonlyargs:
-        for arg in node.args.posonlyargs:
-            arg_str = arg.arg
-            if arg.annotation:
-                arg_str += f": {safe_unparse(arg.annotation)}"
-            args.append(arg_str)
-        args.append('/')
-
-    num_defaults = len(node.args.defaults) if node.args.defaults else 0
-    for i, arg in enumerate(node.args.args):
-        arg_str = arg.arg
-        if arg.annotation:
-            arg_str += f": {safe_unparse(arg.annotation)}"
-        default_index = i - (len(node.args.args) - num_defaults)
-        if default_index >= 0 and default_index < num_defaults and node.args.defaults[default_index] is not None:
-            arg_str += f"={safe_unparse(node.args.defaults[default_index])}"
-        args.append(arg_str)
-
-    if node.args.vararg:
-        arg_str = f"*{node.args.vararg.arg}"
-        if node.args.vararg.annotation:
-            arg_str += f": {safe_unparse(node.args.vararg.annotation)}"
-        args.append(arg_str)
-
-    if hasattr(ast.arguments, 'kwonlyargs') and node.args.kwonlyargs:
-        if not node.args.vararg and (node.args.args or (hasattr(ast.arguments, 'posonlyargs') and node.args.posonlyargs)): # Add * if kwonlyargs exist, no *args, but there are other args
-            pass # No explicit '*' needed if regular or pos-only args exist, the syntax implies it
-        elif not node.args.vararg: # Only kw-only args, or kw-only after pos-only args that ended with /
-            args.append('*')
-
-        for i, arg in enumerate(node.args.kwonlyargs):
-            arg_str = arg.arg
-            if arg.annotation:
-                arg_str += f": {safe_unparse(arg.annotation)}"
-            if node.args.kw_defaults and i < len(node.args.kw_defaults) and node.args.kw_defaults[i] is not None:
-                arg_str += f"={safe_unparse(node.args.kw_defaults[i])}"
-            args.append(arg_str)
-
-    if node.args.kwarg:
-        arg_str = f"**{node.args.kwarg.arg}"
-        if node.args.kwarg.annotation:
-            arg_str += f": {safe_unparse(node.args.kwarg.annotation)}"
-        args.append(arg_str)
-
-    signature_str = "(" + ", ".join(args) + ")"
-    if node.returns:
-        try:
-           return_annotation_str = safe_unparse(node.returns)
-           if return_annotation_str:
-               signature_str += f" -> {return_annotation_str}"
-        except Exception:
-            pass
-    return signature_str
 
+def _load_directory_fingerprints(cursor):
+    """Loads {directory path: fingerprint} from an existing database, with the root's under ''."""
+    fingerprints = dict(cursor.execute("SELECT path, fingerprint FROM directory_tree WHERE is_dir = 1"))
+    row = cursor.execute("SELECT value FROM metadata WHERE key = 'tree_fingerprint'").fetchone()
+    if row:
+        fingerprints[''] = row[0]
+    return fingerprints
 
-def get_source_segment(source_code, node):
-    """
-    Extracts the exact source code string for a given Python AST node,
-    including any preceding decorators.
-    """
-    lines = source_code.splitlines(keepends=True)
-    source_lines_str = "".join(lines)
-
-    if hasattr(ast, 'get_source_segment'):
-        if sys.version_info >= (3, 11):
-             try:
-                 return ast.get_source_segment(source_lines_str, node, extend_past_eol=True)
-             except TypeError:
-                  return ast.get_source_segment(source_lines_str, node)
-        elif sys.version_info >= (3, 8):
-            core_segment = ast.get_source_segment(source_lines_str, node)
-            if core_segment is None: return None
-
-            start_lineno_idx = node.lineno - 1
-            decorator_start_lineno_idx = start_lineno_idx
-            for i in range(start_lineno_idx - 1, -1, -1):
-                line = lines[i].strip()
-                if line.startswith('@'):
-                    decorator_start_lineno_idx = i
-                elif line and not line.startswith('#'): # Stop if non-decorator, non-comment
-                    break
-                elif not line and i < decorator_start_lineno_idx -1: # Stop on blank line unless it's right before decorators
-                    break
-             
-            end_index = (node.end_lineno if hasattr(node, 'end_lineno') else node.lineno)
-            full_segment_lines = lines[decorator_start_lineno_idx : end_index]
-            return "".join(full_segment_lines).strip()
-
-    # Fallback for older Python versions (< 3.8)
-    start_lineno_idx = node.lineno - 1
-    end_lineno_idx = node.end_lineno - 1 if hasattr(node, 'end_lineno') else start_lineno_idx
-    
-    decorator_start_lineno_idx = start_lineno_idx
-    for i in range(start_lineno_idx - 1, -1, -1):
-        line = lines[i].strip()
-        if line.startswith('@'):
-            decorator_start_lineno_idx = i
-        elif line and not line.startswith('#'):
-            break
-        elif not line and i < decorator_start_lineno_idx - 1:
-            break
-    segment = "".join(lines[decorator_start_lineno_idx : end_lineno_idx + 1])
-    return segment.strip()
-
-
-def parse_python_file(filepath, content):
-    """
-    Parses a Python file's content to extract structured information.
-    """
-    file_data = {
-        "path": filepath, "type": "python", "imports": [], "classes": {}, "functions": {},
-        "start_lineno": 1, "end_lineno": len(content.splitlines()), "full_content": content
-    }
-    if not content.strip():
-        file_data["message"] = "File is empty or contains only whitespace."
-        return file_data
 
-    try:
-        tree = ast.parse(content)
-        module_docstring = get_docstring(tree)
-        if module_docstring:
-             file_data["docstring"] = module_docstring
-    except SyntaxError as e:
-        print(f"Syntax error in {filepath}: {e}")
-        file_data.update({"type": "python_error", "error": str(e)})
-        return file_data
-    except Exception as e:
-        print(f"Unexpected parsing error in {filepath}: {e}")
-        file_data.update({"type": "python_error", "error": str(e)})
-        return file_data
-
-    # --- CORRECTED LOGIC: Single loop over top-level nodes ---
-    for node in tree.body:
-        # 1. Check for Imports
-        if isinstance(node, (ast.Import, ast.ImportFrom)):
-            try:
-                if sys.version_info >= (3, 9):
-                     import_str = ast.unparse(node).strip()
-                else: # Manual fallback
-                    if isinstance(node, ast.Import):
-                        names = [n.name + (f" as {n.asname}" if n.asname else "") for n in node.names]
-                        import_str = f"import {', '.join(names)}"
-                    elif isinstance(node, ast.ImportFrom):
-                        module = node.module if node.module else ""
-                        names = [n.name + (f" as {n.asname}" if n.asname else "") for n in node.names]
-                        level = '.' * node.level if node.level else ''
-                        import_str = f"from {level}{module} import {', '.join(names)}"
-                file_data["imports"].append(import_str)
-            except Exception as e:
-                 print(f"Warning: Could not process import node in {filepath}: {ast.dump(node)[:100]}... - {e}")
-                 file_data["imports"].append(f"# Error processing import: {ast.dump(node)[:100]}...")
-        
-        # 2. Check for top-level Functions
-        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-            func_name = node.name
-            source_seg = get_source_segment(content, node)
-            file_data["functions"][func_name] = {
-                "type": "function", "name": func_name, "signature": get_signature(node),
-                "docstring": get_docstring(node),
-                "source_code": textwrap.dedent(source_seg) if source_seg else None,
-                "start_lineno": node.lineno,
-                "end_lineno": node.end_lineno if hasattr(node, 'end_lineno') else node.lineno
-            }
-            
-        # 3. Check for Classes
-        elif isinstance(node, ast.ClassDef):
-            class_name = node.name
-            class_source_seg = get_source_segment(content, node)
-            class_data = {
-                "type": "class", "name": class_name, "docstring": get_docstring(node),
-                "methods": {},
-                "source_code": textwrap.dedent(class_source_seg) if class_source_seg else None,
-                "start_lineno": node.lineno,
-                "end_lineno": node.end_lineno if hasattr(node, 'end_lineno') else node.lineno
-            }
-            # Now iterate through the class body for methods
-            for item in node.body:
-                 if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                    method_name = item.name
-                    method_source_seg = get_source_segment(content, item)
-                    class_data["methods"][method_name] = {
-                        "type": "method", "name": method_name, "signature": get_signature(item),
-                        "docstring": get_docstring(item),
-                        "source_code": textwrap.dedent(method_source_seg) if method_source_seg else None,
-                        "start_lineno": item.lineno,
-                        "end_lineno": item.end_lineno if hasattr(item, 'end_lineno') else item.lineno
-                    }
-            file_data["classes"][class_name] = class_data
-            
-    return file_data
-
-# --- Helper Functions for HTML Parsing ---
-
-def _get_element_ancestry(tag, stop_at_tag=None):
-    path = []
-    for parent in tag.parents:
-        if stop_at_tag and parent is stop_at_tag: break
-        if parent.name in ['html', 'body'] and parent.parent is None: break
-        if parent.name is None: continue
-        tag_repr = parent.name
-        if parent.get('id'): tag_repr += f"#{parent['id']}"
-        classes = parent.get('class')
-        if isinstance(classes, list) and classes: tag_repr += f".{'.'.join(classes)}"
-        path.append(tag_repr)
-    path.reverse()
-    return path
-
-
-
-def parse_javascript_content(js_code: str, html_filepath: str = None) -> dict:
+
+# --- SQLite Output ---
+
+class DatabaseSink(context_core.OutputSink):
     """
-    Parses JavaScript code to extract functions and addEventListener calls
-    using a manual recursive walk to access parent nodes.
-    html_filepath is optional, for context in error messages.
+    Writes the files of a build into a SQLite database (see build_project_database() for the options).
+
+    With incremental=True an existing database is updated in place: the sink
+    reports its stored directory fingerprints, declines files whose size and
+    mtime are unchanged, replaces the rows of files that changed, and in
+    finish() deletes the rows of paths that vanished from the directories
+    that were listed again.
     """
-    if not JS_PARSING_AVAILABLE:
-        return {"error": "JavaScript parsing skipped: esprima not installed.", "source_file_context": html_filepath}
-    if not js_code.strip():
-        return {"message": "Script content is empty or whitespace.", "source_file_context": html_filepath}
-
-    functions_found = []
-    event_listeners_found = []
-
-    def get_source_from_js_node(node, code_str):
-        if hasattr(node, 'range') and isinstance(node.range, list) and len(node.range) == 2:
-            start_idx, end_idx = node.range
-            return code_str[start_idx:end_idx]
-        elif hasattr(node, 'loc') and node.loc and \
-            hasattr(node.loc, 'start') and hasattr(node.loc.start, 'index') and \
-            hasattr(node.loc, 'end') and hasattr(node.loc.end, 'index'):
-            start_idx = node.loc.start.index
-            end_idx = node.loc.end.index
-            return code_str[start_idx:end_idx]
-        return "/* Source unavailable */"
-
-    def custom_js_walk(node, parent_node=None):
-        if node is None or not hasattr(node, 'type'): # Ensure it's a valid AST node
-            return
 
-        # --- Main Logic for Identifying JS Constructs ---
-        if node.type == esprima.Syntax.FunctionDeclaration:
-            func_name = node.id.name if hasattr(node, 'id') and node.id else None
-            source_code = get_source_from_js_node(node, js_code)
-            functions_found.append({
-                "type": "function_declaration", "name": func_name, "source_code": source_code,
-                "start_lineno": node.loc.start.line, "end_lineno": node.loc.end.line
-            })
-        elif node.type in [esprima.Syntax.FunctionExpression, esprima.Syntax.ArrowFunctionExpression]:
-            func_name = None
-            if parent_node:
-                if parent_node.type == esprima.Syntax.VariableDeclarator and \
-                   node == getattr(parent_node, 'init', None) and \
-                   hasattr(parent_node, 'id') and getattr(parent_node.id, 'type', None) == esprima.Syntax.Identifier:
-                    func_name = parent_node.id.name
-                elif parent_node.type == esprima.Syntax.MethodDefinition and \
-                    node == getattr(parent_node, 'value', None) and \
-                    hasattr(parent_node, 'key') and getattr(parent_node.key, 'type', None) == esprima.Syntax.Identifier:
-                    func_name = parent_node.key.name
-                elif parent_node.type == esprima.Syntax.Property and \
-                    node == getattr(parent_node, 'value', None) and \
-                    hasattr(parent_node, 'key'): # Key could be Identifier or Literal
-                    if getattr(parent_node.key, 'type', None) == esprima.Syntax.Identifier:
-                        func_name = parent_node.key.name
-                    # If key is Literal (e.g. "myFunc": function(){}), func_name remains None or could be parent_node.key.value
-            source_code = get_source_from_js_node(node, js_code)
-            functions_found.append({
-                "type": "function_expression" if node.type == esprima.Syntax.FunctionExpression else "arrow_function_expression",
-                "name": func_name, "source_code": source_code,
-                "start_lineno": node.loc.start.line, "end_lineno": node.loc.end.line
-            })
-        elif node.type == esprima.Syntax.CallExpression and \
-            hasattr(node.callee, 'type') and node.callee.type == esprima.Syntax.MemberExpression and \
-            hasattr(node.callee, 'property') and getattr(node.callee.property, 'type', None) == esprima.Syntax.Identifier and \
-            node.callee.property.name == 'addEventListener' and \
-            hasattr(node, 'arguments') and len(node.arguments) >= 2:
-            
-            target_source = get_source_from_js_node(node.callee.object, js_code)
-            event_arg = node.arguments[0]
-            event_type = event_arg.value if hasattr(event_arg, 'value') and event_arg.type == esprima.Syntax.Literal else "<??>"
-            handler_arg = node.arguments[1]
-            handler_source = get_source_from_js_node(handler_arg, js_code)
-            handler_name = handler_arg.name if hasattr(handler_arg, 'name') and handler_arg.type == esprima.Syntax.Identifier else None
-            full_call_source = get_source_from_js_node(node, js_code)
-
-            event_listeners_found.append({
-                "target": target_source, "event_type": event_type,
-                "handler_source": handler_source, "handler_type": handler_arg.type, "handler_name": handler_name,
-                "source_code": full_call_source,
-                "start_lineno": node.loc.start.line, "end_lineno": node.loc.end.line
-            })
-
-        # --- Recursive Traversal of Children ---
-        child_prop_names = []
-        node_type = node.type
-        if node_type in [esprima.Syntax.Program, esprima.Syntax.BlockStatement, esprima.Syntax.ClassBody]: child_prop_names.append('body')
-        elif node_type == esprima.Syntax.ExpressionStatement: child_prop_names.append('expression')
-        elif node_type == esprima.Syntax.IfStatement: child_prop_names.extend(['test', 'consequent', 'alternate'])
-        elif node_type == esprima.Syntax.LabeledStatement: child_prop_names.append('body')
-        elif node_type == esprima.Syntax.WithStatement: child_prop_names.extend(['object', 'body'])
-        elif node_type == esprima.Syntax.SwitchStatement: child_prop_names.extend(['discriminant', 'cases'])
-        elif node_type in [esprima.Syntax.ReturnStatement, esprima.Syntax.ThrowStatement, esprima.Syntax.YieldExpression, esprima.Syntax.AwaitExpression, esprima.Syntax.SpreadElement, esprima.Syntax.UnaryExpression, esprima.Syntax.UpdateExpression]: child_prop_names.append('argument')
-        elif node_type == esprima.Syntax.TryStatement: child_prop_names.extend(['block', 'handler', 'finalizer'])
-        elif node_type == esprima.Syntax.CatchClause: child_prop_names.extend(['param', 'body'])
-        elif node_type in [esprima.Syntax.WhileStatement, esprima.Syntax.DoWhileStatement]: child_prop_names.extend(['test', 'body'])
-        elif node_type == esprima.Syntax.ForStatement: child_prop_names.extend(['init', 'test', 'update', 'body'])
-        elif node_type in [esprima.Syntax.ForInStatement, esprima.Syntax.ForOfStatement]: child_prop_names.extend(['left', 'right', 'body'])
-        elif node_type in [esprima.Syntax.FunctionDeclaration, esprima.Syntax.FunctionExpression, esprima.Syntax.ArrowFunctionExpression]:
-            if hasattr(node, 'id') and node.id: child_prop_names.append('id')
-            if hasattr(node, 'params'): child_prop_names.append('params')
-            if hasattr(node, 'body'): child_prop_names.append('body')
-        elif node_type == esprima.Syntax.VariableDeclaration: child_prop_names.append('declarations')
-        elif node_type == esprima.Syntax.VariableDeclarator: child_prop_names.extend(['id', 'init'])
-        elif node_type in [esprima.Syntax.ArrayExpression, esprima.Syntax.ArrayPattern]: child_prop_names.append('elements')
-        elif node_type in [esprima.Syntax.ObjectExpression, esprima.Syntax.ObjectPattern]: child_prop_names.append('properties')
-        elif node_type == esprima.Syntax.Property: child_prop_names.extend(['key', 'value'])
-        elif node_type == esprima.Syntax.SequenceExpression: child_prop_names.append('expressions')
-        elif node_type in [esprima.Syntax.BinaryExpression, esprima.Syntax.LogicalExpression, esprima.Syntax.AssignmentExpression]: child_prop_names.extend(['left', 'right'])
-        elif node_type == esprima.Syntax.ConditionalExpression: child_prop_names.extend(['test', 'consequent', 'alternate'])
-        elif node_type in [esprima.Syntax.CallExpression, esprima.Syntax.NewExpression]: child_prop_names.extend(['callee', 'arguments'])
-        elif node_type == esprima.Syntax.MemberExpression: child_prop_names.extend(['object', 'property'])
-        elif node_type == esprima.Syntax.SwitchCase: child_prop_names.extend(['test', 'consequent'])
-        elif node_type == esprima.Syntax.TemplateLiteral: child_prop_names.extend(['quasis', 'expressions'])
-        elif node_type == esprima.Syntax.TaggedTemplateExpression: child_prop_names.extend(['tag', 'quasi'])
-        elif node_type in [esprima.Syntax.ClassDeclaration, esprima.Syntax.ClassExpression]:
-            if hasattr(node, 'id') and node.id: child_prop_names.append('id')
-            if hasattr(node, 'superClass') and node.superClass: child_prop_names.append('superClass')
-            child_prop_names.append('body')
-        elif node_type == esprima.Syntax.MethodDefinition: child_prop_names.extend(['key', 'value'])
-        elif node_type == esprima.Syntax.ImportDeclaration: child_prop_names.extend(['specifiers', 'source'])
-        elif node_type in [esprima.Syntax.ExportNamedDeclaration, esprima.Syntax.ExportDefaultDeclaration]:
-            if hasattr(node, 'declaration'): child_prop_names.append('declaration')
-            if hasattr(node, 'specifiers'): child_prop_names.append('specifiers')
-            if hasattr(node, 'source'): child_prop_names.append('source')
-        elif node_type == esprima.Syntax.ExportAllDeclaration: child_prop_names.append('source')
-
-        for prop_name in child_prop_names:
-            child_value = getattr(node, prop_name, None)
-            if child_value is None:
-                continue
-            if isinstance(child_value, list):
-                for item in child_value:
-                    custom_js_walk(item, node)
+    def __init__(self, output_filename="project_context.db", incremental=False, bulk=False, fts=False, compress=None,
+                 snapshot=None, extra_metadata=None):
+        self.output_filename = output_filename
+        self.incremental = incremental
+        self.bulk = bulk
+        self.fts = fts
+        self.compress = compress
+        self.snapshot = snapshot
+        self.extra_metadata = extra_metadata
+        self.existing_files = None # {path: (file_id, size, mtime_ns, content_hash)} of the database being updated
+        self.stored_tree_fingerprints = {}
+        self.git_entries = None # {path: (blob_id, size)} when building from a git revision
+        self.db_filename = output_filename
+        self.conn = None
+        self.seen_paths = set()
+        self.stored_file_ids = [] # Files (re)inserted by this run, for the search index
+        self.entry_count = 0
+        self.incremental_counts = {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0}
+
+    def open(self):
+        output_filename = self.output_filename
+        if self.fts and not context_search.fts5_available():
+            print("Warning: this SQLite build lacks FTS5; the search index will be skipped.")
+            self.fts = False
+        if self.incremental and os.path.exists(output_filename):
+            try:
+                conn = sqlite3.connect(output_filename)
+                # Only compatibility is checked here; begin() loads the stored files once the walk shows which are needed.
+                self.existing_files = _load_existing_fingerprints(conn.cursor(), parents=[])
+                if self.existing_files is not None:
+                    self.stored_tree_fingerprints = _load_directory_fingerprints(conn.cursor())
+                if self.existing_files is not None and self.compress is None:
+                    row = conn.execute("SELECT value FROM metadata WHERE key = 'content_encoding'").fetchone()
+                    self.compress = row[0] if row else None
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"Could not open existing database for incremental update: {e}")
+            if self.existing_files is None:
+                print(f"Existing database '{output_filename}' is incompatible; performing a full rebuild.")
+        if self.bulk and self.existing_files is not None:
+            print("Bulk build mode only applies to full builds; updating the existing database in place.")
+            self.bulk = False
+        kept_snapshot_count = context_snapshots.snapshot_count(output_filename) if self.existing_files is None and os.path.exists(output_filename) else 0
+        if self.bulk and kept_snapshot_count:
+            print(f"Bulk build mode would replace the {kept_snapshot_count} snapshots in '{output_filename}'; rebuilding it in place.")
+            self.bulk = False
+
+        if self.bulk:
+            # Load into a sibling temp file so the final rename is atomic (same filesystem).
+            fd, self.db_filename = tempfile.mkstemp(prefix=os.path.basename(output_filename) + ".", suffix=".tmp",
+                                                    dir=os.path.dirname(os.path.abspath(output_filename)))
+            os.close(fd)
+            context_core.apply_default_permissions(self.db_filename)
+        ### DB MOD ###: Remove the project_data dict and set up DB connection
+        elif self.existing_files is None and os.path.exists(output_filename):
+            if kept_snapshot_count:
+                try:
+                    conn = sqlite3.connect(output_filename)
+                    context_snapshots.clear_build_tables(conn)
+                    conn.close()
+                except sqlite3.Error as e:
+                    print(f"Could not clear the previous build from '{output_filename}': {e}")
+                    return False
+                print(f"Cleared the previous build from '{output_filename}', keeping its {kept_snapshot_count} snapshots.")
             else:
-                custom_js_walk(child_value, node)
-
-    try:
-        tree = esprima.parseScript(js_code, {"loc": True, "range": True, "comment": False, "tokens": False})
-        custom_js_walk(tree)
+                os.remove(output_filename)
+                print(f"Removed existing database '{output_filename}'.")
 
-        return {
-            "functions": functions_found,
-            "event_listeners": event_listeners_found,
-            "source_file_context": html_filepath # Also add context on success
-        }
-    except esprima.Error as e:
-        error_message = getattr(e, 'message', str(e))
-        line_num_str = str(getattr(e, 'lineNumber', 'N/A'))
-        col_num_str = str(getattr(e, 'column', 'N/A'))
-        
-        context_msg = f" in inline script of '{html_filepath}'" if html_filepath else ""
-        
-        if f"(line {line_num_str}, column {col_num_str})" in error_message:
-            print(f"JavaScript Parse Error{context_msg}: {error_message}")
+        try:
+            self.conn = sqlite3.connect(self.db_filename)
+            self.conn.execute("PRAGMA foreign_keys = ON") # Needed for ON DELETE CASCADE when replacing rows
+            cursor = self.cursor = self.conn.cursor()
+            if self.bulk:
+                # Nobody else can see the temp file, so durability is irrelevant until the rename.
+                cursor.execute("PRAGMA journal_mode = OFF")
+                cursor.execute("PRAGMA synchronous = OFF")
+                cursor.execute("PRAGMA locking_mode = EXCLUSIVE")
+                cursor.execute("PRAGMA temp_store = MEMORY")
+                cursor.execute("PRAGMA cache_size = -262144") # 256 MiB page cache
+                create_tables(cursor)
+            elif self.existing_files is None:
+                create_schema(cursor)
+            else:
+                create_indexes(cursor) # Databases from before an index was added get it once
+            # An incremental update maintains the index incrementally only if the
+            # database already had one; a newly requested index covers every file.
+            self.search_maintained = self.existing_files is not None and context_search.has_search_tables(cursor)
+            self.search_enabled = self.fts or self.search_maintained
+            if self.search_enabled:
+                context_search.create_search_tables(cursor)
+            self.codec = content_codec.ContentCodec(self.compress) if self.compress else None
+            if self.codec is not None:
+                content_codec.load_dictionaries(cursor, self.codec)
+            content_codec.register_sqlite_functions(self.conn, self.codec) # Search indexing reads contents through decompress()
+            self.inserter = BulkInserter(cursor, content_codec=self.codec)
+        except sqlite3.Error as e:
+            print(f"Database connection error: {e}")
+            self.abort()
+            return False
+        return True
+
+    def own_paths(self, root_dir):
+        # SQLite's journal files for the output come and go while it is open (see --watch).
+        paths = {os.path.relpath(os.path.abspath(self.output_filename) + suffix, os.path.abspath(root_dir)).replace("\\", "/")
+                 for suffix in ('-journal', '-wal', '-shm')}
+        if self.bulk:
+            # The temp database may live inside the tree being walked; keep it out of the output.
+            paths.add(os.path.relpath(os.path.abspath(self.db_filename), os.path.abspath(root_dir)).replace("\\", "/"))
+        return paths
+
+    def stored_fingerprints(self):
+        return self.stored_tree_fingerprints if self.existing_files is not None else None
+
+    def begin(self, build):
+        self.git_entries = build.git_entries
+        if self.existing_files is not None:
+            # A partial update only needs the files directly in the directories listed again.
+            parents = [dir_path for dir_path, _, _, _ in build.directories] if build.scan_dirs is not None else None
+            self.existing_files.update(_load_existing_fingerprints(self.cursor, parents=parents) or {})
+
+    def needs_file(self, relative_filepath, stat_result):
+        """Skips files whose stored size and mtime still match; every file asked about counts as present unless it is then dropped."""
+        existing = self.existing_files.get(relative_filepath) if self.existing_files is not None else None
+        if existing is not None and stat_result is not None:
+            _, old_size, old_mtime_ns, _ = existing
+            if old_size == stat_result.st_size and old_mtime_ns == stat_result.st_mtime_ns:
+                self.seen_paths.add(relative_filepath)
+                self.incremental_counts['unchanged'] += 1
+                self.entry_count += 1
+                return False
+        return True
+
+    def stored_content_hash(self, relative_filepath):
+        """Returns the stored hash of a file whose size or mtime changed, so a file that was only touched is not parsed again."""
+        existing = self.existing_files.get(relative_filepath) if self.existing_files is not None else None
+        return existing[3] if existing is not None else None
+
+    def add_file(self, relative_filepath, file_details, content_hash, stat_result):
+        """Inserts a file entry, replacing any stale row; without file_details the stored rows are kept."""
+        ### DB MOD ###: Insert data instead of appending to dict
+        self.seen_paths.add(relative_filepath)
+        self.entry_count += 1
+        if stat_result is not None:
+            size = stat_result.st_size
+        elif self.git_entries is not None and relative_filepath in self.git_entries:
+            size = self.git_entries[relative_filepath][1] # Blob size from the revision's listing
         else:
-            print(f"JavaScript Parse Error{context_msg}: {error_message} (line {line_num_str}, column {col_num_str})")
-        
-        return {
-            "error": f"JavaScript syntax error{context_msg}: {error_message}",
-            "full_content_on_error": js_code,
-            "source_file_context": html_filepath
-        }
-    except Exception as e:
-        context_msg = f" in inline script of '{html_filepath}'" if html_filepath else ""
-        print(f"Unexpected JavaScript parsing error{context_msg}: {e}")
-        # import traceback
-        # print(traceback.format_exc()) # Uncomment for full traceback during debugging
-        return {
-            "error": f"Unexpected JavaScript parsing error{context_msg}: {str(e)}",
-            "full_content_on_error": js_code,
-            "source_file_context": html_filepath
-        }
+            size = None
+        fingerprint = (size, stat_result.st_mtime_ns if stat_result else None, content_hash)
+        previous = self.existing_files.get(relative_filepath) if self.existing_files is not None else None
+        if previous is not None:
+            file_id, _, _, old_hash = previous
+            if content_hash is not None and old_hash == content_hash:
+                # Touched but not modified: refresh the fingerprint, keep the parsed rows.
+                self.cursor.execute("UPDATE files SET size = ?, mtime_ns = ? WHERE id = ?", (fingerprint[0], fingerprint[1], file_id))
+                self.incremental_counts['unchanged'] += 1
+                return
+            if self.search_maintained:
+                context_search.unindex_files(self.cursor, [file_id])
+            self.cursor.execute("DELETE FROM files WHERE id = ?", (file_id,)) # Cascades to the type-specific tables
+            self.incremental_counts['changed'] += 1
+        else:
+            self.incremental_counts['added'] += 1
+        file_id = self.inserter.add_file(file_details, fingerprint)
+        if file_id is not None: self.stored_file_ids.append(file_id)
+
+    def finish(self, build):
+        ### DB MOD ###: Finalize the database
+        cursor, inserter, codec = self.cursor, self.inserter, self.codec
+        existing_files, directories, tree_fingerprints = self.existing_files, build.directories, build.tree_fingerprints
+        self.incremental_counts['unchanged'] += build.skipped_file_count
+        self.entry_count += build.skipped_file_count
+        try:
+            if existing_files is not None:
+                # Rows for paths that vanished (or are now excluded) cascade to their parsed children:
+                # files missing from a directory that was listed again, and everything under a vanished directory.
+                rescanned_dirs = {dir_path for dir_path, _, _, _ in directories if dir_path not in build.skipped_dirs}
+                vanished_dirs = [path for path in self.stored_tree_fingerprints
+                                 if path and path not in tree_fingerprints and context_core.tree_parent(path) in rescanned_dirs]
+                removed_file_ids = [file_id for path, (file_id, _, _, _) in existing_files.items()
+                                    if path not in self.seen_paths and context_core.tree_parent(path) in rescanned_dirs]
+                for path in vanished_dirs:
+                    removed_file_ids.extend(file_id for file_id, in cursor.execute(
+                        "SELECT id FROM files WHERE path >= ? AND path < ?", (path, path[:-1] + '0'))) # '0' follows '/'
+                if self.search_maintained:
+                    context_search.unindex_files(cursor, removed_file_ids)
+                for file_id in removed_file_ids:
+                    cursor.execute("DELETE FROM files WHERE id = ?", (file_id,))
+                    self.incremental_counts['removed'] += 1
+                cursor.execute("DELETE FROM metadata")
+                # Only the listings of changed directories are replaced; vanished directories go with everything under them.
+                for path in vanished_dirs:
+                    cursor.execute("DELETE FROM directory_tree WHERE path >= ? AND path < ?", (path, path[:-1] + '0'))
+                for dir_path in rescanned_dirs:
+                    cursor.execute("DELETE FROM directory_tree WHERE parent = ?", (dir_path,))
+
+            # Insert metadata
+            inserter.add('metadata', ('root_directory', os.path.abspath(build.root_dir)))
+            inserter.add('metadata', ('generated_time', datetime.now().isoformat()))
+            inserter.add('metadata', ('description', "Structured code context for LLM interaction and project diffing/recreation."))
+            inserter.add('metadata', ('schema_version', str(SCHEMA_VERSION)))
+            inserter.add('metadata', ('parser_versions', json.dumps(context_core.PARSER_VERSIONS, sort_keys=True)))
+            if self.search_enabled:
+                inserter.add('metadata', ('search_index', 'fts5'))
+            if build.source_offsets:
+                inserter.add('metadata', ('source_storage', 'offsets'))
+            if codec is not None:
+                inserter.add('metadata', ('content_encoding', codec.codec))
+            if directories:
+                inserter.add('metadata', ('tree_fingerprint', tree_fingerprints['']))
+            if build.commit is not None:
+                inserter.add('metadata', ('git_revision', build.commit))
+            for key, value in (self.extra_metadata or {}).items():
+                inserter.add('metadata', (key, value))
+
+            # Insert directory tree: the listing of every directory that was not skipped as unchanged
+            directory_rows = []
+            for dir_path, files, subdir_paths, _ in directories:
+                if dir_path in build.skipped_dirs:
+                    continue
+                if not dir_path and build.root_dir == ".":
+                    directory_rows.append(("./", None, 1, tree_fingerprints['']))
+                directory_rows.extend((relative_filepath, dir_path, 0, None) for relative_filepath, _, _ in files)
+                directory_rows.extend((path, dir_path, 1, tree_fingerprints[path]) for path in subdir_paths if path in tree_fingerprints)
+            for row in sorted(directory_rows):
+                inserter.add('directory_tree', row)
+
+            inserter.flush()
+            if codec is not None:
+                content_codec.compress_deferred_contents(cursor, codec, self.stored_file_ids if existing_files is not None else None)
+                create_source_views(cursor, compressed=True)
+
+            if self.search_enabled:
+                search_start = time.perf_counter()
+                self.search_document_count = context_search.index_files(cursor, self.stored_file_ids if self.search_maintained else None)
+                self.search_seconds = time.perf_counter() - search_start
+            self.conn.commit() # One transaction, so readers never see files without their search documents
+
+            if self.bulk:
+                create_indexes(cursor)
+                cursor.execute("ANALYZE")
+                self.conn.commit()
+                print("Database indexed and analyzed after bulk load.")
+            if self.snapshot is not None:
+                self.snapshot_stats = context_snapshots.record_snapshot(self.conn, self.snapshot)
+            finalized = True
+        except sqlite3.Error as e:
+            print(f"Error during database finalization: {e}")
+            finalized = False
+        finally:
+            self.conn.close()
+            self.conn = None
+
+        if self.bulk:
+            if not finalized:
+                os.remove(self.db_filename)
+                print(f"Discarded partial bulk build; '{self.output_filename}' was left untouched.")
+                return False
+            os.replace(self.db_filename, self.output_filename)
+        return finalized
+
+    def abort(self):
+        if self.conn is not None:
+            self.conn.close() # Uncommitted, so an update in place is rolled back
+            self.conn = None
+        if self.bulk and os.path.exists(self.db_filename):
+            os.remove(self.db_filename)
+
+    def print_summary(self, build):
+        output_filename = self.output_filename
+        print(f"  - Total file entries in database: {self.entry_count}.")
+        if self.codec is not None:
+            print(f"  - {self.codec.summary()}")
+        if self.search_enabled:
+            print(f"  - Search index: {self.search_document_count} documents {'added' if self.search_maintained else 'indexed'} in {self.search_seconds:.2f}s "
+                  f"(query with: python context_search.py -d {output_filename} WORDS...).")
+        if self.snapshot is not None:
+            print(f"  - Recorded snapshot '{self.snapshot}': {self.snapshot_stats['file_count']} files, {self.snapshot_stats['new_contents']} new contents and "
+                  f"{self.snapshot_stats['new_symbols']} new symbols stored (compare with: python context_snapshots.py -d {output_filename} diff OLD NEW).")
+        if self.existing_files is not None:
+            print(f"Incremental Update Summary:")
+            counts = self.incremental_counts
+            print(f"  - {counts['added']} added, {counts['changed']} changed, {counts['removed']} removed, {counts['unchanged']} unchanged.")
 
 
-def parse_html_file(filepath, content):
-    """
-    Parses an HTML file's content for structure, forms, links, scripts, styles, etc.
-    """
-    file_data = {
-        "path": filepath, "type": "html", "title": None, "forms": [], "links": [],
-        "images": [], "htmx_elements": [], "scripts": [], "inline_styles": [],
-        "body_structure_preview": [],
-        "start_lineno": 1, "end_lineno": len(content.splitlines()), "full_content": content
-    }
-    if not content.strip():
-        file_data["message"] = "File is empty or contains only whitespace."
-        return file_data
-    if not HTML_PARSING_AVAILABLE:
-        file_data.update({"type": "html_skipped", "message": "HTML parsing skipped: beautifulsoup4 or lxml not installed."})
-        return file_data
+# --- Main Directory Processing Function (Modified for DB) ---
 
-    try:
-        soup = BeautifulSoup(content, 'lxml') # Removed from_encoding
-        for comment_node in soup.find_all(string=lambda text: isinstance(text, Comment)):
-            comment_node.extract()
-
-        if soup.title and soup.title.string:
-            file_data["title"] = soup.title.string.strip()
-
-        for form in soup.find_all('form'):
-            form_data = {"id": form.get('id'), "action": form.get('action'), "method": form.get('method'), "inputs": [], "ancestry_path": _get_element_ancestry(form, soup.body)}
-            for input_tag in form.select('input, textarea, select'):
-                form_data["inputs"].append({
-                    "tag": input_tag.name, "type": input_tag.get('type'), "name": input_tag.get('name'),
-                    "id": input_tag.get('id'), "value": input_tag.get('value'),
-                    "placeholder": input_tag.get('placeholder'), "required": input_tag.get('required') is not None
-                })
-            file_data["forms"].append(form_data)
-
-        for link in soup.find_all('a'):
-            link_data = {"text": link.get_text(strip=True), "href": link.get('href'), "ancestry_path": _get_element_ancestry(link, soup.body)}
-            if link_data["text"] or link_data["href"]: file_data["links"].append(link_data)
-
-        for img in soup.find_all('img'):
-            img_data = {"src": img.get('src'), "alt": img.get('alt'), "width": img.get('width'), "height": img.get('height'), "ancestry_path": _get_element_ancestry(img, soup.body)}
-            if img_data["src"]: file_data["images"].append(img_data)
-        
-        htmx_attrs_regex = re.compile(r'^hx-.+')
-        for element in soup.find_all(lambda tag: any(htmx_attrs_regex.match(attr) for attr in tag.attrs if isinstance(attr, str))):
-             file_data["htmx_elements"].append({
-                "tag": element.name, "id": element.get('id'), "classes": element.get('class'),
-                "hx_attributes": {attr: value for attr, value in element.attrs.items() if isinstance(attr, str) and htmx_attrs_regex.match(attr)},
-                "text_snippet": (element.get_text(strip=True)[:100] + "...") if element.get_text(strip=True) else None,
-                "ancestry_path": _get_element_ancestry(element, soup.body)
-            })
-
-        for script_tag in soup.find_all('script'):
-            start_line_html = script_tag.sourceline if hasattr(script_tag, 'sourceline') and isinstance(script_tag.sourceline, int) else None
-            end_line_html = (start_line_html + len(str(script_tag).splitlines()) - 1) if start_line_html is not None else None
-            
-            script_data = {
-                "src": script_tag.get('src'), "type": script_tag.get('type', 'text/javascript'),
-                "content": None, "parsed_js": None,
-                "start_lineno_html": start_line_html, "end_lineno_html": end_line_html,
-                "ancestry_path": _get_element_ancestry(script_tag, soup.body)
-            }
-            if script_tag.string:
-                inline_content = script_tag.string.strip()
-                script_data["content"] = inline_content
-                if JS_PARSING_AVAILABLE and inline_content:
-                    if script_tag.string:
-                        inline_content = script_tag.string.strip()
-                        script_data["content"] = inline_content
-                    # Pass the HTML filepath for context in case of JS errors
-                    script_data["parsed_js"] = parse_javascript_content(inline_content, html_filepath=filepath)
-                    if script_data["parsed_js"] and isinstance(script_data["parsed_js"], dict) and start_line_html is not None:
-                        for item_list_key in ["functions", "event_listeners"]:
-                            for item in script_data["parsed_js"].get(item_list_key, []):
-                                if item.get("start_lineno") is not None: # Original line no from esprima
-                                    item["start_lineno_file"] = item["start_lineno"] + start_line_html - 1
-                                    item["end_lineno_file"] = item["end_lineno"] + start_line_html - 1
-                                else: # Should not happen if esprima provides loc
-                                    item["start_lineno_file"] = None
-                                    item["end_lineno_file"] = None
-            if script_data.get("src") or script_data.get("content"):
-                file_data["scripts"].append(script_data)
-
-        for style_tag in soup.find_all('style'):
-            if style_tag.string:
-                start_line_html = style_tag.sourceline if hasattr(style_tag, 'sourceline') and isinstance(style_tag.sourceline, int) else None
-                end_line_html = (start_line_html + len(str(style_tag).splitlines()) - 1) if start_line_html is not None else None
-                file_data["inline_styles"].append({
-                    "type": style_tag.get('type', 'text/css'), "content": style_tag.string.strip(),
-                    "start_lineno_html": start_line_html, "end_lineno_html": end_line_html,
-                    "ancestry_path": _get_element_ancestry(style_tag, soup.body)
-                })
-
-        relevant_selectors_body_children = 'body > div, body > section, body > article, body > main, body > aside, body > nav, body > header, body > footer, body > form, body > ul, body > ol, body > table, body > h1, body > h2, body > h3'
-        if soup.body:
-            for element in soup.body.select(relevant_selectors_body_children):
-                file_data["body_structure_preview"].append({
-                    "tag": element.name, "id": element.get('id'), "classes": element.get('class'),
-                    "text_snippet": (element.get_text(strip=True)[:100] + "...") if element.get_text(strip=True) else None,
-                    "ancestry_path": _get_element_ancestry(element, soup.body)
-                })
-            if not file_data["body_structure_preview"]: # Fallback
-                for element in soup.body.select('div[id], section[id], article[id], nav[id], header[id], footer[id], form[id]'):
-                    preview_data = {
-                        "tag": element.name, "id": element.get('id'), "classes": element.get('class'),
-                        "text_snippet": (element.get_text(strip=True)[:100] + "...") if element.get_text(strip=True) else None,
-                        "ancestry_path": _get_element_ancestry(element, soup.body)
-                    }
-                    if preview_data not in file_data["body_structure_preview"]:
-                        file_data["body_structure_preview"].append(preview_data)
-    except Exception as e:
-        print(f"Error parsing HTML file {filepath}: {e}")
-        # print(traceback.format_exc()) # Uncomment for debugging
-        file_data.update({"type": "html_error", "error": str(e)})
-    return file_data
-
-# --- Helper Function for Basic CSS Parsing ---
-
-def parse_css_file(filepath, content):
+def build_project_database(root_dir=".", output_filename="project_context.db", incremental=False, jobs=1, bulk=False,
+                           parse_cache_path=None, parse_cache_max_bytes=parse_cache.DEFAULT_MAX_BYTES, fts=False,
+                           source_offsets=False, compress=None, use_gitignore=True, ignore_file=None, changed_dirs=None,
+                           verbose=True, extra_metadata=None, rev=None, blob_reader=None, blob_memo=None, snapshot=None,
+                           extra_sinks=()):
     """
-    Performs basic parsing of a CSS file's content to extract rules.
+    Walks a directory tree, processes files, and builds a structured SQLite database.
+
+    With incremental=True an existing database is updated in place: files whose
+    size and mtime (or, failing that, content hash) are unchanged are skipped,
+    changed files are re-parsed, and rows for vanished paths are deleted.
+    With jobs > 1 files are read and parsed in that many worker processes while
+    this process remains the single database writer.
+    With bulk=True a full build is loaded into a temporary file with journaling
+    and syncing disabled, indexed and analyzed once at the end, and then renamed
+    over output_filename, so readers only ever see a complete database.
+    With parse_cache_path set, parse results are reused from (and added to) the
+    shared parse cache, capped at parse_cache_max_bytes.
+    With fts=True the database also gets the FTS5 search index described in
+    context_search.py. Incremental updates keep an existing index current
+    whether or not fts is passed again.
+    With source_offsets=True symbol sources that are verbatim slices of their
+    file are stored as offsets into files.full_content instead of as copies
+    (see source_spans.py); read them through the <table>_expanded views.
+    With compress set to a codec name from content_codec.AVAILABLE_CODECS,
+    file contents are stored compressed (see content_codec.py). Like the
+    search index, compression stays on for later incremental updates.
+    Paths matched by .gitignore files (unless use_gitignore is False) or by
+    the project ignore file (ignore_file, or .contextignore in root_dir) are
+    pruned from the walk and left out of the directory tree; see ignore_rules.py.
+    With incremental=True and changed_dirs, a collection of directory_tree
+    directory paths ('' for the root), only those directories and their
+    ancestors are listed again; every other directory keeps its stored rows
+    and fingerprint. This is how watch mode applies a batch of changes.
+    verbose=False suppresses the summary, and extra_metadata adds
+    {key: value} rows to the metadata table in the same transaction.
+
+    With rev, a git revision, the tree is read from that commit instead of
+    the working tree, without checking it out (see git_source.py): files
+    are listed with `git ls-tree` and read through blob_reader, a
+    git_source.BlobReader that callers building many revisions share. Every
+    tracked file is included, so .gitignore files are not consulted.
+    blob_memo, a dict the caller passes from one revision to the next, keeps
+    the result of each (path, blob id) processed, so files unchanged since
+    the previous revision are neither read nor parsed again; after the
+    build it holds only the entries this revision used.
+
+    With snapshot, a name, the finished build is also recorded as a snapshot
+    (see context_snapshots.py). Snapshots already in the output survive any
+    build: a full rebuild clears only the build's own tables.
+
+    The database is one context_core.OutputSink; extra_sinks are written
+    from the same walk and parse (see main()'s --json).
+
+    Returns the {'added', 'changed', 'removed', 'unchanged'} counts of an
+    incremental update (all files count as added in a full build), or None
+    if the database (or one of extra_sinks) could not be written.
     """
-    file_data = {
-        "path": filepath, "type": "css", "rules": [],
-        "start_lineno": 1, "end_lineno": len(content.splitlines()), "full_content": content
-    }
-    if not content.strip():
-        file_data["message"] = "File is empty or contains only whitespace."
-        return file_data
-
-    content_no_comments = re.sub(r'/\*.*?\*/', '', content, flags=re.DOTALL)
-    rule_pattern = re.compile(r'\s*([^}]*?)\s*{([^}]*)}\s*', re.DOTALL)
-    
-    for match in rule_pattern.finditer(content): # Iterate on original content for line numbers
-        selectors_raw = match.group(1).strip()
-        full_rule_text = match.group(0).strip() # The entire matched rule text
-
-        if selectors_raw:
-            # Calculate line numbers based on match position in original content
-            start_lineno = 1 + content[:match.start()].count('\n')
-            end_lineno = start_lineno + full_rule_text.count('\n')
-             
-            rule_data = {
-                "selectors": [s.strip() for s in selectors_raw.split(',') if s.strip()],
-                "source_code": full_rule_text,
-                "start_lineno": start_lineno,
-                "end_lineno": end_lineno
-            }
-            file_data["rules"].append(rule_data)
-    return file_data
+    sink = DatabaseSink(output_filename, incremental=incremental, bulk=bulk, fts=fts, compress=compress,
+                        snapshot=snapshot, extra_metadata=extra_metadata)
+    # The database is opened last: a full build clears the previous one, which abort() cannot bring back.
+    build = context_core.build_outputs(root_dir, [*extra_sinks, sink], jobs=jobs, parse_cache_path=parse_cache_path,
+                                       parse_cache_max_bytes=parse_cache_max_bytes, source_offsets=source_offsets,
+                                       use_gitignore=use_gitignore, ignore_file=ignore_file, changed_dirs=changed_dirs,
+                                       rev=rev, blob_reader=blob_reader, blob_memo=blob_memo, verbose=verbose)
+    return sink.incremental_counts if build is not None else None
 
 
-# --- Main Directory Processing Function (Modified for DB) ---
+def _percentile(sorted_values, fraction):
+    """Returns the value at the given fraction of a sorted, non-empty list (nearest rank)."""
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def _latency_summary(latencies_ms):
+    """Returns {'updates', 'p50_ms', 'p95_ms', 'max_ms'} for the recorded update latencies."""
+    ordered = sorted(latencies_ms)
+    return {'updates': len(ordered), 'p50_ms': round(_percentile(ordered, 0.5), 1),
+            'p95_ms': round(_percentile(ordered, 0.95), 1), 'max_ms': round(ordered[-1], 1)}
+
 
-def build_project_database(root_dir=".", output_filename="project_context.db"):
+def _store_watch_latency(output_filename, latencies_ms):
+    """Writes the summary of latencies_ms to the database's metadata under 'watch_latency'."""
+    try:
+        conn = sqlite3.connect(output_filename)
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('watch_latency', ?)",
+                             (json.dumps(_latency_summary(latencies_ms)),))
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Warning: could not record the update latency in '{output_filename}': {e}")
+
+
+def watch_project_database(root_dir=".", output_filename="project_context.db", debounce=file_watcher.DEFAULT_DEBOUNCE_SECONDS,
+                           polling=False, poll_interval=file_watcher.DEFAULT_POLL_INTERVAL_SECONDS, **build_options):
     """
-    Walks a directory tree, processes files, and builds a structured SQLite database.
+    Builds (or incrementally updates) the database, then keeps it current as files change.
+
+    The database is switched to WAL journaling, so readers can query it at
+    any time while updates are written. Changes are collected by a
+    file_watcher watcher (inotify, or stat polling with polling=True or where
+    inotify is unavailable) and debounced; each batch is then applied as an
+    incremental update of just the changed directories, in one short
+    transaction. The latency of each update, from the first change seen to
+    the commit, is printed and recorded; a summary of all updates so far is
+    kept in metadata under 'watch_latency' (JSON) for readers to inspect.
+    Runs until interrupted (Ctrl+C). build_options are passed on to
+    build_project_database().
     """
-    ### DB MOD ###: Remove the project_data dict and set up DB connection
-    if os.path.exists(output_filename):
-        os.remove(output_filename)
-        print(f"Removed existing database '{output_filename}'.")
-    
+    build_options.pop('incremental', None)
+    build_options.pop('bulk', None)
+    build_project_database(root_dir, output_filename, incremental=True, **build_options)
     try:
         conn = sqlite3.connect(output_filename)
-        cursor = conn.cursor()
-        create_schema(cursor)
+        conn.execute("PRAGMA journal_mode = WAL") # Persistent: readers never block on the writer
+        conn.close()
     except sqlite3.Error as e:
-        print(f"Database connection error: {e}")
+        print(f"Could not open '{output_filename}' for watching: {e}")
         return
 
-    directory_tree_list = []
-
-    excluded_filenames_set = set(EXCLUDED_FILENAMES)
-    managed_filenames_set = set(MANAGED_FILENAMES)
-    include_content_filenames_set = set(INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES)
-
-    # Counters for summary
-    excluded_dir_count = 0
-    excluded_filename_count = 0
-    excluded_binary_ext_count = 0
-    excluded_ignored_text_ext_count = 0
-    managed_count = 0
-    skipped_non_utf8_count = 0
-    parsing_error_count = 0
-    included_by_allow_list_count = 0
-    processed_file_count = 0
-    skipped_parsing_setup = {}
-
-    for subdir, dirs, files_in_dir in os.walk(root_dir, followlinks=False):
-        original_dirs = list(dirs)
-        dirs[:] = [d for d in original_dirs if d not in EXCLUDED_DIRS]
-        excluded_dir_count += len(original_dirs) - len(dirs)
-
-        relative_subdir = os.path.relpath(subdir, root_dir).replace("\\", "/")
-        if relative_subdir == "." and root_dir == ".":
-            if "./" not in directory_tree_list: directory_tree_list.append("./")
-        elif relative_subdir != ".":
-            directory_tree_list.append(f"{relative_subdir}/")
-
-        for file_name in files_in_dir:
-            filepath = os.path.join(subdir, file_name)
-            relative_filepath = os.path.relpath(filepath, root_dir).replace("\\", "/")
-            directory_tree_list.append(relative_filepath)
-
-            # 1. Check EXCLUDED_FILENAMES
-            if file_name in excluded_filenames_set:
-                excluded_filename_count += 1
-                continue
-
-            _, file_extension = os.path.splitext(file_name)
-            file_extension_lower = file_extension.lower()
+    build_options['jobs'] = 1 # A batch is a handful of files; starting worker processes would dominate
+    root_abspath = os.path.abspath(root_dir)
+    output_paths = {os.path.relpath(os.path.abspath(output_filename) + suffix, root_abspath).replace("\\", "/")
+                    for suffix in ('', '-journal', '-wal', '-shm')}
+    make_path_filter = lambda: context_core.make_path_filter(root_dir, build_options.get('use_gitignore', True), build_options.get('ignore_file'))
+    watcher = file_watcher.create_watcher(root_dir, make_path_filter, ignored_paths=output_paths, polling=polling, interval=poll_interval)
+    print(f"\nWatching '{root_dir}' for changes ({watcher.name}, {debounce * 1000:.0f} ms debounce). Press Ctrl+C to stop.")
 
-            # 2. Check BINARY_EXTENSIONS
-            if file_extension_lower in BINARY_EXTENSIONS:
-                excluded_binary_ext_count += 1
-                continue
-
-            # 3. Check MANAGED_FILENAMES or MANAGED_EXTENSIONS
-            if file_name in managed_filenames_set or file_extension_lower in MANAGED_EXTENSIONS:
-                managed_count += 1
-                line_count_m = 1
-                try:
-                    with open(filepath, 'rb') as f_bytes:
-                        line_count_m = f_bytes.read().count(b'\n') + 1
-                except Exception: pass
-                 
-                ### DB MOD ###: Insert managed file entry into the DB
-                managed_entry = {
-                    "path": relative_filepath, "type": "managed_static",
-                    "message": "Content managed externally or omitted for brevity.",
-                    "full_content": None, "start_lineno": 1, "end_lineno": max(1, line_count_m)
-                }
-                insert_file_data(cursor, managed_entry)
-                processed_file_count += 1
+    latencies_ms = []
+    try:
+        while True:
+            changed_dirs, first_change_time = watcher.wait(debounce)
+            update_start = time.perf_counter()
+            # The update rewrites metadata; carry the summary over, then add this update to it once committed.
+            extra_metadata = {'watch_latency': json.dumps(_latency_summary(latencies_ms))} if latencies_ms else None
+            counts = build_project_database(root_dir, output_filename, incremental=True, changed_dirs=changed_dirs,
+                                            verbose=False, extra_metadata=extra_metadata, **build_options)
+            update_ms = (time.perf_counter() - update_start) * 1000
+            latency_ms = (time.time() - first_change_time) * 1000
+            if counts is None:
+                print(f"[{datetime.now():%H:%M:%S}] Update failed; will retry on the next change.")
                 continue
+            latencies_ms.append(latency_ms)
+            _store_watch_latency(output_filename, latencies_ms)
+            scope = "full rescan" if changed_dirs is None else f"{len(changed_dirs)} directories"
+            print(f"[{datetime.now():%H:%M:%S}] {counts['added']} added, {counts['changed']} changed, {counts['removed']} removed "
+                  f"({scope}): update {update_ms:.0f} ms, change to queryable {latency_ms:.0f} ms")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    if latencies_ms:
+        summary = _latency_summary(latencies_ms)
+        print(f"\nStopped watching after {summary['updates']} updates; change to queryable latency "
+              f"p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, max {summary['max_ms']} ms.")
 
-            # --- Try to read and process content ---
-            content = None
-            file_details = None
-            processed_this_file = False # Flag to indicate if file was handled
-
-            # 4. Check INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES (Allow List)
-            if file_name in include_content_filenames_set:
-                included_by_allow_list_count +=1
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    line_count = max(1, len(content.splitlines()))
-
-                    if file_extension_lower in PARSEABLE_CODE_EXTENSIONS:
-                        if file_extension_lower == '.py': file_details = parse_python_file(relative_filepath, content)
-                        elif file_extension_lower in ('.html', '.htm'):
-                            if HTML_PARSING_AVAILABLE: file_details = parse_html_file(relative_filepath, content)
-                            else:
-                                file_details = {"path": relative_filepath, "type": "html_skipped", "message": "HTML parsing skipped: libraries missing.", "full_content": content, "start_lineno": 1, "end_lineno": line_count}
-                                skipped_parsing_setup['html'] = skipped_parsing_setup.get('html', 0) + 1
-                        elif file_extension_lower == '.css': file_details = parse_css_file(relative_filepath, content)
-                        else: # Should not be reached if PARSEABLE_CODE_EXTENSIONS is well-defined
-                            file_details = {"path": relative_filepath, "type": "unhandled_parseable_on_allow_list", "full_content": content, "start_lineno": 1, "end_lineno": line_count}
-                    else: # Not parseable, but on allow list - store as generic text
-                        file_details = {"path": relative_filepath, "type": file_extension_lower[1:] if file_extension_lower else "plaintext", "full_content": content, "start_lineno": 1, "end_lineno": line_count}
-                    
-                    if "error" in file_details.get("type", ""): parsing_error_count += 1
-                    
-                    ### DB MOD ###: Insert data instead of appending to dict
-                    insert_file_data(cursor, file_details)
-                    processed_file_count += 1
-                    processed_this_file = True
-
-                except UnicodeDecodeError:
-                    skipped_non_utf8_count += 1
-                    line_count_rb = 1
-                    try:
-                        with open(filepath, 'rb') as fb: line_count_rb = max(1, fb.read().count(b'\n') + 1)
-                    except Exception: pass
-                    error_details = {"path": relative_filepath, "type": "skipped_non_utf8", "message": "File on allow-list skipped due to non-UTF-8 encoding.", "start_lineno": 1, "end_lineno": line_count_rb}
-                    insert_file_data(cursor, error_details)
-                    processed_file_count += 1
-                    processed_this_file = True
-                except Exception as e:
-                    parsing_error_count +=1
-                    line_count_rb = 1
-                    try:
-                        with open(filepath, 'rb') as fb: line_count_rb = max(1, fb.read().count(b'\n') + 1)
-                    except Exception: pass
-                    error_details = {"path": relative_filepath, "type": "read_error_on_allow_list", "error": str(e), "message": f"Error reading allow-listed file: {e}", "start_lineno": 1, "end_lineno": line_count_rb}
-                    insert_file_data(cursor, error_details)
-                    processed_file_count += 1
-                    processed_this_file = True
-            
-            if processed_this_file:
-                continue # Move to the next file
-
-            # 5. Check IGNORED_TEXT_EXTENSIONS (only if not processed by allow list)
-            if file_extension_lower in IGNORED_TEXT_EXTENSIONS:
-                excluded_ignored_text_ext_count += 1
-                continue
 
-            # 6. Default processing for other text files (parseable or generic)
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                line_count = max(1, len(content.splitlines()))
-
-                if file_extension_lower in PARSEABLE_CODE_EXTENSIONS:
-                    if file_extension_lower == '.py': file_details = parse_python_file(relative_filepath, content)
-                    elif file_extension_lower in ('.html', '.htm'):
-                        if HTML_PARSING_AVAILABLE: file_details = parse_html_file(relative_filepath, content)
-                        else:
-                            file_details = {"path": relative_filepath, "type": "html_skipped", "message": "HTML parsing skipped: libraries missing.", "full_content": content, "start_lineno": 1, "end_lineno": line_count}
-                            skipped_parsing_setup['html'] = skipped_parsing_setup.get('html', 0) + 1
-                    elif file_extension_lower == '.css': file_details = parse_css_file(relative_filepath, content)
-                    else: # Should not be reached
-                        file_details = {"path": relative_filepath, "type": "unhandled_parseable", "full_content": content, "start_lineno": 1, "end_lineno": line_count}
-                else: # Generic text file not caught by any other rule
-                    file_details = {"path": relative_filepath, "type": file_extension_lower[1:] if file_extension_lower else "plaintext", "full_content": content, "start_lineno": 1, "end_lineno": line_count}
-
-                if "error" in file_details.get("type", ""): parsing_error_count += 1
-                
-                ### DB MOD ###: Insert data instead of appending to dict
-                insert_file_data(cursor, file_details)
-                processed_file_count += 1
-
-            except UnicodeDecodeError:
-                skipped_non_utf8_count += 1
-                line_count_rb = 1
-                try:
-                    with open(filepath, 'rb') as fb: line_count_rb = max(1, fb.read().count(b'\n') + 1)
-                except Exception: pass
-                error_details = {"path": relative_filepath, "type": "skipped_non_utf8", "message": "File skipped due to non-UTF-8 encoding.", "start_lineno": 1, "end_lineno": line_count_rb}
-                insert_file_data(cursor, error_details)
-                processed_file_count += 1
-            except Exception as e:
-                parsing_error_count +=1
-                line_count_rb = 1
-                try:
-                    with open(filepath, 'rb') as fb: line_count_rb = max(1, fb.read().count(b'\n') + 1)
-                except Exception: pass
-                error_details = {"path": relative_filepath, "type": "read_error", "error": str(e), "message": f"Error reading file: {e}", "start_lineno": 1, "end_lineno": line_count_rb}
-                insert_file_data(cursor, error_details)
-                processed_file_count += 1
-    
-    ### DB MOD ###: Finalize the database
+def build_revision_databases(root_dir=".", revisions=("HEAD",), output_filename="project_context.db", **build_options):
+    """
+    Builds one database per git revision, without checking any of them out.
+
+    revisions are resolved with git_source.resolve_revisions(), so ranges
+    such as 'v1.0..main' expand to every commit in them, oldest first. With
+    more than one commit, output_filename must contain '{commit}', which is
+    replaced by each commit's abbreviated id. All builds share one
+    `git cat-file --batch` process, and each reuses the results of the files
+    the previous revision already processed (see build_project_database()),
+    so consecutive commits cost roughly what their diff does.
+    Alternatively, a snapshot name containing '{commit}' records every
+    commit as a snapshot of a single database, updated in place from one
+    commit to the next. build_options are passed on to build_project_database().
+    """
     try:
-        # Insert metadata
-        cursor.execute("INSERT INTO metadata (key, value) VALUES (?, ?)", ('root_directory', os.path.abspath(root_dir)))
-        cursor.execute("INSERT INTO metadata (key, value) VALUES (?, ?)", ('generated_time', datetime.now().isoformat()))
-        cursor.execute("INSERT INTO metadata (key, value) VALUES (?, ?)", ('description', "Structured code context for LLM interaction and project diffing/recreation."))
-        
-        # Insert directory tree
-        for path in sorted(directory_tree_list):
-            cursor.execute("INSERT INTO directory_tree (path) VALUES (?)", (path,))
-
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"Error during database finalization: {e}")
-    finally:
-        conn.close()
-
-    print(f"\nSuccessfully wrote structured project context to '{output_filename}'")
-    print(f"Summary of Exclusions/Inclusions:")
-    print(f"  - {excluded_dir_count} directories skipped during walk (not in directory_tree).")
-    print(f"  - {excluded_filename_count} specific files excluded from 'files' table.")
-    print(f"  - {excluded_binary_ext_count} binary files by extension excluded from 'files' table.")
-    print(f"  - {included_by_allow_list_count} files had content included via specific filename allow-list.")
-    print(f"  - {excluded_ignored_text_ext_count} files by extension had content ignored (not on allow-list).")
-    print(f"  - {managed_count} files managed (metadata only, no full content).")
-    print(f"Processing Summary:")
-    if skipped_non_utf8_count:
-        print(f"  - Skipped reading {skipped_non_utf8_count} non-UTF-8 text files (entry added to 'files' with error type).")
-    if parsing_error_count:
-        print(f"  - Encountered {parsing_error_count} files with syntax, parsing, or read errors (entry added to 'files' with error type).")
-    for lang, count in skipped_parsing_setup.items():
-        print(f"  - Skipped parsing {count} {lang.upper()} files due to missing libraries (entry added to 'files' with full content).")
-    print(f"  - Total file entries in database: {processed_file_count}.")
-    print(f"  - Full directory tree recorded: {len(directory_tree_list)} entries.")
+        commits = git_source.resolve_revisions(root_dir, revisions)
+    except RuntimeError as e:
+        print(f"Could not resolve revisions: {e}")
+        return
+    snapshot = build_options.pop('snapshot', None)
+    if len(commits) > 1 and '{commit}' not in output_filename:
+        if snapshot is None or '{commit}' not in snapshot:
+            print(f"{len(commits)} revisions to build, but neither the output path nor the snapshot name has a '{{commit}}' placeholder to tell them apart.")
+            return
+        build_options['incremental'] = True # One database, updated from each commit to the next
+    if len(commits) == 1:
+        build_options.setdefault('verbose', True)
+    else:
+        build_options['verbose'] = False
+        print(f"Building {len(commits)} revisions...")
+    blob_memo = {}
+    with git_source.BlobReader(root_dir) as blob_reader:
+        for index, commit in enumerate(commits, 1):
+            revision_output = output_filename.replace('{commit}', commit[:12])
+            start = time.perf_counter()
+            revision_snapshot = snapshot.replace('{commit}', commit[:12]) if snapshot is not None else None
+            counts = build_project_database(root_dir, revision_output, rev=commit, blob_reader=blob_reader, blob_memo=blob_memo,
+                                            snapshot=revision_snapshot, **build_options)
+            if len(commits) > 1:
+                outcome = "failed" if counts is None else f"{time.perf_counter() - start:.2f}s"
+                print(f"  [{index}/{len(commits)}] {commit[:12]} -> {revision_output} ({outcome})")
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Build a structured SQLite context database for a project.")
+    parser.add_argument("root_directory", nargs="?", default=".", help="Project root to scan (default: current directory).")
+    parser.add_argument("-o", "--output", default="project_context.db", help="Output database path (default: project_context.db).")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Update an existing database in place, re-parsing only added or changed files.")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of worker processes used to read and parse files (default: 1).")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Fast full build: load into a temp file without journaling, index once at the end, then atomically replace the output.")
+    parser.add_argument("--parse-cache", metavar="PATH",
+                        help="Reuse parse results from this cache file (shared with build_code_json.py); created if missing.")
+    parser.add_argument("--parse-cache-size", type=int, default=parse_cache.DEFAULT_MAX_BYTES // (1024 * 1024), metavar="MB",
+                        help="Size cap for the parse cache; least recently used entries are evicted (default: %(default)s).")
+    parser.add_argument("--fts", action="store_true",
+                        help="Also build an FTS5 full-text index over file contents and symbol sources (see context_search.py).")
+    parser.add_argument("--source-offsets", action="store_true",
+                        help="Store symbol sources as offsets into files.full_content instead of copies; read them via the *_expanded views.")
+    parser.add_argument("--compress", choices=content_codec.AVAILABLE_CODECS,
+                        help="Store file contents compressed with this codec; query them with decompress() (see content_codec.py).")
+    parser.add_argument("--no-gitignore", action="store_true",
+                        help="Do not prune paths matched by .gitignore files and .git/info/exclude.")
+    parser.add_argument("--watch", action="store_true",
+                        help="After building, keep the database up to date as files change (WAL mode; stop with Ctrl+C).")
+    parser.add_argument("--poll", action="store_true",
+                        help="With --watch, poll file stats instead of using inotify.")
+    parser.add_argument("--debounce", type=int, default=int(file_watcher.DEFAULT_DEBOUNCE_SECONDS * 1000), metavar="MS",
+                        help="With --watch, wait this long after the last change before updating (default: %(default)s).")
+    parser.add_argument("--rev", action="append", metavar="REV",
+                        help="Build from this git revision (or range, e.g. v1.0..main) without checking it out; repeatable. "
+                             "With several commits, put '{commit}' in the output path.")
+    parser.add_argument("--snapshot", metavar="NAME",
+                        help="Also record the build as a named snapshot kept across later builds (see context_snapshots.py); "
+                             "with --rev, '{commit}' in NAME is replaced by each commit.")
+    parser.add_argument("--ignore-file", metavar="PATH",
+                        help=f"Extra ignore rules in .gitignore syntax, relative to the root (default: {ignore_rules.PROJECT_IGNORE_FILENAME} in the root, if present).")
+    parser.add_argument("--json", metavar="PATH",
+                        help="Also write the JSON document build_code_json.py produces to PATH, from the same walk and parse.")
+    parser.add_argument("--json-compact", action="store_true",
+                        help="With --json, write the JSON without indentation.")
+    args = parser.parse_args(argv)
+    build_options = dict(jobs=args.jobs, parse_cache_path=args.parse_cache, parse_cache_max_bytes=args.parse_cache_size * 1024 * 1024,
+                         fts=args.fts, source_offsets=args.source_offsets, compress=args.compress,
+                         use_gitignore=not args.no_gitignore, ignore_file=args.ignore_file)
+    if args.watch and (args.rev or args.snapshot):
+        parser.error("--watch cannot be combined with --rev or --snapshot")
+    if args.json and (args.watch or args.rev):
+        parser.error("--json cannot be combined with --watch or --rev")
+    if args.rev:
+        build_revision_databases(args.root_directory, args.rev, args.output, incremental=args.incremental, bulk=args.bulk,
+                                 snapshot=args.snapshot, **build_options)
+    elif args.watch:
+        watch_project_database(args.root_directory, args.output, debounce=args.debounce / 1000, polling=args.poll, **build_options)
+    else:
+        # The JSON document is written from scratch, so with --incremental the files it needs are still parsed once.
+        extra_sinks = [build_code_json.JsonSink(args.json, compact=args.json_compact, compress=args.compress)] if args.json else []
+        build_project_database(args.root_directory, args.output, incremental=args.incremental, bulk=args.bulk,
+                               snapshot=args.snapshot, extra_sinks=extra_sinks, **build_options)
 
 
 if __name__ == "__main__":
-    root_directory = sys.argv[1] if len(sys.argv) > 1 else "."
-    build_project_database(root_directory)
\ No newline at end of file
+    main()
@@ -0,0 +1,292 @@
+#content_codec.py
+
+"""
+Optional compression of file contents, shared by build_code_db.py and build_code_json.py.
+
+Compressed values are self-describing: a 3-byte magic, one codec byte and,
+for dictionary codecs, the 4-byte id of the dictionary they were compressed
+with. In the database they are BLOBs while uncompressed contents stay TEXT,
+so a database can mix both (e.g. after an incremental run) and decode()
+passes anything that is not a compressed blob through unchanged.
+
+Codecs:
+    zlib  stdlib; small files share a preset dictionary (zdict)
+    lzma  stdlib; best ratio, slowest, per file only
+    zstd  needs the 'zstandard' package; small files share a trained dictionary
+
+Small files compress poorly on their own, so when a dictionary codec is used
+they are left as TEXT while the database is loaded, a dictionary is built
+from them at the end (stored in 'compression_dictionaries') and they are
+compressed with it in one pass. A value is only ever stored compressed if
+that is smaller than its UTF-8 text.
+
+Readers open the database with connect() (or call register_sqlite_functions()
+on their own connection), which adds a decompress() SQL function; rows are
+decompressed only when a query actually selects their content, e.g.
+    SELECT decompress(full_content) FROM files WHERE path = ?
+The *_expanded views of a compressed database already call it.
+"""
+
+import base64
+import collections
+import json
+import lzma
+import sqlite3
+import struct
+import time
+import zlib
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+MAGIC = b'\x1bCZ'
+CODEC_BYTES = {'zlib': b'z', 'lzma': b'x', 'zstd': b's'}
+DICTIONARY_CODEC_BYTES = {'zlib': b'Z', 'zstd': b'S'}
+CODECS_BY_BYTE = {v[0]: k for k, v in CODEC_BYTES.items()}
+DICTIONARY_CODECS_BY_BYTE = {v[0]: k for k, v in DICTIONARY_CODEC_BYTES.items()}
+AVAILABLE_CODECS = ['zlib', 'lzma'] + (['zstd'] if ZSTD_AVAILABLE else [])
+
+SMALL_FILE_LIMIT = 4096 # Characters; smaller files are compressed with the shared dictionary
+MIN_DICTIONARY_SAMPLES = 32 # Below this many small files a dictionary is not worth it
+DICTIONARY_SIZE = 32 * 1024 # zlib's window, and a reasonable zstd dictionary size
+VERIFY_EVERY = 16 # Decode every n-th compressed value to check it and time decompression
+
+
+def _zlib_dictionary(samples, size=DICTIONARY_SIZE):
+    """
+    Builds a zlib preset dictionary from the lines shared by the most samples.
+    zlib has no trainer, but a dictionary is just text that back-references
+    can point into; the most valuable lines go last, where they are closest.
+    """
+    line_counts = collections.Counter()
+    for sample in samples:
+        line_counts.update(set(line for line in sample.splitlines(keepends=True) if len(line.strip()) > 3))
+    shared = [(count * len(line), line) for line, count in line_counts.items() if count > 1]
+    shared.sort(key=lambda item: item[0], reverse=True)
+    chosen = []
+    total = 0
+    for _, line in shared:
+        if total + len(line) > size:
+            continue
+        chosen.append(line)
+        total += len(line)
+    return b''.join(reversed(chosen))
+
+
+def train_dictionary(codec, samples):
+    """Returns dictionary bytes for codec built from the sample byte strings, or None."""
+    if codec not in DICTIONARY_CODEC_BYTES or len(samples) < MIN_DICTIONARY_SAMPLES:
+        return None
+    if codec == 'zstd':
+        try:
+            return zstandard.train_dictionary(DICTIONARY_SIZE, samples).as_bytes()
+        except zstandard.ZstdError:
+            return None # Too little (or too uniform) sample data
+    return _zlib_dictionary(samples) or None
+
+
+def _format_size(num_bytes):
+    return f"{num_bytes / 1e6:.2f} MB" if num_bytes >= 1e6 else f"{num_bytes / 1e3:.1f} kB"
+
+
+class ContentCodec:
+    """Encodes file contents with one codec and decodes any value written by this module."""
+
+    def __init__(self, codec='zlib', level=None):
+        if codec not in AVAILABLE_CODECS:
+            raise ValueError(f"Unknown or unavailable codec '{codec}' (available: {', '.join(AVAILABLE_CODECS)}).")
+        self.codec = codec
+        self.level = level
+        self.dictionary_id = None
+        self.dictionaries = {} # id -> dictionary bytes, for decoding
+        self._zstd_compressors = {}
+        # Statistics reported by the builders
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.compressed_count = 0
+        self.compress_seconds = 0.0
+        self.sampled_bytes = 0
+        self.sampled_seconds = 0.0
+
+    def add_dictionary(self, dictionary_id, data, use=False):
+        """Makes a dictionary available for decoding, and for encoding small files if use=True."""
+        self.dictionaries[dictionary_id] = data
+        if use:
+            self.dictionary_id = dictionary_id
+
+    def _compress(self, data, dictionary_id):
+        if self.codec == 'zlib':
+            if dictionary_id is None:
+                return CODEC_BYTES['zlib'] + zlib.compress(data, 6 if self.level is None else self.level)
+            compressor = zlib.compressobj(6 if self.level is None else self.level, zdict=self.dictionaries[dictionary_id])
+            return DICTIONARY_CODEC_BYTES['zlib'] + struct.pack('>I', dictionary_id) + compressor.compress(data) + compressor.flush()
+        if self.codec == 'lzma':
+            return CODEC_BYTES['lzma'] + lzma.compress(data, preset=6 if self.level is None else self.level)
+        compressor = self._zstd_compressors.get(dictionary_id)
+        if compressor is None:
+            dict_data = zstandard.ZstdCompressionDict(self.dictionaries[dictionary_id]) if dictionary_id is not None else None
+            compressor = zstandard.ZstdCompressor(level=3 if self.level is None else self.level, dict_data=dict_data)
+            self._zstd_compressors[dictionary_id] = compressor
+        if dictionary_id is None:
+            return CODEC_BYTES['zstd'] + compressor.compress(data)
+        return DICTIONARY_CODEC_BYTES['zstd'] + struct.pack('>I', dictionary_id) + compressor.compress(data)
+
+    def is_deferred(self, text):
+        """Whether text should wait for the shared dictionary (see compress_deferred_contents)."""
+        return (self.dictionary_id is None and self.codec in DICTIONARY_CODEC_BYTES
+                and len(text) < SMALL_FILE_LIMIT)
+
+    def encode(self, text, defer_small=True):
+        """
+        Returns the value to store for text: a compressed blob, or text itself if
+        compression does not pay off (or, with defer_small, the file is small
+        and no dictionary exists yet). Statistics count everything passed in
+        except deferred values, which are counted when they are encoded later.
+        """
+        if not isinstance(text, str) or not text:
+            return text
+        if defer_small and self.is_deferred(text):
+            return text
+        data = text.encode('utf-8')
+        start = time.perf_counter()
+        dictionary_id = self.dictionary_id if len(text) < SMALL_FILE_LIMIT else None
+        blob = MAGIC + self._compress(data, dictionary_id)
+        self.compress_seconds += time.perf_counter() - start
+        self.raw_bytes += len(data)
+        if len(blob) >= len(data):
+            self.stored_bytes += len(data)
+            return text
+        self.stored_bytes += len(blob)
+        self.compressed_count += 1
+        if self.compressed_count % VERIFY_EVERY == 1:
+            start = time.perf_counter()
+            if self.decode(blob) != text:
+                raise ValueError("Compressed content did not round-trip.")
+            self.sampled_seconds += time.perf_counter() - start
+            self.sampled_bytes += len(data)
+        return blob
+
+    def decode(self, value):
+        """Returns the text of a stored value; anything but a compressed blob is returned unchanged."""
+        if not isinstance(value, bytes) or not value.startswith(MAGIC) or len(value) < 4:
+            return value
+        codec_byte = value[3]
+        if codec_byte in CODECS_BY_BYTE:
+            codec, payload, dictionary = CODECS_BY_BYTE[codec_byte], value[4:], None
+        elif codec_byte in DICTIONARY_CODECS_BY_BYTE:
+            (dictionary_id,) = struct.unpack('>I', value[4:8])
+            codec, payload, dictionary = DICTIONARY_CODECS_BY_BYTE[codec_byte], value[8:], self.dictionaries[dictionary_id]
+        else:
+            raise ValueError(f"Unknown compressed content codec byte {codec_byte!r}.")
+        if codec == 'zlib':
+            if dictionary is None:
+                data = zlib.decompress(payload)
+            else:
+                decompressor = zlib.decompressobj(zdict=dictionary)
+                data = decompressor.decompress(payload) + decompressor.flush()
+        elif codec == 'lzma':
+            data = lzma.decompress(payload)
+        else:
+            if not ZSTD_AVAILABLE:
+                raise ValueError("Content is zstd-compressed but the 'zstandard' package is not installed.")
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary is not None else None
+            data = zstandard.ZstdDecompressor(dict_data=dict_data).decompress(payload)
+        return data.decode('utf-8')
+
+    def summary(self):
+        """One-line ratio and read-overhead report for the build summary."""
+        if not self.raw_bytes:
+            return f"Content compression ({self.codec}): nothing to compress."
+        ratio = self.raw_bytes / max(1, self.stored_bytes)
+        line = (f"Content compression ({self.codec}{', shared dictionary for small files' if self.dictionary_id is not None else ''}): "
+                f"{_format_size(self.raw_bytes)} -> {_format_size(self.stored_bytes)} ({ratio:.2f}x, "
+                f"{self.compressed_count} files compressed in {self.compress_seconds:.2f}s)")
+        if self.sampled_bytes:
+            line += f"; reads decompress at ~{self.sampled_bytes / 1e6 / max(self.sampled_seconds, 1e-9):.0f} MB/s"
+        return line + "."
+
+
+# --- SQLite integration ---
+
+def create_tables(cursor):
+    """Creates the table holding shared dictionaries."""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS compression_dictionaries (
+        id INTEGER PRIMARY KEY,
+        codec TEXT NOT NULL,
+        data BLOB NOT NULL
+    )''')
+
+
+def load_dictionaries(cursor, codec):
+    """Adds every stored dictionary to codec; the newest one for its codec is used for encoding."""
+    try:
+        rows = cursor.execute("SELECT id, codec, data FROM compression_dictionaries ORDER BY id").fetchall()
+    except sqlite3.OperationalError:
+        return # Database predates compression
+    for dictionary_id, dictionary_codec, data in rows:
+        codec.add_dictionary(dictionary_id, data, use=(dictionary_codec == codec.codec))
+
+
+def register_sqlite_functions(conn, codec=None):
+    """
+    Adds decompress(value) to the connection. Returns the ContentCodec used,
+    loading the database's dictionaries into a new one unless codec is given.
+    """
+    if codec is None:
+        codec = ContentCodec('zlib')
+        load_dictionaries(conn.cursor(), codec)
+    conn.create_function("decompress", 1, codec.decode, deterministic=True)
+    return codec
+
+
+def connect(path):
+    """Opens a context database with decompress() available."""
+    conn = sqlite3.connect(path)
+    register_sqlite_functions(conn)
+    return conn
+
+
+def compress_deferred_contents(cursor, codec, file_ids=None):
+    """
+    Compresses the small contents left as TEXT during loading: builds and stores
+    the shared dictionary first if the codec supports one and none exists yet.
+    With file_ids, only those rows are considered (e.g. the files an incremental
+    update just inserted) instead of scanning the whole table.
+    """
+    query = "SELECT id, full_content FROM files WHERE typeof(full_content) = 'text' AND length(full_content) < ?"
+    if file_ids is None:
+        rows = cursor.execute(query, (SMALL_FILE_LIMIT,)).fetchall()
+    else:
+        rows = cursor.execute(query + " AND id IN (SELECT value FROM json_each(?))", (SMALL_FILE_LIMIT, json.dumps(file_ids))).fetchall()
+    if codec.dictionary_id is None and codec.codec in DICTIONARY_CODEC_BYTES:
+        dictionary = train_dictionary(codec.codec, [text.encode('utf-8') for _, text in rows if text])
+        if dictionary is not None:
+            cursor.execute("INSERT INTO compression_dictionaries (codec, data) VALUES (?, ?)", (codec.codec, dictionary))
+            codec.add_dictionary(cursor.lastrowid, dictionary, use=True)
+    updates = []
+    for file_id, text in rows:
+        value = codec.encode(text, defer_small=False)
+        if value is not text:
+            updates.append((value, file_id))
+    cursor.executemany("UPDATE files SET full_content = ? WHERE id = ?", updates)
+
+
+# --- JSON integration ---
+
+def encode_json_value(codec, text):
+    """Returns text, or {"encoding": "<codec>+base64", "data": ...} if compressing it pays off."""
+    value = codec.encode(text, defer_small=False)
+    if not isinstance(value, bytes):
+        return value
+    return {"encoding": f"{codec.codec}+base64", "data": base64.b64encode(value).decode('ascii')}
+
+
+def decode_json_value(value, codec=None):
+    """Inverse of encode_json_value(); plain strings and None are returned unchanged."""
+    if isinstance(value, dict) and value.get("encoding", "").endswith("+base64"):
+        return (codec or ContentCodec('zlib')).decode(base64.b64decode(value["data"]))
+    return value
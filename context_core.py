@@ -0,0 +1,1491 @@
+#context_core.py
+
+"""
+The walk-and-parse core shared by build_code_db.py and build_code_json.py.
+
+build_outputs() walks a project once (or a git revision's tree, see
+git_source.py), classifies every path against the configuration sets
+below, reads and parses each file once, optionally in worker processes and
+through the shared parse cache, and hands every file's entry to each of a
+list of OutputSink objects, in walk order. The SQLite database
+(build_code_db.DatabaseSink) and the legacy JSON document
+(build_code_json.JsonSink) are sinks; another output format is another
+OutputSink subclass, and any combination of sinks is written in a single
+run (e.g. python build_code_db.py --json PATH), which costs one walk and
+one parse instead of one per artifact.
+
+Sinks that update a previous build in place report the directory
+fingerprints they stored; a directory is skipped only if every sink's
+stored fingerprint matches, and a file in a changed directory is read
+only if some sink's needs_file() asks for it.
+"""
+
+import os
+import re # For basic CSS parsing
+import traceback # For detailed error logging
+import hashlib # Content fingerprints for incremental rebuilds
+import mmap # Large files are mapped instead of copied into memory
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import parse_cache # Shared on-disk cache of parser output
+import python_symbols # Imports, classes and functions of Python modules
+import source_spans # Offset-based symbol sources
+import ignore_rules # .gitignore-aware path filtering for the walk
+import git_source # Trees and blobs of a git revision for --rev
+
+# Attempt to import HTML/CSS parsers, print warnings if not available
+try:
+    from bs4 import BeautifulSoup
+    from bs4 import Comment # Needed to exclude comments
+    from bs4 import Tag # Element type check for the single-pass HTML extractor
+    import lxml # BeautifulSoup backend for speed
+    HTML_PARSING_AVAILABLE = True
+except ImportError:
+    print("Warning: beautifulsoup4 or lxml not found. HTML parsing will be skipped.")
+    print("Install with: pip install beautifulsoup4 lxml")
+    HTML_PARSING_AVAILABLE = False
+
+# Attempt to import JS parser
+try:
+    import esprima
+    JS_PARSING_AVAILABLE = True
+except ImportError:
+    print("Warning: esprima library not found. JavaScript parsing (.js files and <script> tags) will be skipped.")
+    print("Install with: pip install esprima")
+    JS_PARSING_AVAILABLE = False
+
+
+# --- Configuration: Define File and Directory Handling ---
+# These lists and sets control which files and directories are included,
+# excluded, or handled specially during the project scan.
+# Place these prominently at the top so a new user can easily find and modify them.
+
+# Define directories to exclude from traversal (os.walk will not enter these).
+# This is suitable for dependency folders, build outputs, IDE configs, etc.
+# These directories (and their contents) will NOT appear in the 'directory_tree'.
+EXCLUDED_DIRS = {
+    '__pycache__', '.git', '.svn', '.hg', # Version control and cache
+    'node_modules', 'venv', '.venv', '__pypackages__', 'vendor', # Dependency directories
+    'dist', 'build', # Build/distribution directories
+    '.idea', '.vscode', '__pydevd_remote_debug_server__', # IDE specific directories
+    'chat_sessions', 'chat_logs',# Add other directories here as needed (e.g., 'logs', 'tmp', 'instance_data')
+}
+
+# Define specific filenames to exclude regardless of the directory they are in.
+# (These files will be listed in the directory_tree but WILL NOT have an entry
+# in the 'files' dictionary, nor will their content be read).
+EXCLUDED_FILENAMES = {
+    os.path.basename(__file__), # Exclude this module itself by name
+    '.env', # Explicitly exclude environment variable files
+    'build_code_db.py', 'build_code_json.py', 'create_context.py', 'recreate_structure.py', 'parse_cache.py', 'context_search.py', 'source_spans.py', 'content_codec.py', 'ignore_rules.py', 'file_watcher.py', 'git_source.py', 'context_snapshots.py', 'python_symbols.py', 'context_reader.py',# Add other specific filenames here (e.g., 'package-lock.json' if not managed by INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES)
+    'htmx.min.js' # Example, could also be handled by MANAGED_EXTENSIONS
+}
+
+# Define file extensions for files that are likely binary or sensitive.
+# (These files will be listed in the directory_tree but WILL NOT have an entry
+# in the 'files' dictionary, nor will their content be read).
+BINARY_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg', '.ico', # Images
+    '.mp4', '.mp3', '.avi', '.mov', '.webm', # Media
+    '.pdf', '.docx', '.xlsx', '.pptx', # Documents
+    '.bin', '.exe', '.dll', '.so', '.dylib', '.o', '.a', '.lib', '.class', '.pyc', '.pyd', # Binaries/Compiled
+    '.zip', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.rar', '.7z', # Archives
+    '.sqlite', '.db', '.sql', # Databases/SQL dumps (often binary or large text dumps)
+    '.pem', '.key', '.cer', '.crt', '.pfx', '.p12', # Keys/Certificates
+    '.lock', '.tmp', '.bak', '.swp', # Lock/Temp/Backup/Swap files
+    '.DS_Store', '.env.enc', # macOS specific / Encrypted files
+    # Add other binary or sensitive extensions here
+}
+
+# Define file extensions for text files whose *content* should generally be ignored,
+# preventing them from having an entry in the 'files' dictionary by default.
+# Useful for very large logs, generated code/data, or non-critical configuration files
+# whose content isn't needed for understanding the core project code logic.
+# Use INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES to override this for specific important files.
+IGNORED_TEXT_EXTENSIONS = {
+     '.json', '.jsonl', '.ndjson', # Data/Log files (unless specifically in INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES)
+     '.log', '.csv', '.tsv', # Data/Log files
+     '.txt', # Generic text files (unless specifically in INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES)
+     '.md', '.markdown', # Markdown (consider parsing if structure is needed, or add to INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES)
+     '.yml', '.yaml', '.toml', '.ini', # Configuration files (consider parsing or adding to INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES)
+     '.gitignore', '.dockerignore', '.eslintignore', # Ignore rules files
+     '.editorconfig', '.gitattributes', # Config files
+     # Dependency manifests - use INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES for key ones like requirements.txt or package.json
+     'package-lock.json', 'yarn.lock',
+     'Gemfile.lock', 'pom.xml', 'build.gradle', # Build/dependency definition files
+     # Add other extensions here
+}
+
+# Define specific filenames whose *content* SHOULD be included in the 'files' dictionary,
+# even if their extension is listed in IGNORED_TEXT_EXTENSIONS.
+# This is the "allow list" for content inclusion of otherwise ignored text file types.
+INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES = {
+    'requirements.txt',
+    'package.json',
+    'Gemfile',
+    # Add other specific project-critical config/text filenames here
+    # e.g., 'main_config.json', 'settings.ini'
+}
+
+
+# Define file extensions for files whose *content* should NOT be stored fully,
+# but which *should* still have an entry in the 'files' dictionary with metadata.
+# Useful for large static assets (like minified JS libraries, bundled CSS) that you want
+# the LLM to know exist, but whose source you don't need to manage or diff.
+# Their presence in the 'files' dict means they are 'acknowledged'.
+MANAGED_EXTENSIONS = {
+    '.min.js', '.bundle.js', '.css.map', '.js.map', # Example minified/bundled/map files
+    # Add other extensions here for files whose content should be omitted
+}
+
+# Define specific filenames that should be 'managed' regardless of extension.
+# (These files will have an entry in 'files' but with null content and metadata).
+MANAGED_FILENAMES = {
+    # Add specific filenames here if needed, e.g., 'large_asset.data'
+}
+
+
+# Define file extensions for files that should be read and parsed for structured information.
+# The full content of these files WILL be stored in the JSON, along with the parsed details.
+PARSEABLE_CODE_EXTENSIONS = {
+    '.py',
+    '.html', '.htm',
+    '.css',
+    '.js', '.mjs'
+    # Add other code/markup language extensions here (e.g., '.jsx', '.ts', '.tsx', '.vue')
+    # Note: If a .json file is in INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES and you want to parse its structure,
+    # you could add '.json' here and create a simple parse_json_file function.
+}
+
+# Versions of the individual parsers, used to key the shared parse cache.
+# Bump a parser's version whenever its output changes.
+PARSER_VERSIONS = {
+    'python': 2,
+    'html': 1,
+    'css': 2,
+    'javascript': 1,
+}
+
+
+# --- Helper Functions for HTML Parsing ---
+
+def _element_label(tag):
+    """Returns the ancestry-path label for a tag: its name plus #id and .classes when present."""
+    tag_repr = tag.name
+    if tag.get('id'): tag_repr += f"#{tag['id']}"
+    classes = tag.get('class')
+    if isinstance(classes, list) and classes: tag_repr += f".{'.'.join(classes)}"
+    return tag_repr
+
+
+HTMX_ATTR_REGEX = re.compile(r'^hx-.+')
+FORM_INPUT_TAGS = {'input', 'textarea', 'select'}
+# Direct children of <body> summarised in body_structure_preview, and the
+# elements (anywhere in <body>, with an id) used when there are none of those.
+BODY_PREVIEW_TAGS = {'div', 'section', 'article', 'main', 'aside', 'nav', 'header', 'footer', 'form', 'ul', 'ol', 'table', 'h1', 'h2', 'h3'}
+BODY_PREVIEW_FALLBACK_TAGS = {'div', 'section', 'article', 'nav', 'header', 'footer', 'form'}
+
+
+# Child properties visited for each esprima node type, in source order. Node types
+# are the esprima.Syntax string values, which the walk compares against directly;
+# types not listed here have no children of interest. Optional children (e.g. a
+# function's id) are simply None and skipped.
+_JS_CHILD_PROPS = {
+    'Program': ('body',), 'BlockStatement': ('body',), 'ClassBody': ('body',),
+    'ExpressionStatement': ('expression',),
+    'IfStatement': ('test', 'consequent', 'alternate'),
+    'LabeledStatement': ('body',),
+    'WithStatement': ('object', 'body'),
+    'SwitchStatement': ('discriminant', 'cases'),
+    'ReturnStatement': ('argument',), 'ThrowStatement': ('argument',), 'YieldExpression': ('argument',),
+    'AwaitExpression': ('argument',), 'SpreadElement': ('argument',), 'UnaryExpression': ('argument',),
+    'UpdateExpression': ('argument',),
+    'TryStatement': ('block', 'handler', 'finalizer'),
+    'CatchClause': ('param', 'body'),
+    'WhileStatement': ('test', 'body'), 'DoWhileStatement': ('test', 'body'),
+    'ForStatement': ('init', 'test', 'update', 'body'),
+    'ForInStatement': ('left', 'right', 'body'), 'ForOfStatement': ('left', 'right', 'body'),
+    'FunctionDeclaration': ('id', 'params', 'body'), 'FunctionExpression': ('id', 'params', 'body'),
+    'ArrowFunctionExpression': ('id', 'params', 'body'),
+    'VariableDeclaration': ('declarations',),
+    'VariableDeclarator': ('id', 'init'),
+    'ArrayExpression': ('elements',), 'ArrayPattern': ('elements',),
+    'ObjectExpression': ('properties',), 'ObjectPattern': ('properties',),
+    'Property': ('key', 'value'),
+    'SequenceExpression': ('expressions',),
+    'BinaryExpression': ('left', 'right'), 'LogicalExpression': ('left', 'right'), 'AssignmentExpression': ('left', 'right'),
+    'ConditionalExpression': ('test', 'consequent', 'alternate'),
+    'CallExpression': ('callee', 'arguments'), 'NewExpression': ('callee', 'arguments'),
+    'MemberExpression': ('object', 'property'),
+    'SwitchCase': ('test', 'consequent'),
+    'TemplateLiteral': ('quasis', 'expressions'),
+    'TaggedTemplateExpression': ('tag', 'quasi'),
+    'ClassDeclaration': ('id', 'superClass', 'body'), 'ClassExpression': ('id', 'superClass', 'body'),
+    'MethodDefinition': ('key', 'value'),
+    'ImportDeclaration': ('specifiers', 'source'),
+    'ExportNamedDeclaration': ('declaration', 'specifiers', 'source'),
+    'ExportDefaultDeclaration': ('declaration', 'specifiers', 'source'),
+    'ExportAllDeclaration': ('source',),
+}
+# The walk pushes children onto a stack, so it needs them last-to-first.
+_JS_CHILD_PROPS_REVERSED = {node_type: props[::-1] for node_type, props in _JS_CHILD_PROPS.items()}
+
+
+def _js_node_source(node, code_str):
+    """Returns the source text of an esprima node from its range (or loc indexes)."""
+    node_range = getattr(node, 'range', None)
+    if isinstance(node_range, list) and len(node_range) == 2:
+        return code_str[node_range[0]:node_range[1]]
+    elif hasattr(node, 'loc') and node.loc and \
+        hasattr(node.loc, 'start') and hasattr(node.loc.start, 'index') and \
+        hasattr(node.loc, 'end') and hasattr(node.loc.end, 'index'):
+        start_idx = node.loc.start.index
+        end_idx = node.loc.end.index
+        return code_str[start_idx:end_idx]
+    return "/* Source unavailable */"
+
+
+def _js_declared_names(declaration):
+    """Returns the names bound by an exported declaration (function, class or variable declaration)."""
+    if declaration is None:
+        return []
+    if declaration.type == 'VariableDeclaration':
+        return [d.id.name for d in declaration.declarations if getattr(d.id, 'type', None) == 'Identifier']
+    declaration_id = getattr(declaration, 'id', None)
+    return [declaration_id.name] if declaration_id else []
+
+
+def _extract_javascript_items(tree, js_code, include_declarations=False):
+    """
+    Walks an esprima AST and collects functions and addEventListener calls.
+
+    The walk uses an explicit stack (visiting nodes in the same pre-order as a
+    recursive walk), so deeply nested code cannot exhaust Python's recursion limit.
+    With include_declarations=True, classes, imports (including require() calls)
+    and exports are collected too, and each function records the index of the
+    class it is a method of in "class_index".
+
+    Returns:
+        A dict with 'functions' and 'event_listeners' lists, plus 'classes',
+        'imports' and 'exports' when include_declarations is set.
+    """
+    functions_found = []
+    event_listeners_found = []
+    classes_found = []
+    imports_found = []
+    exports_found = []
+
+    stack = [(tree, None, None)] # (node, parent_node, index of the enclosing class)
+    push, pop = stack.append, stack.pop
+    while stack:
+        node, parent_node, class_index = pop()
+        node_type = getattr(node, 'type', None)
+        if node_type is None: # Not a valid AST node (e.g. a hole in an array pattern)
+            continue
+
+        # --- Main Logic for Identifying JS Constructs ---
+        if node_type == 'FunctionDeclaration':
+            func_name = node.id.name if hasattr(node, 'id') and node.id else None
+            source_code = _js_node_source(node, js_code)
+            function_data = {
+                "type": "function_declaration", "name": func_name, "source_code": source_code,
+                "start_lineno": node.loc.start.line, "end_lineno": node.loc.end.line
+            }
+            if include_declarations: function_data["class_index"] = None
+            functions_found.append(function_data)
+        elif node_type == 'FunctionExpression' or node_type == 'ArrowFunctionExpression':
+            func_name = None
+            is_method = False
+            if parent_node:
+                if parent_node.type == 'VariableDeclarator' and \
+                   node is getattr(parent_node, 'init', None) and \
+                   hasattr(parent_node, 'id') and getattr(parent_node.id, 'type', None) == 'Identifier':
+                    func_name = parent_node.id.name
+                elif parent_node.type == 'MethodDefinition' and \
+                    node is getattr(parent_node, 'value', None) and \
+                    hasattr(parent_node, 'key') and getattr(parent_node.key, 'type', None) == 'Identifier':
+                    func_name = parent_node.key.name
+                elif parent_node.type == 'Property' and \
+                    node is getattr(parent_node, 'value', None) and \
+                    hasattr(parent_node, 'key'): # Key could be Identifier or Literal
+                    if getattr(parent_node.key, 'type', None) == 'Identifier':
+                        func_name = parent_node.key.name
+                    # If key is Literal (e.g. "myFunc": function(){}), func_name remains None or could be parent_node.key.value
+                is_method = parent_node.type == 'MethodDefinition'
+            source_code = _js_node_source(node, js_code)
+            function_data = {
+                "type": "function_expression" if node_type == 'FunctionExpression' else "arrow_function_expression",
+                "name": func_name, "source_code": source_code,
+                "start_lineno": node.loc.start.line, "end_lineno": node.loc.end.line
+            }
+            if include_declarations: function_data["class_index"] = class_index if is_method else None
+            functions_found.append(function_data)
+        elif node_type == 'CallExpression' and \
+            getattr(node.callee, 'type', None) == 'MemberExpression' and \
+            getattr(node.callee.property, 'type', None) == 'Identifier' and \
+            node.callee.property.name == 'addEventListener' and \
+            node.arguments is not None and len(node.arguments) >= 2:
+
+            target_source = _js_node_source(node.callee.object, js_code)
+            event_arg = node.arguments[0]
+            event_type = event_arg.value if hasattr(event_arg, 'value') and event_arg.type == 'Literal' else "<??>"
+            handler_arg = node.arguments[1]
+            handler_source = _js_node_source(handler_arg, js_code)
+            handler_name = handler_arg.name if hasattr(handler_arg, 'name') and handler_arg.type == 'Identifier' else None
+            full_call_source = _js_node_source(node, js_code)
+
+            event_listeners_found.append({
+                "target": target_source, "event_type": event_type,
+                "handler_source": handler_source, "handler_type": handler_arg.type, "handler_name": handler_name,
+                "source_code": full_call_source,
+                "start_lineno": node.loc.start.line, "end_lineno": node.loc.end.line
+            })
+        elif include_declarations:
+            if node_type == 'ClassDeclaration' or node_type == 'ClassExpression':
+                class_name = node.id.name if getattr(node, 'id', None) else None
+                if class_name is None and parent_node and parent_node.type == 'VariableDeclarator' and \
+                   getattr(parent_node.id, 'type', None) == 'Identifier':
+                    class_name = parent_node.id.name
+                class_index = len(classes_found)
+                classes_found.append({
+                    "type": "class_declaration" if node_type == 'ClassDeclaration' else "class_expression",
+                    "name": class_name,
+                    "superclass": _js_node_source(node.superClass, js_code) if getattr(node, 'superClass', None) else None,
+                    "methods": [
+                        {"name": member.key.name if getattr(member.key, 'type', None) == 'Identifier' else None,
+                         "kind": member.kind, "static": bool(member.static)}
+                        for member in node.body.body if member.type == 'MethodDefinition'
+                    ],
+                    "source_code": _js_node_source(node, js_code),
+                    "start_lineno": node.loc.start.line, "end_lineno": node.loc.end.line
+                })
+            elif node_type == 'ImportDeclaration':
+                specifiers = []
+                for spec in node.specifiers:
+                    if spec.type == 'ImportDefaultSpecifier': imported = "default"
+                    elif spec.type == 'ImportNamespaceSpecifier': imported = "*"
+                    else: imported = spec.imported.name
+                    specifiers.append({"imported": imported, "local": spec.local.name})
+                imports_found.append({
+                    "kind": "import", "module": node.source.value, "specifiers": specifiers,
+                    "source_code": _js_node_source(node, js_code),
+                    "start_lineno": node.loc.start.line, "end_lineno": node.loc.end.line
+                })
+            elif node_type == 'CallExpression' and \
+                getattr(node.callee, 'type', None) == 'Identifier' and node.callee.name == 'require' and \
+                len(node.arguments) == 1 and node.arguments[0].type == 'Literal' and isinstance(node.arguments[0].value, str):
+                imports_found.append({
+                    "kind": "require", "module": node.arguments[0].value, "specifiers": [],
+                    "source_code": _js_node_source(node, js_code),
+                    "start_lineno": node.loc.start.line, "end_lineno": node.loc.end.line
+                })
+            elif node_type in ('ExportNamedDeclaration', 'ExportDefaultDeclaration', 'ExportAllDeclaration'):
+                export_source = getattr(node, 'source', None)
+                if node_type == 'ExportDefaultDeclaration':
+                    export_kind, names = "default", ["default"]
+                elif node_type == 'ExportAllDeclaration':
+                    export_kind, names = "all", ["*"]
+                else:
+                    export_kind = "named"
+                    names = _js_declared_names(getattr(node, 'declaration', None)) + [spec.exported.name for spec in node.specifiers]
+                exports_found.append({
+                    "kind": export_kind, "names": names, "module": export_source.value if export_source else None,
+                    "source_code": _js_node_source(node, js_code),
+                    "start_lineno": node.loc.start.line, "end_lineno": node.loc.end.line
+                })
+
+        # --- Traversal of Children ---
+        # Push children in reverse so they are popped (visited) in source order.
+        for prop_name in _JS_CHILD_PROPS_REVERSED.get(node_type, ()):
+            child_value = getattr(node, prop_name, None)
+            if child_value is None:
+                continue
+            if isinstance(child_value, list):
+                for item in reversed(child_value):
+                    push((item, node, class_index))
+            else:
+                push((child_value, node, class_index))
+
+    items = {"functions": functions_found, "event_listeners": event_listeners_found}
+    if include_declarations:
+        items.update(classes=classes_found, imports=imports_found, exports=exports_found)
+    return items
+
+
+def _report_javascript_error(e, context_msg):
+    """Prints an esprima syntax error and returns its message."""
+    error_message = getattr(e, 'message', str(e))
+    line_num_str = str(getattr(e, 'lineNumber', 'N/A'))
+    col_num_str = str(getattr(e, 'column', 'N/A'))
+
+    if f"(line {line_num_str}, column {col_num_str})" in error_message:
+        print(f"JavaScript Parse Error{context_msg}: {error_message}")
+    else:
+        print(f"JavaScript Parse Error{context_msg}: {error_message} (line {line_num_str}, column {col_num_str})")
+    return error_message
+
+
+def parse_javascript_content(js_code: str, html_filepath: str = None) -> dict:
+    """
+    Parses JavaScript code to extract functions and addEventListener calls.
+    html_filepath is optional, for context in error messages.
+    """
+    if not JS_PARSING_AVAILABLE:
+        return {"error": "JavaScript parsing skipped: esprima not installed.", "source_file_context": html_filepath}
+    if not js_code.strip():
+        return {"message": "Script content is empty or whitespace.", "source_file_context": html_filepath}
+
+    try:
+        tree = esprima.parseScript(js_code, {"loc": True, "range": True, "comment": False, "tokens": False})
+        items = _extract_javascript_items(tree, js_code)
+
+        return {
+            "functions": items["functions"],
+            "event_listeners": items["event_listeners"],
+            "source_file_context": html_filepath # Also add context on success
+        }
+    except esprima.Error as e:
+        context_msg = f" in inline script of '{html_filepath}'" if html_filepath else ""
+        error_message = _report_javascript_error(e, context_msg)
+
+        return {
+            "error": f"JavaScript syntax error{context_msg}: {error_message}",
+            "full_content_on_error": js_code,
+            "source_file_context": html_filepath
+        }
+    except Exception as e:
+        context_msg = f" in inline script of '{html_filepath}'" if html_filepath else ""
+        print(f"Unexpected JavaScript parsing error{context_msg}: {e}")
+        # import traceback
+        # print(traceback.format_exc()) # Uncomment for full traceback during debugging
+        return {
+            "error": f"Unexpected JavaScript parsing error{context_msg}: {str(e)}",
+            "full_content_on_error": js_code,
+            "source_file_context": html_filepath
+        }
+
+
+def parse_javascript_file(filepath, content):
+    """
+    Parses a standalone JavaScript file (.js or .mjs) into functions, classes,
+    imports, exports and event listeners.
+
+    .mjs files are parsed as ES modules. .js files are parsed as classic scripts
+    first and, if that fails (e.g. because they use import/export), as modules;
+    "source_type" records which one succeeded.
+    """
+    file_data = {
+        "path": filepath, "type": "javascript", "source_type": None,
+        "functions": [], "classes": [], "imports": [], "exports": [], "event_listeners": [],
+        "start_lineno": 1, "end_lineno": len(content.splitlines()), "full_content": content
+    }
+    if not content.strip():
+        file_data["message"] = "File is empty or contains only whitespace."
+        return file_data
+
+    parse_options = {"loc": True, "range": True, "comment": False, "tokens": False}
+    source_types = ['module'] if filepath.lower().endswith('.mjs') else ['script', 'module']
+    first_error = None
+    for source_type in source_types:
+        try:
+            if source_type == 'module': tree = esprima.parseModule(content, parse_options)
+            else: tree = esprima.parseScript(content, parse_options)
+        except esprima.Error as e:
+            first_error = first_error or e
+            continue
+        except Exception as e:
+            print(f"Unexpected JavaScript parsing error in {filepath}: {e}")
+            file_data.update({"type": "javascript_error", "error": str(e)})
+            return file_data
+        file_data["source_type"] = source_type
+        file_data.update(_extract_javascript_items(tree, content, include_declarations=True))
+        return file_data
+
+    # Report the error from the first attempt; for a .js file that is the classic-script parse.
+    error_message = _report_javascript_error(first_error, f" in '{filepath}'")
+    file_data.update({"type": "javascript_error", "error": f"JavaScript syntax error: {error_message}"})
+    return file_data
+
+
+def extract_html_details(soup, filepath, file_data):
+    """
+    Fills parse_html_file()'s file_data from an already parsed soup, whose comments it removes.
+
+    The soup is traversed once, in document order, with an explicit stack that
+    carries each element's ancestry path (relative to <body>) and its enclosing
+    forms, so no element is searched for or walked up to the root more than once.
+    """
+    comment_nodes = []
+    title_tag = None
+    body_tag = None
+    fallback_preview_elements = []
+    text_cache = {}
+
+    def text_snippet(element):
+        # get_text walks the whole subtree, so compute it at most once per element.
+        key = id(element)
+        if key not in text_cache:
+            text = element.get_text(strip=True)
+            text_cache[key] = (text[:100] + "...") if text else None
+        return text_cache[key]
+
+    # (node, ancestry path of the node, form_data dicts of the forms enclosing it, node is inside <body>)
+    stack = [(soup, [], (), False)]
+    while stack:
+        tag, ancestry_path, enclosing_forms, in_body = stack.pop()
+        name = tag.name
+
+        if tag is not soup:
+            if name == 'title' and title_tag is None:
+                title_tag = tag
+            elif name == 'body' and body_tag is None:
+                body_tag = tag
+
+            if name == 'form':
+                form_data = {"id": tag.get('id'), "action": tag.get('action'), "method": tag.get('method'), "inputs": [], "ancestry_path": ancestry_path}
+                file_data["forms"].append(form_data)
+            elif name in FORM_INPUT_TAGS:
+                for form_data in enclosing_forms:
+                    form_data["inputs"].append({
+                        "tag": name, "type": tag.get('type'), "name": tag.get('name'),
+                        "id": tag.get('id'), "value": tag.get('value'),
+                        "placeholder": tag.get('placeholder'), "required": tag.get('required') is not None
+                    })
+            elif name == 'a':
+                link_data = {"text": tag.get_text(strip=True), "href": tag.get('href'), "ancestry_path": ancestry_path}
+                if link_data["text"] or link_data["href"]: file_data["links"].append(link_data)
+            elif name == 'img':
+                img_data = {"src": tag.get('src'), "alt": tag.get('alt'), "width": tag.get('width'), "height": tag.get('height'), "ancestry_path": ancestry_path}
+                if img_data["src"]: file_data["images"].append(img_data)
+            elif name == 'script':
+                start_line_html = tag.sourceline if hasattr(tag, 'sourceline') and isinstance(tag.sourceline, int) else None
+                end_line_html = (start_line_html + len(str(tag).splitlines()) - 1) if start_line_html is not None else None
+
+                script_data = {
+                    "src": tag.get('src'), "type": tag.get('type', 'text/javascript'),
+                    "content": None, "parsed_js": None,
+                    "start_lineno_html": start_line_html, "end_lineno_html": end_line_html,
+                    "ancestry_path": ancestry_path
+                }
+                if tag.string:
+                    inline_content = tag.string.strip()
+                    script_data["content"] = inline_content
+                    if JS_PARSING_AVAILABLE and inline_content:
+                        # Pass the HTML filepath for context in case of JS errors
+                        script_data["parsed_js"] = parse_javascript_content(inline_content, html_filepath=filepath)
+                        if script_data["parsed_js"] and isinstance(script_data["parsed_js"], dict) and start_line_html is not None:
+                            for item_list_key in ["functions", "event_listeners"]:
+                                for item in script_data["parsed_js"].get(item_list_key, []):
+                                    if item.get("start_lineno") is not None: # Original line no from esprima
+                                        item["start_lineno_file"] = item["start_lineno"] + start_line_html - 1
+                                        item["end_lineno_file"] = item["end_lineno"] + start_line_html - 1
+                                    else: # Should not happen if esprima provides loc
+                                        item["start_lineno_file"] = None
+                                        item["end_lineno_file"] = None
+                if script_data.get("src") or script_data.get("content"):
+                    file_data["scripts"].append(script_data)
+            elif name == 'style':
+                if tag.string:
+                    start_line_html = tag.sourceline if hasattr(tag, 'sourceline') and isinstance(tag.sourceline, int) else None
+                    end_line_html = (start_line_html + len(str(tag).splitlines()) - 1) if start_line_html is not None else None
+                    file_data["inline_styles"].append({
+                        "type": tag.get('type', 'text/css'), "content": tag.string.strip(),
+                        "start_lineno_html": start_line_html, "end_lineno_html": end_line_html,
+                        "ancestry_path": ancestry_path
+                    })
+
+            # startswith() first, so most attributes never reach the regex.
+            hx_attributes = {attr: value for attr, value in tag.attrs.items()
+                             if isinstance(attr, str) and attr.startswith('hx-') and HTMX_ATTR_REGEX.match(attr)} if tag.attrs else None
+            if hx_attributes:
+                file_data["htmx_elements"].append({
+                    "tag": name, "id": tag.get('id'), "classes": tag.get('class'),
+                    "hx_attributes": hx_attributes,
+                    "text_snippet": text_snippet(tag),
+                    "ancestry_path": ancestry_path
+                })
+
+            if in_body:
+                if name in BODY_PREVIEW_TAGS and tag.parent is body_tag:
+                    file_data["body_structure_preview"].append({
+                        "tag": name, "id": tag.get('id'), "classes": tag.get('class'),
+                        "text_snippet": text_snippet(tag),
+                        "ancestry_path": ancestry_path
+                    })
+                if name in BODY_PREVIEW_FALLBACK_TAGS and tag.get('id') is not None:
+                    fallback_preview_elements.append((tag, ancestry_path))
+
+        child_tags = []
+        for child in reversed(tag.contents):
+            if isinstance(child, Tag):
+                child_tags.append(child)
+            elif isinstance(child, Comment):
+                comment_nodes.append(child)
+        if not child_tags:
+            continue # Leaves (img, input, option, ...) need no ancestry label
+        # Children of <body> get a fresh ancestry path; <body> itself and everything above it is omitted.
+        if tag is body_tag:
+            child_path, child_in_body = [], True
+        else:
+            child_path, child_in_body = ancestry_path + [_element_label(tag)], in_body
+        child_forms = enclosing_forms + (form_data,) if name == 'form' else enclosing_forms
+        for child in child_tags:
+            stack.append((child, child_path, child_forms, child_in_body))
+
+    # Comments are dropped from the document so they cannot stand in for a tag's text.
+    for comment_node in comment_nodes:
+        comment_node.extract()
+
+    if title_tag and title_tag.string:
+        file_data["title"] = title_tag.string.strip()
+
+    if body_tag and not file_data["body_structure_preview"]: # Fallback
+        for element, ancestry_path in fallback_preview_elements:
+            preview_data = {
+                "tag": element.name, "id": element.get('id'), "classes": element.get('class'),
+                "text_snippet": text_snippet(element),
+                "ancestry_path": ancestry_path
+            }
+            if preview_data not in file_data["body_structure_preview"]:
+                file_data["body_structure_preview"].append(preview_data)
+
+
+def parse_html_file(filepath, content):
+    """
+    Parses an HTML file's content for structure, forms, links, scripts, styles, etc.
+
+    The content is parsed into a BeautifulSoup tree with lxml; the details are
+    then read from it by extract_html_details().
+    """
+    file_data = {
+        "path": filepath, "type": "html", "title": None, "forms": [], "links": [],
+        "images": [], "htmx_elements": [], "scripts": [], "inline_styles": [],
+        "body_structure_preview": [],
+        "start_lineno": 1, "end_lineno": len(content.splitlines()), "full_content": content
+    }
+    if not content.strip():
+        file_data["message"] = "File is empty or contains only whitespace."
+        return file_data
+    if not HTML_PARSING_AVAILABLE:
+        file_data.update({"type": "html_skipped", "message": "HTML parsing skipped: beautifulsoup4 or lxml not installed."})
+        return file_data
+
+    try:
+        soup = BeautifulSoup(content, 'lxml') # Removed from_encoding
+        extract_html_details(soup, filepath, file_data)
+    except Exception as e:
+        print(f"Error parsing HTML file {filepath}: {e}")
+        # print(traceback.format_exc()) # Uncomment for debugging
+        file_data.update({"type": "html_error", "error": str(e)})
+    return file_data
+
+# --- Helper Function for Basic CSS Parsing ---
+
+# Significant CSS tokens: comments, strings and block/statement delimiters.
+# Everything between them is prelude or declaration text. Unterminated
+# comments run to the end of the file and unterminated strings to the end of
+# the line, as in the CSS syntax spec.
+CSS_TOKEN_REGEX = re.compile(r'/\*.*?(?:\*/|\Z)|"(?:\\.|[^"\\\n])*"?|\'(?:\\.|[^\'\\\n])*\'?|[{};]', re.DOTALL)
+# Tokens inside a selector list that matter when splitting it on commas.
+CSS_SELECTOR_TOKEN_REGEX = re.compile(r'"(?:\\.|[^"\\])*"?|\'(?:\\.|[^\'\\])*\'?|[()\[\],]')
+# At-rules whose block holds further rules rather than declarations. Their
+# preludes become the at_rule_context of the rules inside them; any other
+# at-rule with a block (e.g. @font-face, @page) is recorded as a rule itself.
+CSS_GROUPING_AT_RULES = {
+    'media', 'supports', 'document', '-moz-document', 'layer', 'container', 'scope', 'starting-style',
+    'keyframes', '-webkit-keyframes', '-moz-keyframes', '-o-keyframes',
+}
+
+
+def _split_css_selectors(prelude):
+    """Splits a selector list on top-level commas (not inside (), [] or strings)."""
+    selectors = []
+    depth = 0
+    start = 0
+    for match in CSS_SELECTOR_TOKEN_REGEX.finditer(prelude):
+        token = match.group()
+        if token in '([': depth += 1
+        elif token in ')]': depth = max(0, depth - 1)
+        elif token == ',' and depth == 0:
+            selectors.append(prelude[start:match.start()])
+            start = match.end()
+    selectors.append(prelude[start:])
+    return [s.strip() for s in selectors if s.strip()]
+
+
+def parse_css_file(filepath, content):
+    """
+    Parses a CSS file's content into rules with their selectors and line spans.
+
+    A single pass over the significant tokens (comments, strings, braces and
+    semicolons) tracks nested blocks and the current line number, so the cost
+    is linear in the size of the stylesheet. Rules nested in grouping at-rules
+    such as @media or @supports are included, each with the preludes of its
+    enclosing at-rules (outermost first) in "at_rule_context". Comments are
+    left out of selectors; statement at-rules like @import are skipped.
+    """
+    file_data = {
+        "path": filepath, "type": "css", "rules": [],
+        "start_lineno": 1, "end_lineno": len(content.splitlines()), "full_content": content
+    }
+    if not content.strip():
+        file_data["message"] = "File is empty or contains only whitespace."
+        return file_data
+
+    open_blocks = [] # (rule_data or None, start offset, whether the block is a grouping at-rule) per open '{'
+    at_rule_context = [] # Preludes of the enclosing grouping at-rules
+    prelude_parts = [] # Text of the current prelude, without comments
+    prelude_start = None # Offset of its first significant character
+    prelude_lineno = None
+    lineno = 1 # Line number at offset line_pos
+    line_pos = 0
+    pos = 0
+
+    def note_prelude_text(text, offset):
+        nonlocal prelude_start, prelude_lineno, lineno, line_pos
+        if prelude_start is None:
+            stripped = text.lstrip()
+            if not stripped:
+                return
+            prelude_start = offset + len(text) - len(stripped)
+            lineno += content.count('\n', line_pos, prelude_start)
+            line_pos = prelude_start
+            prelude_lineno = lineno
+        prelude_parts.append(text)
+
+    for match in CSS_TOKEN_REGEX.finditer(content):
+        token_start = match.start()
+        if token_start > pos:
+            note_prelude_text(content[pos:token_start], pos)
+        token = match.group()
+        pos = match.end()
+
+        if token == '{':
+            prelude = ''.join(prelude_parts).strip()
+            if prelude.startswith('@'):
+                at_rule_name = prelude[1:].split(None, 1)[0].split('(', 1)[0].lower() if len(prelude) > 1 else ''
+                is_grouping = at_rule_name in CSS_GROUPING_AT_RULES
+                selectors = None if is_grouping else [prelude]
+            else:
+                is_grouping = False
+                selectors = _split_css_selectors(prelude)
+            rule_data = None
+            if selectors:
+                rule_data = {
+                    "selectors": selectors,
+                    "source_code": None, # Filled in when the block closes
+                    "start_lineno": prelude_lineno,
+                    "end_lineno": None,
+                    "at_rule_context": list(at_rule_context)
+                }
+                file_data["rules"].append(rule_data)
+            open_blocks.append((rule_data, prelude_start, is_grouping))
+            if is_grouping:
+                at_rule_context.append(prelude)
+        elif token == '}':
+            if open_blocks:
+                rule_data, block_start, is_grouping = open_blocks.pop()
+                if is_grouping:
+                    at_rule_context.pop()
+                if rule_data is not None:
+                    lineno += content.count('\n', line_pos, token_start)
+                    line_pos = token_start
+                    rule_data["source_code"] = content[block_start:pos]
+                    rule_data["end_lineno"] = lineno
+        elif token == ';':
+            pass # End of a declaration or statement at-rule (e.g. @import); neither is recorded
+        else: # Comment or string
+            if token[0] != '/': note_prelude_text(token, token_start)
+            continue
+        prelude_parts = []
+        prelude_start = None
+
+    # Blocks still open at the end of the file are closed by it, as browsers do.
+    for rule_data, block_start, _ in open_blocks:
+        if rule_data is not None:
+            rule_data["source_code"] = content[block_start:].rstrip()
+            rule_data["end_lineno"] = rule_data["start_lineno"] + rule_data["source_code"].count('\n')
+    return file_data
+
+
+# --- Per-File Processing (runs in worker processes with --jobs) ---
+
+# Files at least this large are memory-mapped rather than read into a bytes object.
+MMAP_THRESHOLD = 1024 * 1024
+# A NUL byte among this many leading bytes marks a file as binary, whatever its extension.
+BINARY_SNIFF_BYTES = 8192
+
+
+def _count_newlines(buffer):
+    """Counts b'\\n' in a bytes object or an mmap (which has no count(), so it is scanned in chunks)."""
+    if isinstance(buffer, bytes):
+        return buffer.count(b'\n')
+    count = 0
+    for start in range(0, len(buffer), MMAP_THRESHOLD):
+        count += buffer[start:start + MMAP_THRESHOLD].count(b'\n')
+    return count
+
+
+def _ingest_file(filepath, decode=True):
+    """
+    Reads a file exactly once and derives everything the builder needs from that one buffer.
+
+    filepath may also be the file's contents as bytes (a git blob read for
+    --rev), which are then used as the buffer.
+
+    Files of MMAP_THRESHOLD bytes or more are memory-mapped, so hashing and
+    decoding work straight off the page cache without an intermediate copy.
+    With decode=True the first BINARY_SNIFF_BYTES are checked for NUL bytes
+    before anything else; a binary file is neither hashed nor decoded, and if
+    it is mapped the rest of it is never paged in.
+
+    Returns:
+        A (kind, content, content_hash, line_count, io_stats) tuple. kind is
+        'text' (content holds the decoded text, with newlines translated as
+        text-mode open() would), 'non_utf8', 'binary', or 'bytes' when
+        decode=False. line_count is the b'\\n' count plus one, computed only
+        when there is no content to count lines in. io_stats is
+        (bytes_read, file_size). Raises OSError if the file cannot be read.
+    """
+    if isinstance(filepath, bytes):
+        buffer = filepath
+        size = len(buffer)
+    else:
+        with open(filepath, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size >= MMAP_THRESHOLD else f.read()
+    try:
+        if decode:
+            head = buffer[:BINARY_SNIFF_BYTES]
+            if b'\0' in head:
+                return 'binary', None, None, None, (len(head) if isinstance(buffer, mmap.mmap) else len(buffer), size)
+        io_stats = (len(buffer), size)
+        content_hash = hashlib.sha256(buffer).hexdigest()
+        if not decode:
+            return 'bytes', None, content_hash, _count_newlines(buffer) + 1, io_stats
+        try:
+            content = str(buffer, 'utf-8')
+        except UnicodeDecodeError:
+            return 'non_utf8', None, content_hash, _count_newlines(buffer) + 1, io_stats
+        if '\r' in content:
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+        return 'text', content, content_hash, None, io_stats
+    finally:
+        if isinstance(buffer, mmap.mmap):
+            buffer.close()
+
+
+def _parser_identity(file_extension_lower):
+    """Returns the (name, version) of the parser used for an extension, or None if it is not parsed."""
+    if file_extension_lower == '.py':
+        return 'python', PARSER_VERSIONS['python']
+    if file_extension_lower in ('.html', '.htm') and HTML_PARSING_AVAILABLE:
+        # Inline scripts are only parsed when esprima is installed, which changes the output.
+        return ('html+js' if JS_PARSING_AVAILABLE else 'html'), PARSER_VERSIONS['html']
+    if file_extension_lower == '.css':
+        return 'css', PARSER_VERSIONS['css']
+    if file_extension_lower in ('.js', '.mjs') and JS_PARSING_AVAILABLE:
+        return 'javascript', PARSER_VERSIONS['javascript']
+    return None
+
+
+def _process_file(task):
+    """
+    Reads and parses a single file, returning a (status, file_details, content_hash, cache_entry, io_stats) tuple.
+
+    This is the unit of work sent to worker processes when building with --jobs,
+    so it must stay a picklable top-level function with no side effects beyond
+    the parsers' own warnings. status is one of 'managed', 'parsed',
+    'html_skipped', 'js_skipped', 'non_utf8', 'read_error', 'unchanged' or
+    'binary' (NUL bytes near the start; file_details is None and the file
+    gets no entry).
+    The file is read once, by _ingest_file() (filepath holds the blob's
+    bytes instead with --rev); io_stats is its (bytes_read, file_size), or
+    (0, 0) if it could not be opened. When a text file still hashes to
+    known_hash, the hash of the entry the sinks already hold, it is not
+    parsed and status is 'unchanged', with file_details None.
+
+    When a parse cache path is given, parseable files are looked up there first.
+    cache_entry is then (key, None) for a hit or (key, blob) for a fresh result
+    the main process should store (blob is None if the result was not
+    serializable), and None when the cache was not consulted.
+    """
+    filepath, relative_filepath, file_extension_lower, is_allow_listed, is_managed, cache_path, known_hash = task
+
+    # 3. MANAGED_FILENAMES or MANAGED_EXTENSIONS: metadata only
+    if is_managed:
+        try:
+            _, _, content_hash, line_count_m, io_stats = _ingest_file(filepath, decode=False)
+        except Exception:
+            line_count_m, content_hash, io_stats = 1, None, (0, 0)
+        managed_entry = {
+            "path": relative_filepath, "type": "managed_static",
+            "message": "Content managed externally or omitted for brevity.",
+            "full_content": None, "start_lineno": 1, "end_lineno": max(1, line_count_m)
+        }
+        return 'managed', managed_entry, content_hash, None, io_stats
+
+    # 4. Allow-listed files (INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES) and
+    # 6. default processing for other text files (parseable or generic)
+    # share the same reading logic; only the entry types and messages differ.
+    type_suffix = "_on_allow_list" if is_allow_listed else ""
+    status = 'parsed'
+    cache_entry = None
+    try:
+        kind, content, content_hash, line_count_rb, io_stats = _ingest_file(filepath)
+    except Exception as e:
+        message = f"Error reading allow-listed file: {e}" if is_allow_listed else f"Error reading file: {e}"
+        error_details = {"path": relative_filepath, "type": f"read_error{type_suffix}", "error": str(e), "message": message, "start_lineno": 1, "end_lineno": 1}
+        return 'read_error', error_details, None, None, (0, 0)
+    if kind == 'binary':
+        return 'binary', None, None, None, io_stats
+    if kind == 'non_utf8':
+        message = "File on allow-list skipped due to non-UTF-8 encoding." if is_allow_listed else "File skipped due to non-UTF-8 encoding."
+        error_details = {"path": relative_filepath, "type": "skipped_non_utf8", "message": message, "start_lineno": 1, "end_lineno": line_count_rb}
+        return 'non_utf8', error_details, content_hash, None, io_stats
+    if known_hash is not None and content_hash == known_hash:
+        # Touched but not modified: the sinks keep the entry they have.
+        return 'unchanged', None, content_hash, None, io_stats
+
+    try:
+        line_count = max(1, len(content.splitlines()))
+
+        parser_identity = _parser_identity(file_extension_lower) if cache_path else None
+        if parser_identity:
+            cache_key = parse_cache.make_key(parser_identity[0], parser_identity[1], relative_filepath, content_hash)
+            cached_blob = parse_cache.lookup(cache_path, cache_key)
+            cached_details = parse_cache.decode(cached_blob, content) if cached_blob is not None else None
+            if cached_details is not None:
+                return status, cached_details, content_hash, (cache_key, None), io_stats
+
+        if file_extension_lower in PARSEABLE_CODE_EXTENSIONS:
+            if file_extension_lower == '.py': file_details = python_symbols.parse_python_file(relative_filepath, content)
+            elif file_extension_lower in ('.html', '.htm'):
+                if HTML_PARSING_AVAILABLE: file_details = parse_html_file(relative_filepath, content)
+                else:
+                    file_details = {"path": relative_filepath, "type": "html_skipped", "message": "HTML parsing skipped: libraries missing.", "full_content": content, "start_lineno": 1, "end_lineno": line_count}
+                    status = 'html_skipped'
+            elif file_extension_lower == '.css': file_details = parse_css_file(relative_filepath, content)
+            elif file_extension_lower in ('.js', '.mjs'):
+                if JS_PARSING_AVAILABLE: file_details = parse_javascript_file(relative_filepath, content)
+                else:
+                    file_details = {"path": relative_filepath, "type": "javascript_skipped", "message": "JavaScript parsing skipped: esprima not installed.", "full_content": content, "start_lineno": 1, "end_lineno": line_count}
+                    status = 'js_skipped'
+            else: # Should not be reached if PARSEABLE_CODE_EXTENSIONS is well-defined
+                file_details = {"path": relative_filepath, "type": f"unhandled_parseable{type_suffix}", "full_content": content, "start_lineno": 1, "end_lineno": line_count}
+        else: # Generic text file (or allow-listed config file) - store as generic text
+            file_details = {"path": relative_filepath, "type": file_extension_lower[1:] if file_extension_lower else "plaintext", "full_content": content, "start_lineno": 1, "end_lineno": line_count}
+        if parser_identity:
+            cache_entry = (cache_key, parse_cache.encode(file_details, content))
+        return status, file_details, content_hash, cache_entry, io_stats
+
+    except Exception as e: # The parsers handle their own errors; this is a last resort
+        message = f"Error reading allow-listed file: {e}" if is_allow_listed else f"Error reading file: {e}"
+        error_details = {"path": relative_filepath, "type": f"read_error{type_suffix}", "error": str(e), "message": message, "start_lineno": 1, "end_lineno": content.count('\n') + 1}
+        return 'read_error', error_details, content_hash, None, io_stats
+
+
+def _ordered_map(func, items, jobs=1):
+    """
+    Applies func to the payload of each (payload, context) pair, yielding (context, result)
+    in input order. A None payload is not processed and yields a None result.
+
+    With jobs > 1 the calls run in a ProcessPoolExecutor; at most a few tasks per
+    worker are in flight at once, so results are written as they arrive without
+    the whole tree being buffered, and the output order matches a serial run.
+    """
+    if jobs is None or jobs <= 1:
+        for payload, context in items:
+            yield context, (func(payload) if payload is not None else None)
+        return
+
+    max_in_flight = jobs * 4
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for payload, context in items:
+            pending.append((executor.submit(func, payload) if payload is not None else None, context))
+            if len(pending) >= max_in_flight:
+                future, ctx = pending.popleft()
+                yield ctx, (future.result() if future is not None else None)
+        while pending:
+            future, ctx = pending.popleft()
+            yield ctx, (future.result() if future is not None else None)
+
+
+def apply_default_permissions(path):
+    """Gives a mkstemp() file the permissions a plain open() would have (mkstemp uses 0600)."""
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(path, 0o666 & ~umask)
+
+
+# --- The Walk ---
+
+def make_path_filter(root_dir, use_gitignore=True, ignore_file=None):
+    """Returns the PathFilter for a walk: the configuration sets above plus .gitignore and project ignore files."""
+    return ignore_rules.PathFilter(root_dir, EXCLUDED_DIRS, EXCLUDED_FILENAMES, BINARY_EXTENSIONS, IGNORED_TEXT_EXTENSIONS,
+                                   MANAGED_EXTENSIONS, MANAGED_FILENAMES, INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES,
+                                   use_gitignore=use_gitignore, ignore_file=ignore_file)
+
+
+def tree_parent(path):
+    """Returns the directory tree path of the directory containing path ('' at the top level)."""
+    head, _, _ = path.rstrip('/').rpartition('/')
+    return f"{head}/" if head else ''
+
+
+def _directory_fingerprint(records):
+    """
+    Returns the Merkle fingerprint of a directory from one record per listed child.
+
+    A file's record holds its name and how it is handled, plus its size and
+    mtime when its content is read; a subdirectory's holds its name and its own
+    fingerprint. Any change below a directory therefore changes the fingerprint
+    of every directory above it, and an equal fingerprint means nothing in the
+    subtree needs to be re-read, re-parsed or re-written.
+    """
+    digest = hashlib.sha256()
+    for record in sorted(records):
+        digest.update(record.encode('utf-8', 'surrogateescape'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+# --- Output Sinks ---
+
+class OutputSink:
+    """
+    One output written by build_outputs().
+
+    The base class describes an output that is written from scratch on every
+    build: it keeps nothing from a previous build and wants every file.
+    Subclasses implement add_file() and override whichever other hooks they
+    need. The hooks are called from the main process, in the order they are
+    defined here, and all sinks of a build see the same entries in the same
+    (walk) order.
+    """
+
+    # Where the output ends up, for the build summary.
+    output_filename = None
+
+    def open(self):
+        """Prepares the output before the walk. Returns False, after printing why, if the build should not go ahead."""
+        return True
+
+    def own_paths(self, root_dir):
+        """Returns the paths, relative to root_dir, of files the sink writes while building; they are left out of the walk."""
+        return ()
+
+    def stored_fingerprints(self):
+        """
+        Returns {directory path: fingerprint} ('' for the root) of the previous
+        build this sink updates in place, or None if it is written from scratch.
+        """
+        return None
+
+    def begin(self, build):
+        """Called with the ProjectBuild once the tree has been walked, before any file is read."""
+
+    def needs_file(self, relative_filepath, stat_result):
+        """
+        Reports whether the sink wants the entry of a file in a directory that changed.
+
+        stat_result is None for files that could not be statted and for files
+        read from a git revision. A file is read and parsed if any sink wants it.
+        """
+        return True
+
+    def stored_content_hash(self, relative_filepath):
+        """
+        Returns the content hash of the entry the sink already holds for a file it wants, or None.
+
+        When every sink that wants the file returns the same hash and the file
+        still hashes to it, the file is not parsed: add_file() gets None for
+        file_details and the sink keeps its stored entry.
+        """
+        return None
+
+    def add_file(self, relative_filepath, file_details, content_hash, stat_result):
+        """
+        Writes one file's entry. file_details is shared with the other sinks and must not be modified.
+
+        file_details is None only for a file whose content_hash matched the
+        sink's stored_content_hash().
+        """
+        raise NotImplementedError
+
+    def finish(self, build):
+        """Completes the output after the last entry. Returns False, after printing why, if it could not be written."""
+        return True
+
+    def abort(self):
+        """Discards a partial output when the build fails before finish() is reached."""
+
+    def print_summary(self, build):
+        """Prints this output's own lines of the build summary."""
+
+
+class ProjectBuild:
+    """
+    What one build_outputs() run found: the walked tree and the summary counters.
+
+    directories holds a (dir_path, files, subdir_paths, records) tuple per
+    walked directory, in walk order. dir_path is '' for the root and 'a/b/'
+    otherwise; files holds a (relative_filepath, task, stat_result) triple per
+    listed file, where task is None for files that are only listed in the
+    directory tree. tree_fingerprints maps every walked or skipped directory
+    to its Merkle fingerprint. skipped_dirs are the directories whose
+    fingerprint matched every sink's stored one; the skipped_file_count
+    files in them were neither read nor offered to the sinks. scan_dirs is
+    the set of directories listed again in a partial update, or None when
+    the whole tree was walked. commit is the git revision read with rev, and
+    git_entries its listing, {relative_path: (blob_id, size)}; files read
+    from it have no stat_result, so sinks take their size from there.
+    """
+
+    def __init__(self, root_dir, source_offsets=False):
+        self.root_dir = root_dir
+        self.source_offsets = source_offsets
+        self.commit = None
+        self.git_entries = None
+        self.directories = []
+        self.tree_fingerprints = {}
+        self.skipped_dirs = set()
+        self.skipped_file_count = 0
+        self.scan_dirs = None
+        # Counters for the summary
+        self.excluded_dir_count = 0
+        self.excluded_filename_count = 0
+        self.excluded_binary_ext_count = 0
+        self.excluded_ignored_text_ext_count = 0
+        self.excluded_binary_content_count = 0
+        self.managed_count = 0
+        self.included_by_allow_list_count = 0
+        self.skipped_non_utf8_count = 0
+        self.parsing_error_count = 0
+        self.skipped_parsing_setup = {}
+        self.directory_tree_count = 0
+        self.bytes_read = 0 # Versus the on-disk size of the files read, to confirm each is read once
+        self.bytes_on_disk = 0
+        self.files_read = 0
+        self.blobs_reused = 0
+        self.source_chars_saved = 0
+
+
+def _merge_stored_fingerprints(sinks):
+    """Returns the directory fingerprints every sink has stored alike, or None if any sink is written from scratch."""
+    merged = None
+    for index, sink in enumerate(sinks):
+        fingerprints = sink.stored_fingerprints()
+        if fingerprints is None:
+            return None
+        merged = fingerprints if index == 0 else {path: fingerprint for path, fingerprint in merged.items()
+                                                  if fingerprints.get(path) == fingerprint}
+    return merged
+
+
+# --- Main Directory Processing Function ---
+
+def build_outputs(root_dir, sinks, jobs=1, parse_cache_path=None, parse_cache_max_bytes=parse_cache.DEFAULT_MAX_BYTES,
+                  source_offsets=False, use_gitignore=True, ignore_file=None, changed_dirs=None, rev=None,
+                  blob_reader=None, blob_memo=None, verbose=True):
+    """
+    Walks and parses a project once, writing every file's entry to each of the sinks.
+
+    Paths matched by .gitignore files (unless use_gitignore is False) or by
+    the project ignore file (ignore_file, or .contextignore in root_dir) are
+    pruned from the walk; see ignore_rules.py. With jobs > 1 files are read
+    and parsed in that many worker processes, and the entries still reach the
+    sinks in walk order, from this process. With parse_cache_path set, parse
+    results are reused from (and added to) the shared parse cache, capped at
+    parse_cache_max_bytes. With source_offsets=True symbol sources that are
+    verbatim slices of their file are replaced by offsets into its content
+    before the sinks see them (see source_spans.py).
+
+    Directories whose fingerprint matches what every sink has stored are not
+    read again, and the files of the other directories are only read when a
+    sink's needs_file() asks for them. With changed_dirs, a collection of
+    directory paths ('' for the root), only those directories and their
+    ancestors are listed again, provided every sink has stored fingerprints;
+    this is how watch mode applies a batch of changes.
+
+    With rev, a git revision, the tree is read from that commit instead of
+    the working tree, without checking it out (see git_source.py): files
+    are listed with `git ls-tree` and read through blob_reader, a
+    git_source.BlobReader that callers building many revisions share. Every
+    tracked file is included, so .gitignore files are not consulted.
+    blob_memo, a dict the caller passes from one revision to the next, keeps
+    the result of each (path, blob id) processed, so files unchanged since
+    the previous revision are neither read nor parsed again; after the
+    build it holds only the entries this revision used.
+
+    verbose=False suppresses the summary. Returns the ProjectBuild, or None
+    if a sink could not be opened or written.
+    """
+    build = ProjectBuild(root_dir, source_offsets)
+    git_entries = None # {relative_path: (blob_id, size)} with rev
+    own_blob_reader = False
+    if rev is not None:
+        try:
+            build.commit = git_source.resolve_revisions(root_dir, [rev])[0]
+            git_entries, git_skipped_count = git_source.list_tree(root_dir, build.commit)
+            build.git_entries = git_entries
+            if blob_reader is None:
+                blob_reader, own_blob_reader = git_source.BlobReader(root_dir), True
+        except RuntimeError as e:
+            print(f"Could not read revision '{rev}': {e}")
+            return
+        use_gitignore = False # Tracked files are part of the revision whatever .gitignore says
+        if blob_memo is None:
+            blob_memo = {}
+
+    for index, sink in enumerate(sinks):
+        if not sink.open():
+            for opened_sink in sinks[:index]:
+                opened_sink.abort()
+            if own_blob_reader:
+                blob_reader.close()
+            return
+
+    cache = parse_cache.open_cache(parse_cache_path, parse_cache_max_bytes) if parse_cache_path else None
+    if cache is None:
+        parse_cache_path = None # Workers skip lookups in a cache that could not be opened
+    path_filter = make_path_filter(root_dir, use_gitignore, ignore_file)
+    # Files the sinks write inside the tree while they build (temp files, journals) are not part of it.
+    own_paths = {path for sink in sinks for path in sink.own_paths(root_dir)}
+    stored_tree_fingerprints = _merge_stored_fingerprints(sinks)
+    # Directories to list again in a partial update: the changed ones and their ancestors.
+    if changed_dirs is not None and stored_tree_fingerprints is not None:
+        build.scan_dirs = set()
+        for dir_path in changed_dirs:
+            while dir_path not in build.scan_dirs:
+                build.scan_dirs.add(dir_path)
+                if not dir_path: break
+                dir_path = tree_parent(dir_path)
+    scan_dirs = build.scan_dirs
+    stored_tree_fingerprints = stored_tree_fingerprints or {}
+    directories = build.directories
+    tree_fingerprints = build.tree_fingerprints
+    used_blob_keys = set() # (path, blob_id) of every file of the revision that was processed
+
+    def scan_tree():
+        """
+        Walks and classifies the whole tree, statting (but not reading) every file that gets an entry.
+
+        Fills in build.directories, in walk order, and then build.tree_fingerprints
+        bottom-up. In a partial update, directories outside scan_dirs that have a
+        stored fingerprint are not entered: they keep that fingerprint and count
+        as skipped.
+        """
+        if git_entries is None:
+            walker = os.walk(root_dir, followlinks=False)
+        else:
+            walker = git_source.walk_tree(root_dir, git_entries)
+        for subdir, dirs, files_in_dir in walker:
+            relative_subdir = os.path.relpath(subdir, root_dir).replace("\\", "/")
+            rules = path_filter.enter_directory(relative_subdir, files_in_dir)
+            kept_dirs = []
+            for d in dirs:
+                dir_decision = rules.classify_dir(d)
+                if dir_decision is None: kept_dirs.append(d)
+                elif dir_decision == ignore_rules.EXCLUDED_DIR: build.excluded_dir_count += 1
+            dir_path = '' if relative_subdir == "." else f"{relative_subdir}/"
+            if scan_dirs is None:
+                dirs[:] = kept_dirs # Pruned before os.walk descends into them
+            else:
+                dirs[:] = []
+                for d in kept_dirs:
+                    path = f"{dir_path}{d}/"
+                    if path not in scan_dirs and stored_tree_fingerprints.get(path):
+                        tree_fingerprints[path] = stored_tree_fingerprints[path]
+                        build.skipped_dirs.add(path)
+                    else:
+                        dirs.append(d)
+
+            subdir_prefix = os.path.join(subdir, '') # Joined once per directory, not per file
+            if dir_path or root_dir == ".":
+                build.directory_tree_count += 1 # Its own entry ('./' for the root when scanning '.')
+            files = []
+            records = []
+            for file_name in files_in_dir:
+                decision, file_extension_lower = rules.classify_file(file_name)
+                if decision == ignore_rules.IGNORED:
+                    continue
+                filepath = subdir_prefix + file_name
+                relative_filepath = dir_path + file_name
+                if relative_filepath in own_paths:
+                    continue
+                build.directory_tree_count += 1
+
+                # 1. EXCLUDED_FILENAMES, 2. BINARY_EXTENSIONS and 5. IGNORED_TEXT_EXTENSIONS (unless managed or allow-listed)
+                if decision in (ignore_rules.EXCLUDED_FILENAME, ignore_rules.BINARY_EXTENSION, ignore_rules.IGNORED_TEXT):
+                    if decision == ignore_rules.EXCLUDED_FILENAME: build.excluded_filename_count += 1
+                    elif decision == ignore_rules.BINARY_EXTENSION: build.excluded_binary_ext_count += 1
+                    else: build.excluded_ignored_text_ext_count += 1
+                    files.append((relative_filepath, None, None))
+                    records.append(f"{file_name}\0{decision}")
+                    continue
+
+                is_managed = decision == ignore_rules.MANAGED
+                is_allow_listed = decision == ignore_rules.ALLOW_LISTED
+                if is_managed: build.managed_count += 1
+                elif is_allow_listed: build.included_by_allow_list_count += 1
+
+                # Every remaining file gets an entry; its size and mtime (or blob id) feed the directory fingerprint.
+                if git_entries is not None:
+                    stat_result = None
+                    filepath = git_entries[relative_filepath][0] # Replaced by the blob's contents when it is read
+                    records.append(f"{file_name}\0{decision}\0{filepath}")
+                else:
+                    try:
+                        stat_result = os.stat(filepath)
+                        records.append(f"{file_name}\0{decision}\0{stat_result.st_size}\0{stat_result.st_mtime_ns}")
+                    except OSError:
+                        stat_result = None
+                        records.append(f"{file_name}\0{decision}\0unreadable")
+                task = (filepath, relative_filepath, file_extension_lower, is_allow_listed, is_managed, parse_cache_path)
+                files.append((relative_filepath, task, stat_result))
+            directories.append((dir_path, files, [f"{dir_path}{d}/" for d in kept_dirs], records))
+
+        # Children are walked after their parents, so in reverse every subdirectory is hashed first.
+        # Subdirectories os.walk could not enter (unreadable, or symlinks) are not listed.
+        for dir_path, _, subdir_paths, records in reversed(directories):
+            records.extend(f"{path[len(dir_path):]}\0{tree_fingerprints[path]}" for path in subdir_paths if path in tree_fingerprints)
+            tree_fingerprints[dir_path] = _directory_fingerprint(records)
+
+    def walk_tasks():
+        """
+        Yields a (task, (relative_filepath, stat_result, blob_key, wanting)) pair for every file a sink needs.
+
+        wanting lists the sinks that asked for the file. With rev, blob_key is
+        the file's (path, blob id) and the task carries the blob's contents;
+        the task is None when blob_memo already has its result. Otherwise the
+        task ends with the content hash the wanting sinks agree they already
+        hold, if any.
+        """
+        for dir_path, files, _, _ in directories:
+            if stored_tree_fingerprints.get(dir_path) == tree_fingerprints[dir_path]:
+                # Nothing below this directory changed: one comparison instead of one per file.
+                build.skipped_dirs.add(dir_path)
+                build.skipped_file_count += sum(1 for _, task, _ in files if task is not None)
+                continue
+            for relative_filepath, task, stat_result in files:
+                if task is None:
+                    continue
+                # Every sink is asked, so each can note the file as present.
+                wanting = [sink for sink in sinks if sink.needs_file(relative_filepath, stat_result)]
+                if not wanting:
+                    continue
+                if git_entries is None:
+                    known_hashes = {sink.stored_content_hash(relative_filepath) for sink in wanting}
+                    known_hash = known_hashes.pop() if len(known_hashes) == 1 else None
+                    yield task + (known_hash,), (relative_filepath, stat_result, None, wanting)
+                    continue
+                blob_key = (relative_filepath, task[0])
+                used_blob_keys.add(blob_key)
+                if blob_key in blob_memo:
+                    yield None, (relative_filepath, stat_result, blob_key, wanting)
+                else:
+                    # No known hash: an 'unchanged' result would not hold for whatever reuses it from the memo.
+                    yield (blob_reader.read(task[0]),) + task[1:] + (None,), (relative_filepath, stat_result, blob_key, wanting)
+
+    try:
+        scan_tree()
+        for sink in sinks:
+            sink.begin(build)
+
+        # The walk feeds the (optionally parallel) readers/parsers; results come back
+        # in walk order and this process hands each entry to the sinks that want it.
+        for (relative_filepath, stat_result, blob_key, wanting), result in _ordered_map(_process_file, walk_tasks(), jobs):
+            if result is None:
+                # Same path and contents as in an earlier revision: reuse its result as is.
+                status, file_details, content_hash, cache_entry, io_stats = blob_memo[blob_key]
+                build.blobs_reused += 1
+            else:
+                status, file_details, content_hash, cache_entry, io_stats = result
+                if blob_key is not None:
+                    blob_memo[blob_key] = (status, file_details, content_hash, None, (0, 0))
+                build.files_read += 1
+            build.bytes_read += io_stats[0]
+            build.bytes_on_disk += io_stats[1]
+            if status == 'unchanged':
+                for sink in wanting:
+                    sink.add_file(relative_filepath, None, content_hash, stat_result)
+                continue
+            if status == 'binary':
+                # Binary by content: excluded like BINARY_EXTENSIONS, so no sink gets an entry.
+                build.excluded_binary_content_count += 1
+                continue
+            if cache_entry is not None:
+                cache_key, cached_blob = cache_entry
+                if cached_blob is None: cache.touch(cache_key)
+                else: cache.put(cache_key, cached_blob)
+            if status == 'non_utf8':
+                build.skipped_non_utf8_count += 1
+            elif status == 'read_error':
+                build.parsing_error_count += 1
+            elif status == 'html_skipped':
+                build.skipped_parsing_setup['html'] = build.skipped_parsing_setup.get('html', 0) + 1
+            elif status == 'js_skipped':
+                build.skipped_parsing_setup['javascript'] = build.skipped_parsing_setup.get('javascript', 0) + 1
+            elif status == 'parsed' and "error" in file_details.get("type", ""):
+                build.parsing_error_count += 1
+
+            if source_offsets:
+                build.source_chars_saved += source_spans.replace_sources_with_offsets(file_details)
+            for sink in wanting:
+                sink.add_file(relative_filepath, file_details, content_hash, stat_result)
+    except Exception as e:
+        print(f"Error while building the project context: {e}")
+        for sink in sinks:
+            sink.abort()
+        return
+    finally:
+        if cache is not None:
+            cache.close()
+        if git_entries is not None:
+            for blob_key in blob_memo.keys() - used_blob_keys:
+                del blob_memo[blob_key] # Keep the memo to one revision's worth of files
+            if own_blob_reader:
+                blob_reader.close()
+
+    finished = [sink.finish(build) for sink in sinks] # Every sink finishes, whether or not another failed
+    if not all(finished):
+        return
+    if not verbose:
+        return build
+
+    print()
+    for sink in sinks:
+        print(f"Successfully wrote structured project context to '{sink.output_filename}'")
+    print(f"Summary of Exclusions/Inclusions:")
+    print(f"  - {build.excluded_dir_count} directories skipped during walk (not in directory_tree).")
+    if path_filter.ignore_sources:
+        print(f"  - {path_filter.summary()}")
+    print(f"  - {build.excluded_filename_count} specific files excluded from 'files'.")
+    print(f"  - {build.excluded_binary_ext_count} binary files by extension excluded from 'files'.")
+    if build.excluded_binary_content_count:
+        print(f"  - {build.excluded_binary_content_count} binary files by content (NUL bytes) excluded from 'files'.")
+    print(f"  - {build.included_by_allow_list_count} files had content included via specific filename allow-list.")
+    print(f"  - {build.excluded_ignored_text_ext_count} files by extension had content ignored (not on allow-list).")
+    print(f"  - {build.managed_count} files managed (metadata only, no full content).")
+    print(f"Processing Summary:")
+    if build.skipped_non_utf8_count:
+        print(f"  - Skipped reading {build.skipped_non_utf8_count} non-UTF-8 text files (entry added to 'files' with error type).")
+    if build.parsing_error_count:
+        print(f"  - Encountered {build.parsing_error_count} files with syntax, parsing, or read errors (entry added to 'files' with error type).")
+    for lang, count in build.skipped_parsing_setup.items():
+        print(f"  - Skipped parsing {count} {lang.upper()} files due to missing libraries (entry added to 'files' with full content).")
+    print(f"  - Read {build.bytes_read:,} bytes from {build.files_read} files of {build.bytes_on_disk:,} bytes on disk (each file is read at most once).")
+    print(f"  - Full directory tree recorded: {build.directory_tree_count} entries.")
+    if git_entries is not None:
+        print(f"  - Read revision {build.commit[:12]} from git: {build.files_read} blobs streamed through git cat-file, "
+              f"{build.blobs_reused} unchanged files reused from the previous revision, {git_skipped_count} symlinks and submodules skipped.")
+    if cache is not None:
+        print(f"  - {cache.summary()}")
+    if source_offsets:
+        print(f"  - Stored symbol sources as offsets into file contents: {build.source_chars_saved} characters of duplicated text not written.")
+    for sink in sinks:
+        sink.print_summary(build)
+    return build
@@ -0,0 +1,459 @@
+#context_reader.py
+
+"""
+Lazy, low-memory access to a context JSON file written by build_code_json.py.
+
+ContextReader exposes the artifact as a read-only mapping of path to
+FileRecord without decoding it up front. On first access it streams
+through the file once with a byte-level scanner that skips over every
+"files" entry and keeps only its byte span, so the reader holds the paths
+and two offsets per file, never the entries. Looking a path up seeks to its
+span and decodes that one entry, except that "full_content" and every
+"source_code" string are left in the file: they are read, and decoded if
+compressed (see content_codec.py), when a record is asked for them. A
+symbol stored as offsets (see source_spans.py) returns its slice of
+full_content as its "source_code". Listing paths and reading signatures or
+line numbers therefore holds one read buffer plus the skeletons of the
+entries in use, however large the artifact and its contents are.
+
+The sidecar index of an NDJSON output (build_code_json.py --ndjson) opens
+the same way, given as OUTPUT.index.json or OUTPUT: each line there is a
+bare entry as the document holds it under "files", so the spans simply come
+from the index instead of a scan.
+
+Records are cached weakly: looking a path up again while an earlier
+FileRecord of it is still referenced returns that record. A reader keeps
+its files open until close() and must not be shared between threads.
+
+Usage: python context_reader.py ARTIFACT [PATH ...] [--content]
+"""
+
+import argparse
+import array
+import json
+import os
+import re
+import sys
+import weakref
+from collections.abc import Mapping
+
+import content_codec
+import source_spans
+
+READ_SIZE = 256 * 1024
+# Matches build_code_json.ndjson_index_filename(); the builders are not imported,
+# they load the parsers.
+NDJSON_INDEX_SUFFIX = ".index.json"
+
+_WHITESPACE = re.compile(rb'[ \t\r\n]*')
+_STRING_BODY = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL) # Stops at the closing quote, or a lone trailing backslash
+_STRUCTURE = re.compile(rb'[^"{}\[\]]*')
+_SCALAR = re.compile(rb'[^,}\]\s]*')
+_UNLOADED = object()
+
+
+class _ByteScanner:
+    """
+    Forward-only JSON tokenizer over a binary file, starting at a given offset.
+
+    Reads READ_SIZE bytes at a time (never past end, if given) and drops
+    what it has consumed, so skipping a value does not hold it in memory,
+    however long its strings are. Offsets are absolute positions in the file.
+    """
+
+    def __init__(self, f, offset, end=None):
+        f.seek(offset)
+        self.f = f
+        self.base = offset # File offset of buffer[0]
+        self.buffer = b''
+        self.pos = 0
+        self.end = end
+
+    @property
+    def offset(self):
+        return self.base + self.pos
+
+    def _fill(self):
+        self.base += self.pos
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        size = READ_SIZE
+        if self.end is not None:
+            size = min(size, self.end - self.base - len(self.buffer))
+        chunk = self.f.read(size) if size > 0 else b''
+        if not chunk:
+            return False
+        self.buffer += chunk
+        return True
+
+    def _error(self, message):
+        return ValueError(f"Malformed context JSON at byte {self.offset}: {message}.")
+
+    def peek(self):
+        """Skips whitespace and returns the next byte without consuming it (b'' at the end)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos:self.pos + 1]
+            if not self._fill():
+                return b''
+
+    def expect(self, chars):
+        """Consumes the next byte, which must be one of chars, and returns it."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise self._error(f"expected {chars.decode()!r} but found {char.decode('latin-1')!r}")
+        self.pos += 1
+        return char
+
+    def string(self, keep=True):
+        """Consumes a string and returns its raw (still escaped) bytes between the quotes, or None if not keep."""
+        self.expect(b'"')
+        pieces = []
+        while True:
+            end = _STRING_BODY.match(self.buffer, self.pos).end()
+            if keep:
+                pieces.append(self.buffer[self.pos:end])
+            self.pos = end
+            if end < len(self.buffer) and self.buffer[end] == 0x22: # '"'
+                self.pos += 1
+                return b''.join(pieces) if keep else None
+            if not self._fill(): # The string runs past the buffer, or an escape was split by it
+                raise self._error("unterminated string")
+
+    def skip(self):
+        """Consumes one value of any type."""
+        char = self.peek()
+        if char == b'"':
+            self.string(keep=False)
+            return
+        if char not in (b'{', b'['):
+            while True: # Number, true, false or null
+                self.pos = _SCALAR.match(self.buffer, self.pos).end()
+                if self.pos < len(self.buffer) or not self._fill():
+                    return
+        depth = 0
+        while True:
+            self.pos = _STRUCTURE.match(self.buffer, self.pos).end()
+            if self.pos == len(self.buffer):
+                if not self._fill():
+                    raise self._error("unterminated value")
+                continue
+            char = self.buffer[self.pos]
+            if char == 0x22:
+                self.string(keep=False)
+                continue
+            self.pos += 1
+            depth += 1 if char in b'{[' else -1
+            if depth == 0:
+                return
+
+    def lazy_spans(self):
+        """
+        Consumes one file entry and returns the (start, end) spans of its lazily
+        read values: its own "full_content" and every "source_code" string in it.
+        """
+        spans = []
+        self.expect(b'{')
+        stack = [b'{']
+        expect_key = True
+        while stack:
+            char = self.peek()
+            if char == b'"' and expect_key:
+                key = self.string()
+                self.expect(b':')
+                expect_key = False
+                if (key == b'source_code' or (key == b'full_content' and len(stack) == 1)) and self.peek() in (b'"', b'{'):
+                    start = self.offset
+                    self.skip()
+                    spans.append((start, self.offset))
+            elif char in (b'{', b'['):
+                self.pos += 1
+                stack.append(char)
+                expect_key = char == b'{'
+            elif char in (b'}', b']'):
+                self.pos += 1
+                stack.pop()
+                expect_key = False
+            elif char == b',':
+                self.pos += 1
+                expect_key = stack[-1] == b'{'
+            elif not char:
+                raise self._error("unterminated entry")
+            else:
+                self.skip() # A string value or a scalar
+        return spans
+
+
+def _decode_string(raw):
+    """Decodes the raw bytes of a JSON string as returned by _ByteScanner.string()."""
+    if b'\\' not in raw:
+        return raw.decode('utf-8')
+    return json.loads(b'"' + raw + b'"')
+
+
+class FileRecord(Mapping):
+    """
+    One "files" entry of a context artifact.
+
+    Reads like the entry's dict, except that "full_content" is read from the
+    artifact (and decompressed) on first access and then kept, and every dict
+    in it that carries a "source_code" is a SymbolRecord.
+    """
+
+    __slots__ = ('path', '_reader', '_source', '_lazy', '_data', '_full_content', '__weakref__')
+
+    def __init__(self, reader, path, source, start, end):
+        self.path = path
+        self._reader = reader
+        self._source = source
+        self._full_content = _UNLOADED
+        self._data, self._lazy = reader._decode_entry(source, start, end, self)
+
+    def _load(self, number):
+        start, end = self._lazy[number]
+        return content_codec.decode_json_value(json.loads(self._reader._read(self._source, start, end)), self._reader.codec)
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        if key == 'full_content' and type(value) is int: # Index into _lazy
+            if self._full_content is _UNLOADED:
+                self._full_content = self._load(value)
+            return self._full_content
+        return value
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"<FileRecord {self.path!r} type={self._data.get('type')!r}>"
+
+
+class SymbolRecord(Mapping):
+    """A function, class, method, rule, ... of a FileRecord; its "source_code" is read on each access."""
+
+    __slots__ = ('_data', '_record')
+
+    def __init__(self, data, record):
+        self._data = data
+        self._record = record
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        if key == 'source_code':
+            if type(value) is int: # Index into the record's lazy spans
+                return self._record._load(value)
+            if value is None and self._data.get('source_start') is not None:
+                return source_spans.symbol_source(self._record['full_content'], self._data)
+        return value
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"<SymbolRecord {self._data.get('qualname') or self._data.get('name')!r} in {self._record.path!r}>"
+
+
+class ContextReader(Mapping):
+    """
+    Read-only mapping of path to FileRecord over a build_code_json.py artifact.
+
+    filename is a context JSON file (indented or --compact), or an NDJSON
+    output or its index. Nothing is read until the first access.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        if filename.endswith('.ndjson') and os.path.exists(filename + NDJSON_INDEX_SUFFIX):
+            filename += NDJSON_INDEX_SUFFIX
+        self.index_filename = filename if filename.endswith(NDJSON_INDEX_SUFFIX) else None
+        self.codec = content_codec.ContentCodec('zlib') # Decodes values of any codec
+        self._filenames = [filename]
+        self._files = {}
+        self._slots = None # path -> position in the span arrays
+        self._sources = array.array('l')
+        self._starts = array.array('q')
+        self._ends = array.array('q')
+        self._members = {} # Top-level key -> (start, end), for documents
+        self._metadata = None
+        self._directory_tree = None # Kept from NDJSON indexes only
+        self._records = weakref.WeakValueDictionary()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+    def _file(self, source):
+        f = self._files.get(source)
+        if f is None:
+            f = self._files[source] = open(self._filenames[source], 'rb')
+        return f
+
+    def _read(self, source, start, end):
+        f = self._file(source)
+        f.seek(start)
+        return f.read(end - start)
+
+    def _add(self, path, source, start, end):
+        self._slots[path] = len(self._starts)
+        self._sources.append(source)
+        self._starts.append(start)
+        self._ends.append(end)
+
+    def _scan_document(self):
+        """Records the span of every "files" entry and top-level member in one pass over the document."""
+        scanner = _ByteScanner(self._file(0), 0)
+        scanner.expect(b'{')
+        if scanner.peek() == b'}':
+            return
+        while True:
+            key = _decode_string(scanner.string())
+            scanner.expect(b':')
+            if key == 'files':
+                scanner.expect(b'{')
+                if scanner.peek() != b'}':
+                    while True:
+                        path = _decode_string(scanner.string())
+                        scanner.expect(b':')
+                        start = scanner.offset
+                        scanner.skip()
+                        self._add(path, 0, start, scanner.offset)
+                        if scanner.expect(b',}') == b'}':
+                            break
+                else:
+                    scanner.expect(b'}')
+            else:
+                start = scanner.offset
+                scanner.skip()
+                self._members[key] = (start, scanner.offset)
+            if scanner.expect(b',}') == b'}':
+                return
+
+    def _load_ndjson_index(self):
+        """Takes the spans from an NDJSON index (see build_code_json.load_ndjson_index())."""
+        with open(self.index_filename, encoding='utf-8') as f:
+            index = json.load(f)
+        index_dir = os.path.dirname(os.path.abspath(self.index_filename))
+        self._filenames = [os.path.join(index_dir, name) for name in index["shards"]]
+        self._metadata = index.get("__metadata__", {})
+        self._directory_tree = index.get("directory_tree", [])
+        for path, (shard, offset, length) in index["files"].items():
+            self._add(path, shard, offset, offset + length)
+
+    def _index(self):
+        if self._slots is None:
+            self._slots = {}
+            try:
+                if self.index_filename is not None:
+                    self._load_ndjson_index()
+                else:
+                    self._scan_document()
+            except BaseException:
+                self._slots = None
+                raise
+        return self._slots
+
+    def _member(self, key, default):
+        self._index()
+        span = self._members.get(key)
+        return json.loads(self._read(0, *span)) if span is not None else default
+
+    def _decode_entry(self, source, start, end, record):
+        """Decodes an entry with its lazy values replaced by their number; returns (entry, lazy spans)."""
+        scanner = _ByteScanner(self._file(source), start, end)
+        lazy = scanner.lazy_spans()
+        pieces = []
+        position = start
+        for number, (lazy_start, lazy_end) in enumerate(lazy):
+            pieces.append(self._read(source, position, lazy_start))
+            pieces.append(str(number).encode('ascii'))
+            position = lazy_end
+        pieces.append(self._read(source, position, scanner.offset))
+
+        def make_object(pairs):
+            data = dict(pairs)
+            return SymbolRecord(data, record) if 'source_code' in data else data
+
+        return json.loads(b''.join(pieces), object_pairs_hook=make_object), lazy
+
+    @property
+    def metadata(self):
+        """The artifact's "__metadata__"."""
+        if self._metadata is None:
+            self._metadata = self._member("__metadata__", {})
+        return self._metadata
+
+    def directory_tree(self):
+        """Returns the artifact's "directory_tree", read from the file on each call."""
+        if self.index_filename is not None:
+            self._index()
+            return list(self._directory_tree)
+        return self._member("directory_tree", [])
+
+    def __getitem__(self, path):
+        slot = self._index()[path]
+        record = self._records.get(path)
+        if record is None:
+            record = FileRecord(self, path, self._sources[slot], self._starts[slot], self._ends[slot])
+            self._records[path] = record
+        return record
+
+    def __contains__(self, path):
+        return path in self._index()
+
+    def __iter__(self):
+        return iter(self._index())
+
+    def __len__(self):
+        return len(self._index())
+
+
+def _symbol_label(item):
+    """One line describing a symbol: its lines, name and signature."""
+    name = item.get('qualname') or item.get('name') or ', '.join(item.get('selectors') or []) or item.get('type')
+    return f"  {item.get('start_lineno')}-{item.get('end_lineno')}  {name}{item.get('signature') or ''}"
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Read paths, symbols or contents from a build_code_json.py artifact without loading all of it.")
+    parser.add_argument("artifact", help="Context JSON file, or an NDJSON output or its index (OUTPUT.index.json).")
+    parser.add_argument("paths", nargs="*", help="Files to show; without any, every path in the artifact is listed.")
+    parser.add_argument("--content", action="store_true", help="Print the files' contents instead of their symbols.")
+    args = parser.parse_args(argv)
+
+    try:
+        with ContextReader(args.artifact) as reader:
+            if not args.paths:
+                for path in reader:
+                    print(path)
+                return
+            for path in args.paths:
+                record = reader.get(path)
+                if record is None:
+                    print(f"'{path}' is not in the artifact.")
+                elif args.content:
+                    sys.stdout.write(record.get('full_content') or '')
+                else:
+                    print(f"{path} [{record.get('type')}] lines {record.get('start_lineno')}-{record.get('end_lineno')}")
+                    for item in source_spans.iter_source_items(record):
+                        print(_symbol_label(item))
+    except (OSError, ValueError) as e:
+        sys.exit(f"Cannot read '{args.artifact}': {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+#context_search.py
+
+"""
+Optional SQLite FTS5 full-text index over a project context database.
+
+build_code_db.py builds it with --fts. Each searchable unit (a whole file, a
+Python function/method/class, a JavaScript function/class/event listener,
+an inline <script> item or a CSS rule) gets a row in 'search_documents'
+holding its kind, name and line span, and the same rowid in the FTS5 table
+'search_index'. The index is contentless (content=''): the text already
+lives in the regular tables, so only the inverted index is stored and the
+documents are regenerated from those tables whenever they have to be
+removed again.
+
+The unicode61 tokenizer already splits snake_case and dotted names on their
+punctuation. camelCase and PascalCase identifiers are a single token to it,
+so their lowercased parts are appended to each document; a search for
+"user" then finds getUserName as well as get_user_name.
+
+Usage: python context_search.py [-d project_context.db] [-n LIMIT] [--kind KIND] QUERY...
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import time
+
+import content_codec
+import source_spans
+
+SEARCH_TOKENIZER = "unicode61 remove_diacritics 2"
+# Column weights for bm25(): a hit in a symbol's name outranks one in its body.
+NAME_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+WORD_REGEX = re.compile(r'[A-Za-z0-9]+')
+CAMEL_CASE_PART_REGEX = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z0-9]+|[A-Z0-9]+')
+QUERY_TERM_REGEX = re.compile(r'\w+\*?')
+
+SEARCH_DOCUMENT_KINDS = (
+    'file', 'python_function', 'python_method', 'python_class',
+    'js_function', 'js_method', 'js_class', 'js_event_listener',
+    'js_inline_function', 'js_inline_event_listener', 'css_rule',
+)
+
+
+def fts5_available():
+    """Reports whether the linked SQLite library was compiled with FTS5."""
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute("CREATE VIRTUAL TABLE probe USING fts5(body)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+def has_search_tables(cursor):
+    """Reports whether the database already carries a search index."""
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'search_index'").fetchone() is not None
+
+
+def create_search_tables(cursor):
+    """Creates the document table and the contentless FTS5 index."""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS search_documents (
+        id INTEGER PRIMARY KEY, -- Also the rowid of the document in search_index
+        file_id INTEGER NOT NULL,
+        kind TEXT NOT NULL, -- One of SEARCH_DOCUMENT_KINDS
+        ref_id INTEGER, -- Row id in the table the document was generated from
+        name TEXT,
+        start_lineno INTEGER,
+        end_lineno INTEGER,
+        FOREIGN KEY (file_id) REFERENCES files (id) ON DELETE CASCADE
+    )''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_search_documents_file_id ON search_documents (file_id)')
+    cursor.execute(f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        name, body, content='', tokenize="{SEARCH_TOKENIZER}"
+    )''')
+
+
+def identifier_parts(text):
+    """
+    Returns the lowercased parts of every camelCase/PascalCase word in text.
+
+    Each distinct word is split once, so the parts add one occurrence per
+    identifier rather than per use. Words without a case change (including
+    snake_case pieces, which the tokenizer splits itself) contribute nothing.
+    """
+    parts = []
+    seen = set()
+    for word in WORD_REGEX.findall(text):
+        if word in seen:
+            continue
+        seen.add(word)
+        pieces = CAMEL_CASE_PART_REGEX.findall(word)
+        if len(pieces) > 1:
+            parts.extend(piece.lower() for piece in pieces)
+    return ' '.join(parts)
+
+
+def _document_text(*fields):
+    """Joins the non-empty fields of a document and appends their identifier parts."""
+    text = '\n'.join(field for field in fields if field)
+    parts = identifier_parts(text)
+    return f"{text}\n{parts}" if parts else text
+
+
+def _iter_documents(cursor, file_ids=None):
+    """
+    Yields (file_id, kind, ref_id, name, body, start_lineno, end_lineno) for the
+    searchable units of the given files (all files when file_ids is None).
+
+    The output is a pure function of the stored rows, which is what lets
+    unindex_files() hand the contentless index the exact text it was given.
+    The connection needs decompress() (see content_codec.py).
+    """
+    if file_ids is None:
+        where, params = "", ()
+    else:
+        where, params = "WHERE {0} IN (SELECT value FROM json_each(?))", (json.dumps(list(file_ids)),)
+
+    for file_id, path, content, start, end in cursor.execute(
+            "SELECT id, path, decompress(full_content), start_lineno, end_lineno FROM files " + where.format('id') + " ORDER BY id", params).fetchall():
+        if content:
+            yield file_id, 'file', file_id, path, _document_text(content), start, end
+
+    for row_id, file_id, class_id, qualname, signature, docstring, source, start, end in cursor.execute(
+            "SELECT f.id, f.file_id, f.class_id, f.qualname, f.signature, f.docstring, " + source_spans.SOURCE_SQL.format(t='f', content='decompress(fc.full_content)') + ", f.start_lineno, f.end_lineno "
+            "FROM python_functions f JOIN files fc ON fc.id = f.file_id " + where.format('f.file_id') + " ORDER BY f.id", params).fetchall():
+        kind = 'python_method' if class_id is not None else 'python_function'
+        yield file_id, kind, row_id, qualname, _document_text(qualname, signature, docstring, source), start, end
+
+    for row_id, file_id, qualname, docstring, source, start, end in cursor.execute(
+            "SELECT c.id, c.file_id, c.qualname, c.docstring, " + source_spans.SOURCE_SQL.format(t='c', content='decompress(fc.full_content)') + ", c.start_lineno, c.end_lineno "
+            "FROM python_classes c JOIN files fc ON fc.id = c.file_id " + where.format('c.file_id') + " ORDER BY c.id", params).fetchall():
+        yield file_id, 'python_class', row_id, qualname, _document_text(qualname, docstring, source), start, end
+
+    for row_id, file_id, class_name, name, source, start, end in cursor.execute(
+            "SELECT f.id, f.file_id, c.name, f.name, " + source_spans.SOURCE_SQL.format(t='f', content='decompress(fc.full_content)') + ", f.start_lineno, f.end_lineno "
+            "FROM js_functions f JOIN files fc ON fc.id = f.file_id LEFT JOIN js_classes c ON c.id = f.class_id " + where.format('f.file_id') + " ORDER BY f.id", params).fetchall():
+        kind = 'js_method' if class_name is not None else 'js_function'
+        qualname = f"{class_name}.{name}" if class_name is not None and name else name
+        yield file_id, kind, row_id, qualname, _document_text(qualname, source), start, end
+
+    for row_id, file_id, name, superclass, source, start, end in cursor.execute(
+            "SELECT c.id, c.file_id, c.name, c.superclass, " + source_spans.SOURCE_SQL.format(t='c', content='decompress(fc.full_content)') + ", c.start_lineno, c.end_lineno "
+            "FROM js_classes c JOIN files fc ON fc.id = c.file_id " + where.format('c.file_id') + " ORDER BY c.id", params).fetchall():
+        yield file_id, 'js_class', row_id, name, _document_text(name, superclass, source), start, end
+
+    for row_id, file_id, target, event_type, handler_name, source, start, end in cursor.execute(
+            "SELECT l.id, l.file_id, l.target, l.event_type, l.handler_name, " + source_spans.SOURCE_SQL.format(t='l', content='decompress(fc.full_content)') + ", l.start_lineno, l.end_lineno "
+            "FROM js_event_listeners l JOIN files fc ON fc.id = l.file_id " + where.format('l.file_id') + " ORDER BY l.id", params).fetchall():
+        name = f"{target} {event_type}"
+        yield file_id, 'js_event_listener', row_id, name, _document_text(name, handler_name, source), start, end
+
+    for row_id, file_id, item_type, data in cursor.execute(
+            "SELECT j.id, e.file_id, j.item_type, j.data FROM js_parsed_items j JOIN html_elements e ON e.id = j.html_element_id "
+            + where.format('e.file_id') + " ORDER BY j.id", params).fetchall():
+        item = json.loads(data)
+        if item_type == 'function':
+            kind, name = 'js_inline_function', item.get('name')
+        else:
+            kind, name = 'js_inline_event_listener', f"{item.get('target')} {item.get('event_type')}"
+        yield file_id, kind, row_id, name, _document_text(name, item.get('source_code')), item.get('start_lineno_file'), item.get('end_lineno_file')
+
+    for row_id, file_id, selectors, source, start, end in cursor.execute(
+            "SELECT r.id, r.file_id, (SELECT group_concat(s.selector_text, ', ') FROM css_selectors s WHERE s.rule_id = r.id), "
+            + source_spans.SOURCE_SQL.format(t='r', content='decompress(fc.full_content)') + ", r.start_lineno, r.end_lineno FROM css_rules r JOIN files fc ON fc.id = r.file_id " + where.format('r.file_id') + " ORDER BY r.id", params).fetchall():
+        yield file_id, 'css_rule', row_id, selectors, _document_text(selectors, source), start, end
+
+
+def index_files(cursor, file_ids=None):
+    """
+    Adds search documents for the given files (all files when file_ids is None).
+    The files must not be indexed already. Returns the number of documents added.
+    """
+    next_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM search_documents").fetchone()[0] + 1
+    document_rows = []
+    index_rows = []
+    for file_id, kind, ref_id, name, body, start, end in _iter_documents(cursor, file_ids):
+        document_rows.append((next_id, file_id, kind, ref_id, name, start, end))
+        index_rows.append((next_id, name, body))
+        next_id += 1
+    cursor.executemany("INSERT INTO search_documents (id, file_id, kind, ref_id, name, start_lineno, end_lineno) VALUES (?, ?, ?, ?, ?, ?, ?)", document_rows)
+    cursor.executemany("INSERT INTO search_index (rowid, name, body) VALUES (?, ?, ?)", index_rows)
+    return len(document_rows)
+
+
+def unindex_files(cursor, file_ids):
+    """
+    Removes the search documents of the given files. Must run while their
+    parsed rows still exist: a contentless FTS5 table can only forget a
+    document when it is handed the same text again.
+    """
+    file_ids = list(file_ids)
+    if not file_ids:
+        return
+    document_ids = {(kind, ref_id): doc_id for doc_id, kind, ref_id in cursor.execute(
+        "SELECT id, kind, ref_id FROM search_documents WHERE file_id IN (SELECT value FROM json_each(?))", (json.dumps(file_ids),)).fetchall()}
+    delete_rows = []
+    for _, kind, ref_id, name, body, _, _ in _iter_documents(cursor, file_ids):
+        doc_id = document_ids.get((kind, ref_id))
+        if doc_id is not None:
+            delete_rows.append((doc_id, name, body))
+    cursor.executemany("INSERT INTO search_index (search_index, rowid, name, body) VALUES ('delete', ?, ?, ?)", delete_rows)
+    cursor.execute("DELETE FROM search_documents WHERE file_id IN (SELECT value FROM json_each(?))", (json.dumps(file_ids),))
+
+
+def build_match_expression(query):
+    """
+    Turns free text into an FTS5 MATCH expression: every word must occur,
+    and a trailing '*' makes a word a prefix search. Each word is quoted, so
+    operators and punctuation in the query are never interpreted; a quoted
+    snake_case or dotted name becomes a phrase of its parts.
+    """
+    terms = []
+    for term in QUERY_TERM_REGEX.findall(query):
+        prefix = term.endswith('*')
+        terms.append('"{}"{}'.format(term.rstrip('*'), '*' if prefix else ''))
+    return ' '.join(terms)
+
+
+def _first_matching_line(content, query, start_lineno):
+    """Returns the number of the first line of content containing a query word, if any."""
+    words = [term.rstrip('*').lower() for term in QUERY_TERM_REGEX.findall(query)]
+    for offset, line in enumerate(content.splitlines()):
+        lowered = line.lower()
+        if any(word in lowered for word in words):
+            return start_lineno + offset
+    return None
+
+
+def search(conn, query, limit=20, kinds=None, raw=False):
+    """
+    Runs a ranked full-text search over a context database built with --fts.
+
+    Args:
+        conn: An open sqlite3 connection to the database.
+        query: Free text (see build_match_expression), or an FTS5 query when raw=True.
+        limit: Maximum number of hits.
+        kinds: Optional iterable of document kinds (SEARCH_DOCUMENT_KINDS) to restrict to.
+        raw: Pass query to FTS5 unchanged.
+
+    Returns:
+        A list of hit dicts, best first, with path, kind, name, start_lineno,
+        end_lineno and score (higher is better). For whole-file hits the span is
+        narrowed to the first line that contains one of the query words.
+    """
+    match = query if raw else build_match_expression(query)
+    if not match:
+        return []
+    content_codec.register_sqlite_functions(conn) # File contents may be compressed
+    sql = (f"SELECT f.path, d.kind, d.name, d.start_lineno, d.end_lineno, bm25(search_index, {NAME_WEIGHT}, {BODY_WEIGHT}) AS rank, d.file_id "
+           "FROM search_index JOIN search_documents d ON d.id = search_index.rowid JOIN files f ON f.id = d.file_id "
+           "WHERE search_index MATCH ?")
+    params = [match]
+    if kinds:
+        kinds = list(kinds)
+        sql += f" AND d.kind IN ({', '.join('?' for _ in kinds)})"
+        params.extend(kinds)
+    sql += " ORDER BY rank LIMIT ?"
+    params.append(limit)
+
+    hits = []
+    for path, kind, name, start, end, rank, file_id in conn.execute(sql, params).fetchall():
+        if kind == 'file' and not raw:
+            content = conn.execute("SELECT decompress(full_content) FROM files WHERE id = ?", (file_id,)).fetchone()[0]
+            line = _first_matching_line(content or '', query, start or 1)
+            if line is not None:
+                start = end = line
+        hits.append({"path": path, "kind": kind, "name": name, "start_lineno": start, "end_lineno": end, "score": -rank})
+    return hits
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Search a project context database built with build_code_db.py --fts.")
+    parser.add_argument("query", nargs="+", help="Words to search for; a trailing * makes a word a prefix.")
+    parser.add_argument("-d", "--database", default="project_context.db", help="Context database path (default: project_context.db).")
+    parser.add_argument("-n", "--limit", type=int, default=20, help="Maximum number of hits (default: 20).")
+    parser.add_argument("--kind", action="append", choices=SEARCH_DOCUMENT_KINDS, help="Only return documents of this kind (repeatable).")
+    parser.add_argument("--raw", action="store_true", help="Pass the query to FTS5 unchanged (AND/OR/NEAR, column filters, ...).")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.database)
+    try:
+        if not has_search_tables(conn.cursor()):
+            sys.exit(f"'{args.database}' has no search index; rebuild it with build_code_db.py --fts.")
+        start = time.perf_counter()
+        hits = search(conn, " ".join(args.query), limit=args.limit, kinds=args.kind, raw=args.raw)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    except sqlite3.OperationalError as e:
+        sys.exit(f"Search failed: {e}")
+    finally:
+        conn.close()
+
+    for hit in hits:
+        span = f"{hit['start_lineno']}-{hit['end_lineno']}" if hit['start_lineno'] != hit['end_lineno'] else f"{hit['start_lineno']}"
+        print(f"{hit['score']:8.2f}  {hit['path']}:{span}  [{hit['kind']}] {hit['name']}")
+    print(f"{len(hits)} hits in {elapsed_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
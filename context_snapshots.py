@@ -0,0 +1,398 @@
+#context_snapshots.py
+
+"""
+Named snapshots of a project context database, and diffs between them.
+
+A build (build_code_db.py) describes one state of the project, and each full
+build replaces the previous one. A snapshot records the current build under
+a name (build_code_db.py --snapshot NAME, or the 'create' command below) in
+tables of the same database that later builds leave alone, so any number of
+states can be kept side by side and compared.
+
+Storage is content-addressed. Each distinct file content is stored once in
+'snapshot_contents', keyed by the builder's content_hash (with the file type
+and parser versions, which also determine how it was parsed), together with
+its symbol index in 'snapshot_symbols': the Python, JavaScript and CSS
+symbols found in it, each with a hash of its source. A snapshot itself is
+only a list of (path, content) references in 'snapshot_files', so recording
+a state that differs from the last one in a few files stores a few new
+contents and one small row per file.
+
+A diff never compares text. Files are matched by path and compared by
+content reference in SQL; only files whose content differs are then looked
+at symbol by symbol, comparing source hashes, so unchanged files cost one
+integer comparison however large they are.
+
+Usage: python context_snapshots.py [-d project_context.db] {list,create,delete,diff} ...
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+import content_codec
+import source_spans
+
+# Tables owned by this module; build_code_db.py keeps them (and the compression
+# dictionaries their contents may refer to) when it rebuilds a database.
+SNAPSHOT_TABLES = ('snapshots', 'snapshot_paths', 'snapshot_contents', 'snapshot_files', 'snapshot_symbols')
+KEPT_TABLES = SNAPSHOT_TABLES + ('compression_dictionaries', 'sqlite_sequence')
+
+SYMBOL_KINDS = ('python_function', 'python_method', 'python_class', 'js_function', 'js_method', 'js_class', 'css_rule')
+
+
+def create_tables(cursor):
+    """Creates the snapshot tables if they do not exist yet."""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        created_time TEXT,
+        root_directory TEXT,
+        git_revision TEXT, -- Set for builds made with --rev
+        file_count INTEGER
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS snapshot_paths (
+        id INTEGER PRIMARY KEY,
+        path TEXT UNIQUE NOT NULL
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS snapshot_contents (
+        id INTEGER PRIMARY KEY,
+        content_hash TEXT, -- files.content_hash; NULL for files that could not be read (never shared)
+        type TEXT,
+        parser TEXT, -- metadata 'parser_versions' of the build that parsed it
+        full_content TEXT, -- As stored in files.full_content (possibly compressed, see content_codec.py)
+        start_lineno INTEGER,
+        end_lineno INTEGER,
+        message TEXT,
+        error TEXT,
+        docstring TEXT,
+        UNIQUE (content_hash, type, parser)
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS snapshot_files (
+        snapshot_id INTEGER NOT NULL,
+        path_id INTEGER NOT NULL,
+        content_id INTEGER NOT NULL,
+        PRIMARY KEY (snapshot_id, path_id)
+    ) WITHOUT ROWID''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_snapshot_files_content_id ON snapshot_files (content_id)')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS snapshot_symbols (
+        content_id INTEGER NOT NULL,
+        seq INTEGER NOT NULL, -- Order within the file's symbol index
+        kind TEXT NOT NULL, -- One of SYMBOL_KINDS
+        name TEXT, -- Qualified name ('Class.method'); CSS rules use their selectors
+        symbol_hash TEXT NOT NULL, -- sha256 of the symbol's source text
+        start_lineno INTEGER,
+        end_lineno INTEGER,
+        PRIMARY KEY (content_id, seq)
+    ) WITHOUT ROWID''')
+
+
+def has_snapshot_tables(cursor):
+    """Reports whether the database has snapshot tables."""
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'snapshots'").fetchone() is not None
+
+
+def snapshot_count(db_path):
+    """Returns the number of snapshots stored in a database file, 0 if it has none or cannot be read."""
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            if not has_snapshot_tables(conn.cursor()):
+                return 0
+            return conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return 0
+
+
+def clear_build_tables(conn):
+    """
+    Drops every table, view and index that is not part of the snapshot store, so a full
+    build can recreate its schema in the same file without losing the snapshots.
+    """
+    cursor = conn.cursor()
+    for (name,) in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'view'").fetchall():
+        cursor.execute(f'DROP VIEW IF EXISTS "{name}"')
+    # Virtual tables first: dropping one drops its shadow tables too.
+    for (name,) in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%'").fetchall():
+        cursor.execute(f'DROP TABLE IF EXISTS "{name}"')
+    for (name,) in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+        if name not in KEPT_TABLES:
+            cursor.execute(f'DROP TABLE IF EXISTS "{name}"')
+    conn.commit()
+
+
+def _iter_symbols(cursor, file_ids):
+    """
+    Yields (file_id, kind, name, source, start_lineno, end_lineno) for the symbols of the given files,
+    file by file in table order. The connection needs decompress() (see content_codec.py).
+    """
+    where = "IN (SELECT value FROM json_each(?))"
+    params = (json.dumps(list(file_ids)),)
+
+    def source(alias):
+        return source_spans.SOURCE_SQL.format(t=alias, content='decompress(fc.full_content)')
+
+    for file_id, class_id, qualname, text, start, end in cursor.execute(
+            f"SELECT f.file_id, f.class_id, f.qualname, {source('f')}, f.start_lineno, f.end_lineno FROM python_functions f "
+            f"JOIN files fc ON fc.id = f.file_id WHERE f.file_id {where} ORDER BY f.id", params).fetchall():
+        yield file_id, 'python_method' if class_id is not None else 'python_function', qualname, text, start, end
+    for file_id, name, text, start, end in cursor.execute(
+            f"SELECT c.file_id, c.qualname, {source('c')}, c.start_lineno, c.end_lineno FROM python_classes c "
+            f"JOIN files fc ON fc.id = c.file_id WHERE c.file_id {where} ORDER BY c.id", params).fetchall():
+        yield file_id, 'python_class', name, text, start, end
+    for file_id, class_name, name, text, start, end in cursor.execute(
+            f"SELECT f.file_id, c.name, f.name, {source('f')}, f.start_lineno, f.end_lineno FROM js_functions f "
+            f"JOIN files fc ON fc.id = f.file_id LEFT JOIN js_classes c ON c.id = f.class_id WHERE f.file_id {where} ORDER BY f.id", params).fetchall():
+        if class_name is not None:
+            yield file_id, 'js_method', f"{class_name}.{name}" if name else class_name, text, start, end
+        else:
+            yield file_id, 'js_function', name, text, start, end
+    for file_id, name, text, start, end in cursor.execute(
+            f"SELECT c.file_id, c.name, {source('c')}, c.start_lineno, c.end_lineno FROM js_classes c "
+            f"JOIN files fc ON fc.id = c.file_id WHERE c.file_id {where} ORDER BY c.id", params).fetchall():
+        yield file_id, 'js_class', name, text, start, end
+    for file_id, selectors, at_rule_context, text, start, end in cursor.execute(
+            f"SELECT r.file_id, (SELECT group_concat(s.selector_text, ', ') FROM css_selectors s WHERE s.rule_id = r.id), "
+            f"r.at_rule_context, {source('r')}, r.start_lineno, r.end_lineno FROM css_rules r "
+            f"JOIN files fc ON fc.id = r.file_id WHERE r.file_id {where} ORDER BY r.id", params).fetchall():
+        name = selectors or ''
+        if at_rule_context:
+            name = ' '.join(json.loads(at_rule_context) + [name])
+        yield file_id, 'css_rule', name, text, start, end
+
+
+def _symbol_hash(source):
+    return hashlib.sha256((source or '').encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def _delete_snapshot_rows(cursor, snapshot_id):
+    """Removes a snapshot and every content, symbol index and path no other snapshot references."""
+    cursor.execute("DELETE FROM snapshot_files WHERE snapshot_id = ?", (snapshot_id,))
+    cursor.execute("DELETE FROM snapshots WHERE id = ?", (snapshot_id,))
+    cursor.execute("""
+        DELETE FROM snapshot_symbols WHERE content_id IN (
+            SELECT id FROM snapshot_contents c WHERE NOT EXISTS (SELECT 1 FROM snapshot_files s WHERE s.content_id = c.id))""")
+    cursor.execute("DELETE FROM snapshot_contents WHERE NOT EXISTS (SELECT 1 FROM snapshot_files s WHERE s.content_id = snapshot_contents.id)")
+    cursor.execute("DELETE FROM snapshot_paths WHERE NOT EXISTS (SELECT 1 FROM snapshot_files s WHERE s.path_id = snapshot_paths.id)")
+
+
+def record_snapshot(conn, name):
+    """
+    Records the database's current build as snapshot name, replacing any snapshot of that name.
+
+    Only contents no snapshot holds yet are copied, and only their symbols
+    are indexed. Commits, and returns a dict with the snapshot's 'file_count',
+    'new_contents' and 'new_symbols'. The connection needs decompress()
+    (see content_codec.register_sqlite_functions()).
+    """
+    cursor = conn.cursor()
+    create_tables(cursor)
+    metadata = dict(cursor.execute("SELECT key, value FROM metadata").fetchall())
+    parser = metadata.get('parser_versions', '')
+
+    existing = cursor.execute("SELECT id FROM snapshots WHERE name = ?", (name,)).fetchone()
+    if existing is not None:
+        _delete_snapshot_rows(cursor, existing[0])
+    cursor.execute("INSERT INTO snapshots (name, created_time, root_directory, git_revision) VALUES (?, ?, ?, ?)",
+                   (name, datetime.now().isoformat(), metadata.get('root_directory'), metadata.get('git_revision')))
+    snapshot_id = cursor.lastrowid
+    cursor.execute("INSERT OR IGNORE INTO snapshot_paths (path) SELECT path FROM files")
+
+    # New contents, without reading full_content for the ones already stored.
+    first_new_id = cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM snapshot_contents").fetchone()[0]
+    content_columns = "type, full_content, start_lineno, end_lineno, message, error, docstring"
+    cursor.execute(f"""
+        INSERT OR IGNORE INTO snapshot_contents (content_hash, parser, {content_columns})
+        SELECT f.content_hash, ?, {', '.join('f.' + c for c in content_columns.split(', '))} FROM files f
+        WHERE f.content_hash IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM snapshot_contents c WHERE c.content_hash = f.content_hash AND c.type = f.type AND c.parser = ?)
+        ORDER BY f.id""", (parser, parser))
+    cursor.execute("""
+        INSERT INTO snapshot_files (snapshot_id, path_id, content_id)
+        SELECT ?, p.id, c.id FROM files f JOIN snapshot_paths p ON p.path = f.path
+        JOIN snapshot_contents c ON c.content_hash = f.content_hash AND c.type = f.type AND c.parser = ?""", (snapshot_id, parser))
+    new_contents = {content_id: file_id for content_id, file_id in cursor.execute("""
+        SELECT c.id, MIN(f.id) FROM snapshot_contents c JOIN files f ON f.content_hash = c.content_hash AND f.type = c.type
+        WHERE c.id >= ? GROUP BY c.id""", (first_new_id,)).fetchall()}
+    # Files without a content hash could not be read; each gets a content of its own.
+    for file_id, path in cursor.execute("SELECT id, path FROM files WHERE content_hash IS NULL").fetchall():
+        cursor.execute(f"INSERT INTO snapshot_contents (content_hash, parser, {content_columns}) "
+                       f"SELECT NULL, ?, {content_columns} FROM files WHERE id = ?", (parser, file_id))
+        new_contents[cursor.lastrowid] = file_id
+        cursor.execute("INSERT INTO snapshot_files (snapshot_id, path_id, content_id) SELECT ?, id, ? FROM snapshot_paths WHERE path = ?",
+                       (snapshot_id, cursor.lastrowid, path))
+
+    content_ids_by_file = {file_id: content_id for content_id, file_id in new_contents.items()}
+    symbol_rows = []
+    sequence = {}
+    for file_id, kind, symbol_name, source, start, end in _iter_symbols(cursor, content_ids_by_file):
+        content_id = content_ids_by_file[file_id]
+        seq = sequence[content_id] = sequence.get(content_id, 0) + 1
+        symbol_rows.append((content_id, seq, kind, symbol_name, _symbol_hash(source), start, end))
+    cursor.executemany("INSERT INTO snapshot_symbols (content_id, seq, kind, name, symbol_hash, start_lineno, end_lineno) VALUES (?, ?, ?, ?, ?, ?, ?)", symbol_rows)
+
+    file_count = cursor.execute("SELECT COUNT(*) FROM snapshot_files WHERE snapshot_id = ?", (snapshot_id,)).fetchone()[0]
+    cursor.execute("UPDATE snapshots SET file_count = ? WHERE id = ?", (file_count, snapshot_id))
+    conn.commit()
+    return {'file_count': file_count, 'new_contents': len(new_contents), 'new_symbols': len(symbol_rows)}
+
+
+def delete_snapshot(conn, name):
+    """Deletes a snapshot and the contents only it referenced. Returns False if there is no such snapshot."""
+    cursor = conn.cursor()
+    if not has_snapshot_tables(cursor):
+        return False
+    row = cursor.execute("SELECT id FROM snapshots WHERE name = ?", (name,)).fetchone()
+    if row is None:
+        return False
+    _delete_snapshot_rows(cursor, row[0])
+    conn.commit()
+    return True
+
+
+def list_snapshots(conn):
+    """Returns [{'name', 'created_time', 'git_revision', 'file_count'}] for every snapshot, oldest first."""
+    if not has_snapshot_tables(conn.cursor()):
+        return []
+    return [{'name': name, 'created_time': created, 'git_revision': revision, 'file_count': file_count}
+            for name, created, revision, file_count in conn.execute(
+                "SELECT name, created_time, git_revision, file_count FROM snapshots ORDER BY id")]
+
+
+def _snapshot_id(cursor, name):
+    row = cursor.execute("SELECT id FROM snapshots WHERE name = ?", (name,)).fetchone() if has_snapshot_tables(cursor) else None
+    if row is None:
+        raise ValueError(f"No snapshot named '{name}'.")
+    return row[0]
+
+
+def _symbol_index(cursor, content_id):
+    """Returns {(kind, name): (symbol_hash, start_lineno, end_lineno)} for a content; repeated names get a ' #n' suffix."""
+    symbols = {}
+    if content_id is None:
+        return symbols
+    for kind, name, symbol_hash, start, end in cursor.execute(
+            "SELECT kind, name, symbol_hash, start_lineno, end_lineno FROM snapshot_symbols WHERE content_id = ? ORDER BY seq", (content_id,)):
+        key = (kind, name)
+        occurrence = 1
+        while key in symbols:
+            occurrence += 1
+            key = (kind, f"{name} #{occurrence}")
+        symbols[key] = (symbol_hash, start, end)
+    return symbols
+
+
+def diff_snapshots(conn, old_name, new_name):
+    """
+    Compares two snapshots by content hashes.
+
+    Returns {'files': {'added', 'removed', 'changed'}, 'symbols': {'added',
+    'removed', 'changed'}}. File lists hold paths, sorted; symbol lists hold
+    {'path', 'kind', 'name', 'start_lineno', 'end_lineno'} dicts (the line
+    span is the old one for removed symbols). Symbols of added and removed
+    files are reported as added and removed. Raises ValueError for an
+    unknown snapshot name.
+    """
+    cursor = conn.cursor()
+    old_id, new_id = _snapshot_id(cursor, old_name), _snapshot_id(cursor, new_name)
+    rows = cursor.execute("""
+        SELECT p.path, o.content_id, n.content_id FROM snapshot_files o
+        LEFT JOIN snapshot_files n ON n.snapshot_id = :new AND n.path_id = o.path_id
+        JOIN snapshot_paths p ON p.id = o.path_id
+        WHERE o.snapshot_id = :old AND n.content_id IS NOT o.content_id
+        UNION ALL
+        SELECT p.path, NULL, n.content_id FROM snapshot_files n JOIN snapshot_paths p ON p.id = n.path_id
+        WHERE n.snapshot_id = :new AND NOT EXISTS (SELECT 1 FROM snapshot_files o WHERE o.snapshot_id = :old AND o.path_id = n.path_id)
+        ORDER BY 1""", {'old': old_id, 'new': new_id}).fetchall()
+
+    result = {'files': {'added': [], 'removed': [], 'changed': []}, 'symbols': {'added': [], 'removed': [], 'changed': []}}
+    for path, old_content, new_content in rows:
+        if old_content is None: result['files']['added'].append(path)
+        elif new_content is None: result['files']['removed'].append(path)
+        else: result['files']['changed'].append(path)
+
+        old_symbols, new_symbols = _symbol_index(cursor, old_content), _symbol_index(cursor, new_content)
+        for key, (symbol_hash, start, end) in new_symbols.items():
+            previous = old_symbols.get(key)
+            if previous is None or previous[0] != symbol_hash:
+                change = 'added' if previous is None else 'changed'
+                result['symbols'][change].append({'path': path, 'kind': key[0], 'name': key[1], 'start_lineno': start, 'end_lineno': end})
+        for key, (_, start, end) in old_symbols.items():
+            if key not in new_symbols:
+                result['symbols']['removed'].append({'path': path, 'kind': key[0], 'name': key[1], 'start_lineno': start, 'end_lineno': end})
+    return result
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Record, list and compare snapshots of a project context database.")
+    parser.add_argument("-d", "--database", default="project_context.db", help="Context database path (default: project_context.db).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List the stored snapshots.")
+    create_parser = commands.add_parser("create", help="Record the database's current build as a snapshot (replacing one of the same name).")
+    create_parser.add_argument("name")
+    delete_parser = commands.add_parser("delete", help="Delete a snapshot and the contents only it referenced.")
+    delete_parser.add_argument("name")
+    diff_parser = commands.add_parser("diff", help="Report files and symbols added, removed or changed between two snapshots.")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new")
+    diff_parser.add_argument("--files-only", action="store_true", help="Do not list symbol changes.")
+    diff_parser.add_argument("--json", action="store_true", help="Print the diff as JSON.")
+    args = parser.parse_args(argv)
+
+    conn = content_codec.connect(args.database)
+    try:
+        if args.command == "list":
+            for snapshot in list_snapshots(conn):
+                revision = f"  {snapshot['git_revision'][:12]}" if snapshot['git_revision'] else ""
+                print(f"{snapshot['name']}  {snapshot['created_time']}  {snapshot['file_count']} files{revision}")
+        elif args.command == "create":
+            start = time.perf_counter()
+            stats = record_snapshot(conn, args.name)
+            print(f"Recorded snapshot '{args.name}': {stats['file_count']} files, {stats['new_contents']} new contents "
+                  f"and {stats['new_symbols']} new symbols stored in {time.perf_counter() - start:.2f}s.")
+        elif args.command == "delete":
+            if not delete_snapshot(conn, args.name):
+                sys.exit(f"No snapshot named '{args.name}'.")
+            print(f"Deleted snapshot '{args.name}'.")
+        else:
+            start = time.perf_counter()
+            result = diff_snapshots(conn, args.old, args.new)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if args.json:
+                print(json.dumps(result, indent=2))
+                return
+            symbols_by_path = {}
+            for change, marker in (('added', '+'), ('removed', '-'), ('changed', '~')):
+                for symbol in result['symbols'][change]:
+                    symbols_by_path.setdefault(symbol['path'], []).append((marker, symbol))
+            for change, marker in (('added', 'A'), ('removed', 'D'), ('changed', 'M')):
+                for path in result['files'][change]:
+                    print(f"{marker} {path}")
+                    if args.files_only:
+                        continue
+                    for symbol_marker, symbol in symbols_by_path.get(path, []):
+                        print(f"    {symbol_marker} [{symbol['kind']}] {symbol['name']} ({symbol['start_lineno']}-{symbol['end_lineno']})")
+            files, symbols = result['files'], result['symbols']
+            print(f"{len(files['added'])} files added, {len(files['removed'])} removed, {len(files['changed'])} changed; "
+                  f"{len(symbols['added'])} symbols added, {len(symbols['removed'])} removed, {len(symbols['changed'])} changed "
+                  f"({elapsed_ms:.1f} ms)")
+    except (ValueError, sqlite3.Error) as e:
+        sys.exit(str(e))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#file_watcher.py
+
+"""
+Change notification for build_code_db.py --watch.
+
+A watcher reports which directories of the project changed, in the
+directory_tree path format ('' for the root, 'a/b/' otherwise), so that the
+builder only lists those directories again (see the changed_dirs argument
+of build_code_db.build_project_database()). Two implementations share one
+interface:
+
+    InotifyWatcher  Linux inotify through ctypes (no third-party package):
+                    one watch per directory, events arrive as files are saved.
+    PollingWatcher  Everywhere else: re-stats the tree every interval and
+                    compares each directory's listing with the previous pass.
+
+Both walk the tree with the builder's PathFilter, so excluded and ignored
+directories are neither watched nor polled, and changes to ignored files do
+not trigger updates. A change to an ignore file makes wait() return None,
+which asks the caller for a full rescan, since it can change what is listed
+anywhere below it.
+
+wait() blocks until something changes, then keeps collecting changes until
+none has arrived for the debounce interval (bounded by max_delay), so a
+burst such as a branch switch or an editor's write-rename-chmod sequence
+becomes a single update.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+import ignore_rules
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+EVENT_HEADER = struct.Struct('iIII') # wd, mask, cookie, len
+
+DEFAULT_DEBOUNCE_SECONDS = 0.05
+DEFAULT_MAX_DELAY_SECONDS = 1.0
+DEFAULT_POLL_INTERVAL_SECONDS = 1.0
+
+
+def _load_libc():
+    """Returns libc with the inotify functions, or None where they are unavailable."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load_libc()
+INOTIFY_AVAILABLE = _libc is not None
+
+
+def _is_ignore_file(name):
+    return name in (ignore_rules.GITIGNORE_FILENAME, ignore_rules.PROJECT_IGNORE_FILENAME)
+
+
+def walk_directories(root_dir, path_filter):
+    """
+    Walks the tree as the builder does, yielding (dir_path, subdir, rules, file_names) per directory.
+
+    dir_path is the directory_tree path, subdir the filesystem path and rules
+    its ignore_rules.DirectoryRules; pruned directories are not entered.
+    """
+    for subdir, dirs, files_in_dir in os.walk(root_dir, followlinks=False):
+        relative_subdir = os.path.relpath(subdir, root_dir).replace("\\", "/")
+        rules = path_filter.enter_directory(relative_subdir, files_in_dir)
+        dirs[:] = [d for d in dirs if rules.classify_dir(d) is None]
+        yield ('' if relative_subdir == "." else f"{relative_subdir}/"), subdir, rules, files_in_dir
+
+
+class _Watcher:
+    """Shared debouncing loop; subclasses implement _poll(timeout)."""
+
+    def __init__(self, root_dir, make_path_filter, ignored_paths=()):
+        self.root_dir = root_dir
+        self.make_path_filter = make_path_filter
+        self.ignored_paths = set(ignored_paths) # e.g. the output database and its journal files
+        self.rules_by_dir = {}
+
+    def _is_relevant(self, dir_path, name, is_dir):
+        """Reports whether a change to dir_path + name could change what the builder stores."""
+        if dir_path + name in self.ignored_paths:
+            return False
+        rules = self.rules_by_dir.get(dir_path)
+        if rules is None or is_dir:
+            return True
+        return rules.classify_file(name)[0] != ignore_rules.IGNORED
+
+    def wait(self, debounce=DEFAULT_DEBOUNCE_SECONDS, max_delay=DEFAULT_MAX_DELAY_SECONDS):
+        """
+        Blocks until the tree changes and the changes settle.
+
+        Returns (changed_dirs, first_change_time): the set of changed directory
+        paths, or None if everything must be rescanned, and the time.time() at
+        which the first change of the batch was seen.
+        """
+        changed_dirs = set()
+        rescan = False
+        first_change_time = None
+        deadline = None
+        while True:
+            if first_change_time is None:
+                timeout = None
+            else:
+                timeout = max(0.0, min(debounce, deadline - time.monotonic()))
+            batch = self._poll(timeout)
+            if batch is None or batch:
+                if first_change_time is None:
+                    first_change_time = time.time()
+                    deadline = time.monotonic() + max_delay
+                if batch is None: rescan = True
+                else: changed_dirs.update(batch)
+            elif first_change_time is not None:
+                return (None if rescan else changed_dirs), first_change_time
+            if first_change_time is not None and time.monotonic() >= deadline:
+                return (None if rescan else changed_dirs), first_change_time
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(_Watcher):
+    """Watches every listed directory with inotify."""
+
+    name = 'inotify'
+
+    def __init__(self, root_dir, make_path_filter, ignored_paths=()):
+        super().__init__(root_dir, make_path_filter, ignored_paths)
+        self.fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs_by_wd = {}
+        self.wds_by_dir = {}
+        self.sync()
+
+    def sync(self):
+        """(Re)walks the tree, watching new directories and forgetting vanished ones."""
+        self.rules_by_dir = {}
+        listed = {}
+        for dir_path, subdir, rules, _ in walk_directories(self.root_dir, self.make_path_filter()):
+            self.rules_by_dir[dir_path] = rules
+            listed[dir_path] = subdir
+        # Forget vanished paths first: a directory moved within the tree keeps its inode, and so its watch.
+        for dir_path in list(self.wds_by_dir):
+            if dir_path not in listed:
+                wd = self.wds_by_dir.pop(dir_path)
+                self.dirs_by_wd.pop(wd, None)
+                _libc.inotify_rm_watch(self.fd, wd)
+        for dir_path, subdir in listed.items():
+            if dir_path in self.wds_by_dir:
+                continue
+            wd = _libc.inotify_add_watch(self.fd, os.fsencode(subdir), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    raise OSError(error, "inotify watch limit reached (see /proc/sys/fs/inotify/max_user_watches)")
+                continue # Vanished or unreadable since it was listed
+            self.dirs_by_wd[wd] = dir_path
+            self.wds_by_dir[dir_path] = wd
+
+    def _poll(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed_dirs = set()
+        rescan = resync = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + name_length].rstrip(b'\0'))
+            offset += EVENT_HEADER.size + name_length
+            if mask & IN_Q_OVERFLOW:
+                rescan = resync = True
+                continue
+            dir_path = self.dirs_by_wd.get(wd)
+            if mask & IN_IGNORED:
+                # The watch is gone (directory deleted or moved away); its parent reports the change.
+                if dir_path is not None and self.wds_by_dir.get(dir_path) == wd:
+                    del self.wds_by_dir[dir_path]
+                self.dirs_by_wd.pop(wd, None)
+                continue
+            if dir_path is None or not name:
+                continue # Events about the watched directory itself are reported by its parent
+            is_dir = bool(mask & IN_ISDIR)
+            if not self._is_relevant(dir_path, name, is_dir):
+                continue
+            changed_dirs.add(dir_path)
+            if _is_ignore_file(name):
+                rescan = resync = True
+            elif is_dir and mask & (IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE):
+                resync = True # Watch (or stop watching) the directory and anything already inside it
+        if resync:
+            try:
+                self.sync()
+            except OSError as e:
+                print(f"Warning: could not watch every directory: {e}")
+        return None if rescan else changed_dirs
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher(_Watcher):
+    """Re-stats the tree every interval and reports directories whose listing changed."""
+
+    name = 'polling'
+
+    def __init__(self, root_dir, make_path_filter, ignored_paths=(), interval=DEFAULT_POLL_INTERVAL_SECONDS):
+        super().__init__(root_dir, make_path_filter, ignored_paths)
+        self.interval = interval
+        self.snapshot, self.ignore_file_state = self._take_snapshot()
+
+    def _take_snapshot(self):
+        """Returns ({dir_path: listing signature}, ignore file signature) for the current tree."""
+        snapshot = {}
+        ignore_file_state = []
+        self.rules_by_dir = {}
+        for dir_path, subdir, rules, file_names in walk_directories(self.root_dir, self.make_path_filter()):
+            self.rules_by_dir[dir_path] = rules
+            listing = []
+            for name in sorted(file_names):
+                if not _is_ignore_file(name) and not self._is_relevant(dir_path, name, False):
+                    continue
+                try:
+                    stat_result = os.stat(os.path.join(subdir, name))
+                    signature = (name, stat_result.st_size, stat_result.st_mtime_ns)
+                except OSError:
+                    signature = (name, None, None)
+                listing.append(signature)
+                if _is_ignore_file(name):
+                    ignore_file_state.append((dir_path,) + signature)
+            snapshot[dir_path] = listing
+        return snapshot, ignore_file_state
+
+    def _poll(self, timeout):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        snapshot, ignore_file_state = self._take_snapshot()
+        previous, self.snapshot = self.snapshot, snapshot
+        if ignore_file_state != self.ignore_file_state:
+            self.ignore_file_state = ignore_file_state
+            return None
+        changed_dirs = {dir_path for dir_path, listing in snapshot.items() if previous.get(dir_path) != listing}
+        # A vanished directory changes its parent's listing of subdirectories.
+        for dir_path in previous.keys() - snapshot.keys():
+            parent, _, _ = dir_path.rstrip('/').rpartition('/')
+            changed_dirs.add(f"{parent}/" if parent else '')
+        return changed_dirs
+
+
+def create_watcher(root_dir, make_path_filter, ignored_paths=(), polling=False, interval=DEFAULT_POLL_INTERVAL_SECONDS):
+    """Returns an InotifyWatcher where possible, else (or with polling=True) a PollingWatcher."""
+    if not polling and INOTIFY_AVAILABLE:
+        try:
+            return InotifyWatcher(root_dir, make_path_filter, ignored_paths)
+        except OSError as e:
+            print(f"Warning: inotify unavailable ({e}); falling back to polling every {interval}s.")
+    return PollingWatcher(root_dir, make_path_filter, ignored_paths, interval=interval)
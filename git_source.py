@@ -0,0 +1,163 @@
+#git_source.py
+
+"""
+Reads a project tree straight from a git revision, for build_code_db.py --rev.
+
+Building the context of a historical commit normally means checking it out
+first, which rewrites the working tree and is slow for large projects.
+Instead, the tree is enumerated with `git ls-tree -r -l -z` and file
+contents are streamed from the object database through a single
+long-lived `git cat-file --batch` process, so no files are written and git
+is started twice per revision (plus once per run), not once per file.
+
+walk_tree() presents the listing in the shape os.walk() yields, so the
+builder's walk, pruning and classification code is shared with working-tree
+builds. Only regular files are listed: symlinks and submodules (gitlinks)
+have no content of their own in the revision and are skipped. Paths are
+relative to the directory git is run in, so a root_dir inside the
+repository builds just that subtree, as it does for the working tree.
+
+Blob object ids identify contents exactly, which is what lets the builder
+reuse a file's parse result across revisions without reading it again.
+"""
+
+import os
+import subprocess
+
+GIT_EXECUTABLE = 'git'
+
+# `git ls-tree` modes of the entries the builder can read.
+REGULAR_FILE_MODES = ('100644', '100755')
+
+
+def _run_git(repo_dir, *args):
+    """Runs a git command in repo_dir and returns its stdout bytes; raises RuntimeError with git's message on failure."""
+    try:
+        result = subprocess.run([GIT_EXECUTABLE, '-C', repo_dir, *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise RuntimeError(f"could not run git: {e}") from e
+    if result.returncode != 0:
+        message = result.stderr.decode('utf-8', 'replace').strip() or f"exit status {result.returncode}"
+        raise RuntimeError(f"git {args[0]} failed: {message}")
+    return result.stdout
+
+
+def resolve_revisions(repo_dir, revisions):
+    """
+    Resolves revision arguments to commit ids, in order.
+
+    Each argument is anything `git rev-parse` accepts (a branch, tag, sha,
+    'HEAD~3', ...) or a range such as 'v1.0..main', which expands to the
+    commits in it, oldest first (`git rev-list --reverse`).
+    """
+    commits = []
+    for revision in revisions:
+        if '..' in revision:
+            output = _run_git(repo_dir, 'rev-list', '--reverse', revision, '--')
+            commits.extend(output.decode('ascii').split())
+        else:
+            output = _run_git(repo_dir, 'rev-parse', '--verify', '--quiet', f"{revision}^{{commit}}")
+            commits.append(output.decode('ascii').strip())
+    return commits
+
+
+def list_tree(repo_dir, commit):
+    """
+    Lists the regular files of a commit under repo_dir.
+
+    Returns {relative_path: (blob_id, size)}, with '/'-separated paths
+    relative to repo_dir, and the number of entries skipped (symlinks and
+    submodules).
+    """
+    output = _run_git(repo_dir, 'ls-tree', '-r', '-l', '-z', commit)
+    entries = {}
+    skipped = 0
+    for record in output.split(b'\0'):
+        if not record:
+            continue
+        info, _, path = record.partition(b'\t')
+        mode, _, blob_id, size = info.split(None, 3)
+        if mode.decode('ascii') not in REGULAR_FILE_MODES:
+            skipped += 1
+            continue
+        entries[os.fsdecode(path)] = (blob_id.decode('ascii'), int(size))
+    return entries, skipped
+
+
+def walk_tree(root_dir, paths):
+    """
+    Yields (dirpath, dirnames, filenames) for a listing of file paths, top-down like os.walk(root_dir).
+
+    dirpath is root_dir joined with the directory's relative path. As with
+    os.walk, removing names from dirnames prunes those directories.
+    """
+    children = {'': ([], [])} # relative dir -> (subdirectory names, file names)
+    for path in paths:
+        parent, _, name = path.rpartition('/')
+        entry = children.get(parent)
+        if entry is None:
+            # First file in this directory: link it, and any ancestors not seen yet, into their parents.
+            entry = children[parent] = ([], [])
+            child = parent
+            while True:
+                grandparent, _, dir_name = child.rpartition('/')
+                grandparent_entry = children.get(grandparent)
+                if grandparent_entry is not None:
+                    grandparent_entry[0].append(dir_name)
+                    break
+                children[grandparent] = ([dir_name], [])
+                child = grandparent
+        entry[1].append(name)
+
+    stack = ['']
+    while stack:
+        relative_dir = stack.pop()
+        dirnames, filenames = children[relative_dir]
+        dirnames = list(dirnames)
+        yield (os.path.join(root_dir, relative_dir) if relative_dir else root_dir), dirnames, filenames
+        prefix = f"{relative_dir}/" if relative_dir else ''
+        stack.extend(prefix + name for name in reversed(dirnames))
+
+
+class BlobReader:
+    """
+    Streams blob contents from one long-lived `git cat-file --batch` process.
+
+    Use as a context manager, or call close() when done; the same reader can
+    serve any number of revisions of the repository.
+    """
+
+    def __init__(self, repo_dir):
+        try:
+            self.process = subprocess.Popen([GIT_EXECUTABLE, '-C', repo_dir, 'cat-file', '--batch'],
+                                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        except OSError as e:
+            raise RuntimeError(f"could not run git: {e}") from e
+        self.bytes_read = 0
+
+    def read(self, blob_id):
+        """Returns the contents of a blob as bytes."""
+        self.process.stdin.write(blob_id.encode('ascii') + b'\n')
+        self.process.stdin.flush()
+        header = self.process.stdout.readline().split()
+        if len(header) != 3 or header[1] != b'blob':
+            raise RuntimeError(f"git cat-file could not read blob {blob_id}: {b' '.join(header).decode('ascii', 'replace') or 'no output'}")
+        size = int(header[2])
+        data = self.process.stdout.read(size)
+        self.process.stdout.read(1) # The newline after the contents
+        if len(data) != size:
+            raise RuntimeError(f"git cat-file ended while reading blob {blob_id}")
+        self.bytes_read += size
+        return data
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+        self.process.stdout.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,290 @@
+#ignore_rules.py
+
+"""
+Path filtering for the project walk, shared by build_code_db.py and build_code_json.py.
+
+A PathFilter merges everything that decides whether and how a path is
+scanned into one object:
+
+  - the builders' configuration sets (EXCLUDED_DIRS, EXCLUDED_FILENAMES,
+    BINARY_EXTENSIONS, IGNORED_TEXT_EXTENSIONS, MANAGED_EXTENSIONS,
+    MANAGED_FILENAMES and INCLUDE_CONTENT_FOR_SPECIFIC_FILENAMES), folded
+    into two lookup tables (by file name, then by extension) so a file is
+    classified with at most two dict lookups;
+  - .gitignore files, read hierarchically as the walk enters each directory,
+    plus the repository's .git/info/exclude;
+  - an optional project ignore file (PROJECT_IGNORE_FILENAME in the project
+    root, or any file given with --ignore-file) in .gitignore syntax, which
+    takes precedence over all of them.
+
+Ignored directories are pruned before os.walk descends into them, and
+ignored paths are left out of the directory tree entirely, like
+EXCLUDED_DIRS. As in git, a file inside an ignored directory cannot be
+re-included by a negated pattern, and among matching patterns the one from
+the deepest ignore file wins, the last one within a file.
+
+Each ignore file's patterns are compiled into regular expressions once; a
+file without negated patterns becomes a single alternation, so a path is
+checked against it with one match.
+"""
+
+import os
+import re
+
+PROJECT_IGNORE_FILENAME = '.contextignore'
+GITIGNORE_FILENAME = '.gitignore'
+
+# File decisions returned by DirectoryRules.classify_file().
+IGNORED = 'ignored' # Matched an ignore file: no entry and not in the directory tree
+EXCLUDED_FILENAME = 'excluded_filename'
+BINARY_EXTENSION = 'binary_extension'
+IGNORED_TEXT = 'ignored_text'
+MANAGED = 'managed'
+ALLOW_LISTED = 'allow_listed'
+INCLUDED = 'included'
+# Directory decisions returned by DirectoryRules.classify_dir(); None means descend.
+EXCLUDED_DIR = 'excluded_dir'
+
+
+def _translate_pattern(pattern):
+    """Translates a gitignore glob (without its leading or trailing '/') into a regex fragment."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**', i) and (i == 0 or pattern[i - 1] == '/') and (i + 2 == n or pattern[i + 2] == '/'):
+                if i + 2 == n:
+                    out.append('.*') # Trailing '/**': everything inside
+                    i += 2
+                else:
+                    out.append('(?:.*/)?') # '**/': zero or more directories
+                    i += 3
+                continue
+            while i < n and pattern[i] == '*': i += 1 # Any other run of stars is a single '*'
+            out.append('[^/]*')
+            continue
+        if c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            j = i + 1
+            if j < n and pattern[j] in '!^': j += 1
+            if j < n and pattern[j] == ']': j += 1
+            while j < n and pattern[j] != ']': j += 1
+            if j >= n:
+                out.append(re.escape(c)) # Unclosed: a literal '['
+            else:
+                body = pattern[i + 1:j].replace('\\', '\\\\')
+                body = re.sub(r'([&~|\[])', r'\\\1', body)
+                if body[0] in '!^': body = '^' + body[1:]
+                out.append(f'(?!/)[{body}]')
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+
+def parse_ignore_lines(lines):
+    """
+    Parses .gitignore syntax into (regex, negated, directory_only) rules, in file order.
+
+    Each regex matches a '/'-separated path relative to the directory holding
+    the ignore file. Blank lines and '#' comments are skipped; '\\#' and '\\!'
+    escape a leading '#' or '!', and trailing spaces are dropped unless escaped.
+    """
+    rules = []
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line or line.startswith('#'):
+            continue
+        while line.endswith(' ') and not line.endswith('\\ '):
+            line = line[:-1]
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+        elif line.startswith(('\\!', '\\#')):
+            line = line[1:]
+        directory_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+        # A slash at the start or in the middle anchors the pattern to the ignore file's directory.
+        anchored = '/' in line
+        line = line.lstrip('/')
+        regex = _translate_pattern(line)
+        if not anchored:
+            regex = '(?:.*/)?' + regex
+        rules.append((regex, negated, directory_only))
+    return rules
+
+
+class IgnoreFile:
+    """The compiled rules of one ignore file, which apply to paths under its directory."""
+
+    def __init__(self, base, rules, source=None):
+        self.base = base # '' for the project root, else 'dir/sub/'
+        self.source = source
+        self.has_negation = any(negated for _, negated, _ in rules)
+        if self.has_negation:
+            # Last matching rule wins, so check them from the end.
+            self.rules = [(re.compile(regex + '\\Z', re.DOTALL), negated, directory_only) for regex, negated, directory_only in reversed(rules)]
+        else:
+            file_rules = [regex for regex, _, directory_only in rules if not directory_only]
+            self.any_regex = re.compile('(?:%s)\\Z' % '|'.join(regex for regex, _, _ in rules), re.DOTALL)
+            self.file_regex = re.compile('(?:%s)\\Z' % '|'.join(file_rules), re.DOTALL) if file_rules else None
+
+    @classmethod
+    def load(cls, filepath, base=''):
+        """Reads an ignore file, returning None if it is missing, unreadable or has no rules."""
+        try:
+            with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+                rules = parse_ignore_lines(f)
+        except OSError:
+            return None
+        return cls(base, rules, source=filepath) if rules else None
+
+    def match(self, relative_path, is_dir):
+        """Returns True if the path is ignored, False if a negated rule re-includes it, None if no rule matches."""
+        if not self.has_negation:
+            regex = self.any_regex if is_dir else self.file_regex
+            return True if regex is not None and regex.match(relative_path) else None
+        for regex, negated, directory_only in self.rules:
+            if directory_only and not is_dir:
+                continue
+            if regex.match(relative_path):
+                return not negated
+        return None
+
+
+class DirectoryRules:
+    """Decides the fate of the entries of one directory during the walk."""
+
+    def __init__(self, path_filter, prefix, ignore_files):
+        self.path_filter = path_filter
+        self.prefix = prefix # Path of this directory relative to the root, '' or ending in '/'
+        self.ignore_files = ignore_files # Deepest (highest precedence) first
+
+    def is_ignored(self, name, is_dir):
+        """Reports whether the entry called name matches the ignore files in effect here."""
+        relative_path = self.prefix + name
+        for ignore_file in self.ignore_files:
+            result = ignore_file.match(relative_path[len(ignore_file.base):], is_dir)
+            if result is not None:
+                return result
+        return False
+
+    def classify_dir(self, name):
+        """Returns EXCLUDED_DIR or IGNORED for a subdirectory the walk must not enter, else None."""
+        if name in self.path_filter.excluded_dirs:
+            return EXCLUDED_DIR
+        if self.ignore_files and self.is_ignored(name, True):
+            self.path_filter.ignored_dir_count += 1
+            return IGNORED
+        return None
+
+    def classify_file(self, name):
+        """Returns a (decision, file_extension_lower) pair for a file in this directory."""
+        if self.ignore_files and self.is_ignored(name, False):
+            self.path_filter.ignored_file_count += 1
+            return IGNORED, None
+        return self.path_filter.classify_name(name)
+
+
+class PathFilter:
+    """
+    Merges the builders' configuration sets and the project's ignore files into one decision per path.
+
+    Args:
+        root_dir: The project root being walked.
+        excluded_dirs, excluded_filenames, binary_extensions, ignored_text_extensions,
+        managed_extensions, managed_filenames, include_content_filenames: The builder's configuration sets.
+        use_gitignore: Whether to honour .gitignore files and .git/info/exclude.
+        ignore_file: Path of the project ignore file; defaults to PROJECT_IGNORE_FILENAME in root_dir if present.
+    """
+
+    def __init__(self, root_dir, excluded_dirs, excluded_filenames, binary_extensions, ignored_text_extensions,
+                 managed_extensions, managed_filenames, include_content_filenames, use_gitignore=True, ignore_file=None):
+        self.root_dir = root_dir
+        self.excluded_dirs = frozenset(excluded_dirs)
+        self.use_gitignore = use_gitignore
+        self.ignored_dir_count = 0
+        self.ignored_file_count = 0
+
+        # Extension table first; the name table then overrides it in the order the builders
+        # always applied the sets: excluded names, binary extensions, managed, allow-listed, ignored text.
+        self._by_extension = {}
+        for ext in ignored_text_extensions: self._by_extension[ext] = IGNORED_TEXT
+        for ext in managed_extensions: self._by_extension[ext] = MANAGED
+        for ext in binary_extensions: self._by_extension[ext] = BINARY_EXTENSION
+        self._by_name = {}
+        for name in include_content_filenames:
+            if self._extension_decision(name) != MANAGED: self._by_name[name] = ALLOW_LISTED
+        for name in managed_filenames: self._by_name[name] = MANAGED
+        for name in list(self._by_name):
+            if self._extension_decision(name) == BINARY_EXTENSION: del self._by_name[name]
+        for name in excluded_filenames: self._by_name[name] = EXCLUDED_FILENAME
+
+        self._project_rules = None
+        if ignore_file is None:
+            default_ignore_file = os.path.join(root_dir, PROJECT_IGNORE_FILENAME)
+            ignore_file = default_ignore_file if os.path.isfile(default_ignore_file) else None
+        if ignore_file is not None:
+            if os.path.isfile(ignore_file):
+                self._project_rules = IgnoreFile.load(ignore_file)
+            else:
+                print(f"Warning: ignore file '{ignore_file}' not found; continuing without it.")
+        outer_ignore_files = []
+        if use_gitignore:
+            exclude_rules = IgnoreFile.load(os.path.join(root_dir, '.git', 'info', 'exclude'))
+            if exclude_rules is not None: outer_ignore_files.append(exclude_rules)
+        self._outer_ignore_files = tuple(outer_ignore_files) # Lowest precedence, below every .gitignore
+        self.ignore_sources = [f.source for f in (self._project_rules, *outer_ignore_files) if f is not None]
+        self._ignore_files_by_dir = {}
+        self._name_decisions = {} # File names recur across directories (__init__.py, index.js, ...)
+
+    def _extension_decision(self, name):
+        return self._by_extension.get(os.path.splitext(name)[1].lower())
+
+    def classify_name(self, name):
+        """Returns the (decision, file_extension_lower) pair the configuration sets give a file name."""
+        result = self._name_decisions.get(name)
+        if result is None:
+            file_extension_lower = os.path.splitext(name)[1].lower()
+            decision = self._by_name.get(name) or self._by_extension.get(file_extension_lower, INCLUDED)
+            result = self._name_decisions[name] = (decision, file_extension_lower)
+        return result
+
+    def enter_directory(self, relative_dir, file_names):
+        """
+        Returns the DirectoryRules for a directory the walk has just listed.
+
+        relative_dir is the directory's '/'-separated path relative to the root
+        ('.' for the root itself) and file_names its files, which tell whether
+        it has a .gitignore to read. Parents must be entered before their
+        subdirectories, as a top-down os.walk does.
+        """
+        if relative_dir in ('.', ''):
+            prefix, inherited = '', self._outer_ignore_files
+        else:
+            prefix = relative_dir + '/'
+            parent = relative_dir.rpartition('/')[0]
+            inherited = self._ignore_files_by_dir.get(parent, self._outer_ignore_files)
+        ignore_files = inherited
+        if self.use_gitignore and GITIGNORE_FILENAME in file_names:
+            gitignore = IgnoreFile.load(os.path.join(self.root_dir, prefix, GITIGNORE_FILENAME), base=prefix)
+            if gitignore is not None:
+                ignore_files = (gitignore,) + inherited
+                self.ignore_sources.append(gitignore.source)
+        self._ignore_files_by_dir[prefix.rstrip('/')] = ignore_files
+        if self._project_rules is not None:
+            ignore_files = (self._project_rules,) + ignore_files
+        return DirectoryRules(self, prefix, ignore_files)
+
+    def summary(self):
+        """Returns a one-line description of what the ignore files pruned."""
+        return (f"{self.ignored_dir_count} directories and {self.ignored_file_count} files matched "
+                f"{len(self.ignore_sources)} ignore files (pruned, not in directory_tree).")
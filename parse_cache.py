@@ -0,0 +1,220 @@
+#parse_cache.py
+
+"""
+Content-addressed cache of parser output shared by build_code_db.py and build_code_json.py.
+
+Entries live in a single SQLite file and are keyed by a hash of
+(content hash, parser name, parser version, Python version). Parsed file
+dictionaries embed their own path, so the path is part of the key too: an
+unchanged file at the same location is a hit for either builder, while a copy
+of it elsewhere is parsed once for its own path.
+
+Values are the parsed file dict with 'full_content' blanked out (the caller
+already has the content), serialized as compact JSON and zlib-compressed.
+JSON is used rather than marshal or pickle because parser output may contain
+str/list subclasses from BeautifulSoup, which it normalizes to plain values
+exactly as the builders' own JSON output does. The Python version is still
+part of the key since the ast-based parsers can differ between versions.
+
+The builders' main process owns the single writable ParseCache; worker
+processes only read through lookup(), which keeps one read-only connection
+per process. The cache uses WAL journaling so those reads never block on
+the writer. New entries are written and committed in batches of
+FLUSH_ENTRIES entries or FLUSH_BYTES bytes as the build goes, so a cold
+build does not hold the whole tree's parse output in memory and a killed
+build keeps what it had parsed so far. Total size is capped and the least
+recently used entries are evicted when the writer closes.
+"""
+
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+import zlib
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+FLUSH_ENTRIES = 1000 # Buffered new entries (or hits) written per transaction
+FLUSH_BYTES = 16 * 1024 * 1024 # ... or this many bytes of buffered blobs, whichever comes first
+
+# Bumped whenever the on-disk layout of entries changes.
+CACHE_FORMAT_VERSION = 1
+
+_reader_connections = {} # cache path -> read-only connection, one per process
+
+
+def make_key(parser_name, parser_version, path, content_hash):
+    """Builds the cache key for one file's parse result."""
+    key_source = "\0".join((
+        str(CACHE_FORMAT_VERSION), parser_name, str(parser_version),
+        sys.implementation.cache_tag or sys.version, path, content_hash
+    ))
+    return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+
+def encode(file_details, content):
+    """
+    Serializes a parsed file dict, dropping the full_content copy of the source.
+
+    Returns None if the dict cannot be serialized; such results are simply not cached.
+    """
+    if file_details.get('full_content') is content:
+        # Keep the key (and so the key order of the JSON output); restore the value on decode.
+        file_details = dict(file_details)
+        file_details['full_content'] = None
+    try:
+        return zlib.compress(json.dumps(file_details, separators=(',', ':')).encode('utf-8'), 1)
+    except (TypeError, ValueError):
+        return None
+
+
+def decode(blob, content):
+    """Inverse of encode(): rebuilds the parsed file dict for the given content, or None if blob is unreadable."""
+    try:
+        file_details = json.loads(zlib.decompress(blob))
+    except (zlib.error, ValueError):
+        return None
+    if 'full_content' in file_details and file_details['full_content'] is None:
+        file_details['full_content'] = content
+    return file_details
+
+
+def lookup(cache_path, key):
+    """
+    Returns the cached blob for key, or None. Safe to call from worker processes.
+
+    Any error (missing file, locked or corrupt database) is treated as a miss;
+    the cache must never be able to break a build.
+    """
+    conn = _reader_connections.get(cache_path)
+    try:
+        if conn is None:
+            conn = sqlite3.connect(f"file:{cache_path}?mode=ro", uri=True)
+            _reader_connections[cache_path] = conn
+        row = conn.execute("SELECT data FROM entries WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error:
+        return None
+
+
+def open_cache(path, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Opens the writable cache for a build, or returns None if it cannot be used.
+
+    A corrupt or unopenable cache file is reported once and the build goes on
+    without a cache, like any other cache error.
+    """
+    try:
+        return ParseCache(path, max_bytes)
+    except sqlite3.Error as e:
+        print(f"Warning: could not open parse cache '{path}'; building without it: {e}")
+        return None
+
+
+class ParseCache:
+    """
+    Writable handle on the parse cache, owned by a builder's main process.
+
+    Record hits with touch() and new results with put(); both are buffered and
+    written in batches (see FLUSH_ENTRIES and FLUSH_BYTES), and the rest by
+    close(), which also enforces max_bytes by evicting the least recently
+    used entries. A write error is reported once and turns the remaining
+    updates into no-ops.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._touched = []
+        self._new_entries = []
+        self._new_bytes = 0
+        self._failed = False
+        self.conn = sqlite3.connect(path)
+        try:
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used INTEGER NOT NULL
+            )''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used)')
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.close()
+            raise
+
+    def touch(self, key):
+        """Records a cache hit so the entry counts as recently used."""
+        self.hits += 1
+        if not self._failed:
+            self._touched.append(key)
+            if len(self._touched) >= FLUSH_ENTRIES:
+                self._flush()
+
+    def put(self, key, blob):
+        """Records a freshly parsed result (blob is None if it could not be encoded)."""
+        self.misses += 1
+        if blob is not None and not self._failed:
+            self._new_entries.append((key, blob))
+            self._new_bytes += len(blob)
+            if len(self._new_entries) >= FLUSH_ENTRIES or self._new_bytes >= FLUSH_BYTES:
+                self._flush()
+
+    def _write_buffered(self):
+        now = time.time_ns()
+        self.conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?", ((now, key) for key in self._touched))
+        self.conn.executemany("INSERT OR REPLACE INTO entries (key, data, size, last_used) VALUES (?, ?, ?, ?)",
+                              ((key, blob, len(blob), now) for key, blob in self._new_entries))
+        self._touched = []
+        self._new_entries = []
+        self._new_bytes = 0
+
+    def _fail(self, e):
+        print(f"Warning: could not update parse cache '{self.path}': {e}")
+        self._failed = True
+        self._touched = []
+        self._new_entries = []
+        self._new_bytes = 0
+
+    def _flush(self):
+        """Writes and commits the buffered hits and entries."""
+        try:
+            self._write_buffered()
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self._fail(e)
+
+    def close(self):
+        """Writes the remaining buffered entries, evicts down to max_bytes and closes the cache."""
+        try:
+            if not self._failed:
+                self._write_buffered()
+                self._evict()
+                self.conn.commit()
+        except sqlite3.Error as e:
+            self._fail(e)
+        finally:
+            self.conn.close()
+
+    def _evict(self):
+        """Deletes the least recently used entries until the total size fits in max_bytes."""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+
+    def summary(self):
+        """One-line description of cache effectiveness for the build summary."""
+        lookups = self.hits + self.misses
+        rate = (100.0 * self.hits / lookups) if lookups else 0.0
+        return f"{self.hits} parse cache hits, {self.misses} misses ({rate:.0f}% hit rate)."
@@ -0,0 +1,347 @@
+#python_symbols.py
+
+"""
+Python symbol extraction for the parsing core (context_core.py) shared by build_code_db.py and build_code_json.py.
+
+parse_python_file() parses a module once and collects its imports, classes
+and functions in a single PythonSymbolCollector pass. The collector only
+descends into statement bodies (if/for/while/with/try/match blocks and
+def/class bodies), never into expressions, since imports and definitions
+can only appear as statements; so nested functions and classes are found
+at any depth for about the cost of visiting the statements.
+
+Every symbol gets a 'qualname' following Python's __qualname__ rules
+('Outer.Inner.method', 'func.<locals>.helper') and a 'parent': the qualname
+of the enclosing class or function, or None at module level. Classes and
+functions are keyed by qualname, so module-level symbols keep their plain
+names; methods stay under their class's 'methods', keyed by name, and
+everything else that is a function (module-level or nested in a function
+or method) is under 'functions'.
+
+Imports are formatted directly from their nodes, which gives the text
+ast.unparse() would without building an unparser per import.
+"""
+
+import ast
+import re
+import sys
+import textwrap
+
+# --- Helper Functions for Python AST Parsing ---
+
+def get_docstring(node):
+    """
+    Safely extracts the docstring from a Python AST node (FunctionDef, ClassDef, Module).
+
+    Args:
+        node: An AST node object.
+
+    Returns:
+        The docstring string, or None if no docstring is found or the node type is not applicable.
+    """
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Module)):
+        return ast.get_docstring(node)
+    return None
+
+def get_signature(node):
+    """
+    Constructs a string representation of a Python function or method signature
+    from its AST node. Includes parameters with annotations and defaults, and return annotation.
+
+    Args:
+        node: An AST node of type ast.FunctionDef, ast.AsyncFunctionDef, or ast.Lambda.
+
+    Returns:
+        A string representing the signature (e.g., "(self, name: str) -> None"),
+        or None if the node type is not a function/method/lambda.
+    """
+    if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+        return None
+
+    args = []
+    unparse_available = sys.version_info >= (3, 9)
+    def safe_unparse(n):
+        if unparse_available:
+            try: return ast.unparse(n).strip()
+            except Exception: pass
+        if isinstance(n, ast.Name): return n.id
+        if isinstance(n, ast.Constant): return repr(n.value)
+        return f"<{type(n).__name__}>"
+
+    if hasattr(ast.arguments, 'posonlyargs') and node.args.posonlyargs:
+        for arg in node.args.posonlyargs:
+            arg_str = arg.arg
+            if arg.annotation:
+                arg_str += f": {safe_unparse(arg.annotation)}"
+            args.append(arg_str)
+        args.append('/')
+
+    num_defaults = len(node.args.defaults) if node.args.defaults else 0
+    for i, arg in enumerate(node.args.args):
+        arg_str = arg.arg
+        if arg.annotation:
+            arg_str += f": {safe_unparse(arg.annotation)}"
+        default_index = i - (len(node.args.args) - num_defaults)
+        if default_index >= 0 and default_index < num_defaults and node.args.defaults[default_index] is not None:
+            arg_str += f"={safe_unparse(node.args.defaults[default_index])}"
+        args.append(arg_str)
+
+    if node.args.vararg:
+        arg_str = f"*{node.args.vararg.arg}"
+        if node.args.vararg.annotation:
+            arg_str += f": {safe_unparse(node.args.vararg.annotation)}"
+        args.append(arg_str)
+
+    if hasattr(ast.arguments, 'kwonlyargs') and node.args.kwonlyargs:
+        if not node.args.vararg and (node.args.args or (hasattr(ast.arguments, 'posonlyargs') and node.args.posonlyargs)): # Add * if kwonlyargs exist, no *args, but there are other args
+            pass # No explicit '*' needed if regular or pos-only args exist, the syntax implies it
+        elif not node.args.vararg: # Only kw-only args, or kw-only after pos-only args that ended with /
+            args.append('*')
+
+        for i, arg in enumerate(node.args.kwonlyargs):
+            arg_str = arg.arg
+            if arg.annotation:
+                arg_str += f": {safe_unparse(arg.annotation)}"
+            if node.args.kw_defaults and i < len(node.args.kw_defaults) and node.args.kw_defaults[i] is not None:
+                arg_str += f"={safe_unparse(node.args.kw_defaults[i])}"
+            args.append(arg_str)
+
+    if node.args.kwarg:
+        arg_str = f"**{node.args.kwarg.arg}"
+        if node.args.kwarg.annotation:
+            arg_str += f": {safe_unparse(node.args.kwarg.annotation)}"
+        args.append(arg_str)
+
+    signature_str = "(" + ", ".join(args) + ")"
+    if node.returns:
+        try:
+           return_annotation_str = safe_unparse(node.returns)
+           if return_annotation_str:
+               signature_str += f" -> {return_annotation_str}"
+        except Exception:
+            pass
+    return signature_str
+
+
+class SourceLines:
+    """
+    Line table for one source file, built once and shared by every symbol lookup.
+
+    Lines are split the way the ast module numbers them (on \\n, \\r\\n and \\r
+    only) and line_starts[i] is the character offset where line i (0-based)
+    begins, with a final entry equal to len(source), so any line range or
+    (lineno, col_offset) position maps to a slice of the source in O(1).
+    """
+    _LINE_RE = re.compile(r'[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+\Z')
+
+    def __init__(self, source_code):
+        self.source = source_code
+        self.lines = self._LINE_RE.findall(source_code)
+        self.line_starts = [0]
+        offset = 0
+        for line in self.lines:
+            offset += len(line)
+            self.line_starts.append(offset)
+
+    def offset(self, lineno_idx, col_offset):
+        """Converts a 0-based line index and a UTF-8 byte column (as ast reports it) to a character offset."""
+        line = self.lines[lineno_idx]
+        if not line.isascii():
+            col_offset = len(line.encode('utf-8')[:col_offset].decode('utf-8', errors='ignore'))
+        return self.line_starts[lineno_idx] + col_offset
+
+    def segment_span(self, node):
+        """
+        Returns the (start, end) character offsets of the node's source text, or None.
+
+        Mirrors the original per-version behavior of get_source_segment: on 3.11+
+        the exact ast.get_source_segment span (ast's extend_past_eol argument does
+        not exist, so decorators are not included); on 3.8-3.10 the node's full
+        lines plus any preceding decorator lines, stripped of surrounding whitespace.
+        """
+        if sys.version_info >= (3, 11):
+            end_lineno = getattr(node, 'end_lineno', None)
+            end_col_offset = getattr(node, 'end_col_offset', None)
+            if end_lineno is None or end_col_offset is None:
+                return None
+            return self.offset(node.lineno - 1, node.col_offset), self.offset(end_lineno - 1, end_col_offset)
+
+        start_lineno_idx = node.lineno - 1
+        decorator_start_lineno_idx = start_lineno_idx
+        for i in range(start_lineno_idx - 1, -1, -1):
+            line = self.lines[i].strip()
+            if line.startswith('@'):
+                decorator_start_lineno_idx = i
+            elif line and not line.startswith('#'): # Stop if non-decorator, non-comment
+                break
+            elif not line and i < decorator_start_lineno_idx - 1: # Stop on blank line unless it's right before decorators
+                break
+        end_index = node.end_lineno if getattr(node, 'end_lineno', None) else node.lineno
+        start = self.line_starts[decorator_start_lineno_idx]
+        end = self.line_starts[min(end_index, len(self.lines))]
+        # Equivalent to "".join(lines[...]).strip(), without building the string twice.
+        while start < end and self.source[start].isspace(): start += 1
+        while end > start and self.source[end - 1].isspace(): end -= 1
+        return start, end
+
+
+def get_source_segment(source_code, node, source_lines=None):
+    """
+    Extracts the exact source code string for a given Python AST node,
+    including any preceding decorators.
+
+    Pass a SourceLines built once per file when extracting many segments from
+    the same source; otherwise one is built for this call.
+    """
+    if source_lines is None:
+        source_lines = SourceLines(source_code)
+    span = source_lines.segment_span(node)
+    if span is None:
+        return None
+    start, end = span
+    return source_lines.source[start:end]
+
+
+_WHITESPACE_ONLY_LINE_RE = re.compile('^[ \t]+$', re.MULTILINE) # textwrap's own pattern
+
+
+def dedent_source(text):
+    """
+    textwrap.dedent(), without its margin search when the first line is not
+    indented. Symbol sources start at the definition (or decorator) itself, so
+    that is the usual case, and then the only change dedent makes is
+    clearing whitespace-only lines.
+    """
+    if text[:1] in ('', ' ', '\t', '\n'):
+        return textwrap.dedent(text)
+    return _WHITESPACE_ONLY_LINE_RE.sub('', text)
+
+
+def format_import(node):
+    """Returns the source form of an ast.Import or ast.ImportFrom node, as ast.unparse() writes it."""
+    names = ', '.join(f"{alias.name} as {alias.asname}" if alias.asname else alias.name for alias in node.names)
+    if isinstance(node, ast.Import):
+        return f"import {names}"
+    return f"from {'.' * (node.level or 0)}{node.module or ''} import {names}"
+
+
+def _statement_fields_by_type():
+    """Maps each node type with statement lists (def, class, if, try, match case...) to the fields holding them."""
+    node_types = [ast.Module, ast.ExceptHandler, *ast.stmt.__subclasses__()]
+    if hasattr(ast, 'match_case'): # Python 3.10+
+        node_types.append(ast.match_case)
+    fields_by_type = {}
+    for node_type in node_types:
+        fields = tuple(field for field in ('body', 'orelse', 'finalbody', 'handlers', 'cases') if field in node_type._fields)
+        if fields:
+            fields_by_type[node_type] = fields
+    return fields_by_type
+
+
+# Expressions never contain definitions or imports, so these are the only fields the collector descends into.
+STATEMENT_FIELDS_BY_TYPE = _statement_fields_by_type()
+# Statements the collector visits; simple ones (assignments, expressions, returns...) are skipped without a visit.
+COLLECTED_STATEMENT_TYPES = frozenset(STATEMENT_FIELDS_BY_TYPE) | {ast.Import, ast.ImportFrom}
+
+
+class PythonSymbolCollector(ast.NodeVisitor):
+    """
+    Collects a module's imports, classes and functions at any depth in one pass.
+
+    Call visit(tree), then read imports (a list of import statements), classes
+    ({qualname: class_data}) and functions ({qualname: function_data}).
+    """
+
+    def __init__(self, content, source_lines=None):
+        self.content = content
+        self.source_lines = source_lines if source_lines is not None else SourceLines(content)
+        self.imports = []
+        self.classes = {}
+        self.functions = {}
+        self._scopes = [] # (qualname, class_data or None for functions) of the enclosing definitions
+
+    def _symbol(self, node, symbol_type, qualname, parent):
+        source_seg = get_source_segment(self.content, node, self.source_lines)
+        symbol = {"type": symbol_type, "name": node.name, "qualname": qualname, "parent": parent}
+        if symbol_type == "class":
+            symbol.update({"docstring": get_docstring(node), "methods": {}})
+        else:
+            symbol.update({"signature": get_signature(node), "docstring": get_docstring(node)})
+        symbol.update({
+            "source_code": dedent_source(source_seg) if source_seg else None,
+            "start_lineno": node.lineno,
+            "end_lineno": node.end_lineno if hasattr(node, 'end_lineno') else node.lineno
+        })
+        return symbol
+
+    def _enter(self, node):
+        """Returns (qualname, parent qualname, enclosing class_data or None) for a definition node."""
+        if not self._scopes:
+            return node.name, None, None
+        parent, class_data = self._scopes[-1]
+        if class_data is not None:
+            return f"{parent}.{node.name}", parent, class_data
+        return f"{parent}.<locals>.{node.name}", parent, None
+
+    def generic_visit(self, node):
+        for field in STATEMENT_FIELDS_BY_TYPE.get(type(node), ()):
+            for statement in getattr(node, field):
+                if type(statement) in COLLECTED_STATEMENT_TYPES:
+                    self.visit(statement)
+
+    def visit_Import(self, node):
+        self.imports.append(format_import(node))
+
+    visit_ImportFrom = visit_Import
+
+    def visit_FunctionDef(self, node):
+        qualname, parent, class_data = self._enter(node)
+        if class_data is not None:
+            class_data["methods"][node.name] = self._symbol(node, "method", qualname, parent)
+        else:
+            self.functions[qualname] = self._symbol(node, "function", qualname, parent)
+        self._scopes.append((qualname, None))
+        self.generic_visit(node)
+        self._scopes.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        qualname, parent, _ = self._enter(node)
+        class_data = self.classes[qualname] = self._symbol(node, "class", qualname, parent)
+        self._scopes.append((qualname, class_data))
+        self.generic_visit(node)
+        self._scopes.pop()
+
+
+def parse_python_file(filepath, content):
+    """
+    Parses a Python file's content to extract structured information.
+    """
+    file_data = {
+        "path": filepath, "type": "python", "imports": [], "classes": {}, "functions": {},
+        "start_lineno": 1, "end_lineno": len(content.splitlines()), "full_content": content
+    }
+    if not content.strip():
+        file_data["message"] = "File is empty or contains only whitespace."
+        return file_data
+
+    try:
+        tree = ast.parse(content)
+        source_lines = SourceLines(content) # One line table per file, shared by all symbols
+        module_docstring = get_docstring(tree)
+        if module_docstring:
+             file_data["docstring"] = module_docstring
+    except SyntaxError as e:
+        print(f"Syntax error in {filepath}: {e}")
+        file_data.update({"type": "python_error", "error": str(e)})
+        return file_data
+    except Exception as e:
+        print(f"Unexpected parsing error in {filepath}: {e}")
+        file_data.update({"type": "python_error", "error": str(e)})
+        return file_data
+
+    collector = PythonSymbolCollector(content, source_lines)
+    collector.visit(tree)
+    file_data.update({"imports": collector.imports, "classes": collector.classes, "functions": collector.functions})
+    return file_data
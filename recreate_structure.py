@@ -0,0 +1,370 @@
+#recreate_structure.py
+
+"""
+Recreates a project tree from a context artifact: a database written by
+build_code_db.py (optionally one of its snapshots, see context_snapshots.py)
+or a JSON file written by build_code_json.py.
+
+Entries are streamed in path order and never collected: database rows come
+from one cursor over files (or snapshot_files) ordered by path, and the JSON
+file is decoded one "files" entry at a time, so memory use does not grow
+with the size of the project. Decompressing (see content_codec.py), hashing
+and writing each file happens on a pool of threads (zlib, lzma, hashlib and
+file I/O release the GIL), with a bounded number of files in flight.
+
+Directories are created in a single pass over directory_tree, parents
+before children, which also recreates empty directories; files whose
+directory is not listed there (snapshots, older artifacts) get it created
+on demand. With skip_unchanged, a file already on disk is only rewritten if
+its sha256 differs from both the recorded content_hash and the content to be
+written, so re-running on a populated checkout only touches what changed.
+
+Only files whose content was stored can be written: managed files, binary
+files and files that could not be read or decoded are counted and skipped.
+Contents were stored with '\\r\\n' line endings translated to '\\n', and are
+written back that way. Paths that are absolute or climb out of the output
+directory with '..' are refused.
+
+Usage: python recreate_structure.py SOURCE OUTPUT_DIR [-j THREADS] [--skip-unchanged] [--snapshot NAME]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import content_codec
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+JSON_READ_SIZE = 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+DEFAULT_THREADS = min(32, (os.cpu_count() or 1) + 4) # ThreadPoolExecutor's default
+
+
+class _JsonStream:
+    """
+    Incremental reader for the top level of a build_code_json.py file.
+
+    Values are decoded with json.JSONDecoder.raw_decode() from a buffer that
+    is refilled (in growing reads) whenever a value runs past its end, and
+    trimmed as values are consumed.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size=JSON_READ_SIZE):
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        if self.pos > len(self.buffer) // 2:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        self.buffer += chunk
+        return True
+
+    def next_char(self):
+        """Skips whitespace and returns the next character without consuming it ('' at the end)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars):
+        """Consumes the next character, which must be one of chars, and returns it."""
+        char = self.next_char()
+        if not char or char not in chars:
+            raise ValueError(f"Malformed context JSON: expected {chars!r} but found {char!r}.")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decodes and consumes the next JSON value."""
+        self.next_char()
+        read_size = JSON_READ_SIZE
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                self.pos = end
+                return value
+            except json.JSONDecodeError:
+                if self.eof or not self._fill(read_size):
+                    raise
+                read_size *= 2 # Large values are retried a logarithmic number of times
+
+
+def iter_json_context(filepath):
+    """
+    Yields the top-level members of a build_code_json.py file as (key, value) pairs,
+    except that "files" is yielded entry by entry as ('file', (path, file_details)).
+    """
+    with open(filepath, 'r', encoding='utf-8') as f:
+        stream = _JsonStream(f)
+        stream.expect('{')
+        if stream.next_char() == '}':
+            return
+        while True:
+            key = stream.value()
+            stream.expect(':')
+            if key == 'files':
+                stream.expect('{')
+                if stream.next_char() != '}':
+                    while True:
+                        path = stream.value()
+                        stream.expect(':')
+                        yield 'file', (path, stream.value())
+                        if stream.expect(',}') == '}':
+                            break
+                else:
+                    stream.expect('}')
+            else:
+                yield key, stream.value()
+            if stream.expect(',}') == '}':
+                return
+
+
+def _safe_relative_path(path):
+    """Returns path as a relative OS path, or None if it is absolute or leaves the output directory."""
+    if not path or path.startswith(('/', '\\')) or os.path.isabs(path) or os.path.splitdrive(path)[0]:
+        return None
+    parts = [part for part in path.replace('\\', '/').split('/') if part not in ('', '.')]
+    if not parts or '..' in parts:
+        return None
+    return os.path.join(*parts)
+
+
+class _DirectoryMaker:
+    """Creates directories under the output root, each at most once."""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.created = {''}
+        self.count = 0
+
+    def ensure(self, relative_dir):
+        """Creates relative_dir (an OS path relative to the output root) and any missing parents."""
+        if relative_dir in self.created:
+            return
+        self.ensure(os.path.dirname(relative_dir))
+        try:
+            os.mkdir(os.path.join(self.output_dir, relative_dir))
+            self.count += 1
+        except FileExistsError:
+            pass
+        self.created.add(relative_dir)
+
+
+def _file_sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_file(target, stored_content, content_hash, codec, skip_unchanged):
+    """
+    Decodes one stored content and writes it to target (runs on the thread pool).
+
+    Returns ('written' or 'unchanged', bytes) or ('error', message).
+    """
+    try:
+        if isinstance(stored_content, dict):
+            text = content_codec.decode_json_value(stored_content, codec)
+        else:
+            text = codec.decode(stored_content)
+        data = text.encode('utf-8', 'surrogateescape')
+        if skip_unchanged:
+            try:
+                existing_size = os.stat(target).st_size
+            except OSError:
+                existing_size = None
+            if existing_size is not None and (existing_size == len(data) or content_hash is not None):
+                on_disk_hash = _file_sha256(target)
+                if on_disk_hash == content_hash or on_disk_hash == hashlib.sha256(data).hexdigest():
+                    return 'unchanged', len(data)
+        with open(target, 'wb') as f:
+            f.write(data)
+        return 'written', len(data)
+    except (OSError, ValueError) as e:
+        return 'error', f"{target}: {e}"
+
+
+def _iter_database_entries(conn, snapshot=None):
+    """Yields ('dir', path) for every directory_tree directory, then ('file', (path, stored_content, content_hash)) in path order."""
+    if snapshot is not None:
+        try:
+            row = conn.execute("SELECT id FROM snapshots WHERE name = ?", (snapshot,)).fetchone()
+        except sqlite3.OperationalError:
+            row = None # Database has no snapshots table
+        if row is None:
+            raise ValueError(f"No snapshot named '{snapshot}'.")
+        rows = conn.execute("""
+            SELECT p.path, c.full_content, c.content_hash FROM snapshot_files s
+            JOIN snapshot_paths p ON p.id = s.path_id JOIN snapshot_contents c ON c.id = s.content_id
+            WHERE s.snapshot_id = ? ORDER BY p.path""", (row[0],))
+    else:
+        for (path,) in conn.execute("SELECT path FROM directory_tree WHERE path LIKE '%/' ORDER BY path"):
+            yield 'dir', path
+        rows = conn.execute("SELECT path, full_content, content_hash FROM files ORDER BY path")
+    for path, stored_content, content_hash in rows:
+        yield 'file', (path, stored_content, content_hash)
+
+
+def _json_stored_content(file_details):
+    """
+    Returns the full_content of a JSON "files" entry, or None if none was stored.
+
+    Entries of managed files and of files that could not be read or decoded
+    carry a placeholder (null, or "" as build_code_json.py writes error
+    entries) rather than the file's content; the database stores NULL for them.
+    """
+    if not isinstance(file_details, dict):
+        return None
+    entry_type = file_details.get('type') or ''
+    if entry_type in ('managed_static', 'skipped_non_utf8') or entry_type.startswith('read_error'):
+        return None
+    return file_details.get('full_content')
+
+
+def _iter_json_entries(filepath):
+    """Yields ('file', (path, stored_content, None)) per "files" entry, then ('dir', path) for the directory tree."""
+    for key, value in iter_json_context(filepath):
+        if key == 'file':
+            path, file_details = value
+            yield 'file', (path, _json_stored_content(file_details), None)
+        elif key == 'directory_tree':
+            for path in value:
+                if path.endswith('/'):
+                    yield 'dir', path
+
+
+def recreate_structure(source, output_dir, threads=DEFAULT_THREADS, skip_unchanged=False, snapshot=None):
+    """
+    Writes the project recorded in source (a context database or JSON file) under output_dir.
+
+    Args:
+        source: Path of a build_code_db.py database or build_code_json.py JSON file.
+        output_dir: Directory to recreate the tree in; created if missing. Files
+            that are not in the artifact are left alone.
+        threads: Number of writer threads.
+        skip_unchanged: Leave files whose on-disk sha256 already matches untouched.
+        snapshot: Name of a snapshot to recreate instead of the database's current build.
+
+    Returns:
+        A dict of counts: 'directories', 'written', 'unchanged', 'no_content',
+        'unsafe_paths', 'errors' and 'bytes' (written).
+    """
+    with open(source, 'rb') as f:
+        is_database = f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    if snapshot is not None and not is_database:
+        raise ValueError("Snapshots are only stored in databases.")
+    conn = None
+    if is_database:
+        conn = sqlite3.connect(f"file:{os.path.abspath(source)}?mode=ro", uri=True)
+        codec = content_codec.register_sqlite_functions(conn)
+        entries = _iter_database_entries(conn, snapshot)
+    else:
+        codec = content_codec.ContentCodec('zlib')
+        entries = _iter_json_entries(source)
+
+    os.makedirs(output_dir, exist_ok=True)
+    directories = _DirectoryMaker(output_dir)
+    counts = {'directories': 0, 'written': 0, 'unchanged': 0, 'no_content': 0, 'unsafe_paths': 0, 'errors': 0, 'bytes': 0}
+    errors = []
+
+    def collect(future):
+        status, detail = future.result()
+        if status == 'error':
+            counts['errors'] += 1
+            errors.append(detail)
+        else:
+            counts[status] += 1
+            if status == 'written':
+                counts['bytes'] += detail
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+            pending = deque()
+            for kind, entry in entries:
+                if kind == 'dir':
+                    relative_dir = _safe_relative_path(entry.rstrip('/'))
+                    if relative_dir is not None:
+                        directories.ensure(relative_dir)
+                    continue
+                path, stored_content, content_hash = entry
+                relative_path = _safe_relative_path(path)
+                if relative_path is None:
+                    counts['unsafe_paths'] += 1
+                    print(f"Warning: refusing to write '{path}' outside the output directory.")
+                    continue
+                if stored_content is None:
+                    counts['no_content'] += 1
+                    continue
+                directories.ensure(os.path.dirname(relative_path))
+                pending.append(executor.submit(_write_file, os.path.join(output_dir, relative_path), stored_content,
+                                               content_hash, codec, skip_unchanged))
+                if len(pending) >= threads * 4:
+                    collect(pending.popleft())
+            while pending:
+                collect(pending.popleft())
+    finally:
+        if conn is not None:
+            conn.close()
+
+    counts['directories'] = directories.count
+    for message in errors[:20]:
+        print(f"Error writing {message}")
+    if len(errors) > 20:
+        print(f"... and {len(errors) - 20} more write errors.")
+    return counts
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Recreate a project tree from a context database or JSON file.")
+    parser.add_argument("source", help="project_context.db (build_code_db.py) or project_context_structured.json (build_code_json.py).")
+    parser.add_argument("output_dir", help="Directory to write the tree into (created if missing).")
+    parser.add_argument("-j", "--threads", type=int, default=DEFAULT_THREADS,
+                        help="Number of threads decoding and writing files (default: %(default)s).")
+    parser.add_argument("--skip-unchanged", action="store_true",
+                        help="Do not rewrite files whose on-disk sha256 already matches the recorded content.")
+    parser.add_argument("--snapshot", metavar="NAME", help="Recreate a named snapshot of the database (see context_snapshots.py).")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        counts = recreate_structure(args.source, args.output_dir, threads=args.threads, skip_unchanged=args.skip_unchanged, snapshot=args.snapshot)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        sys.exit(f"Could not recreate from '{args.source}': {e}")
+    elapsed = time.perf_counter() - start
+
+    print(f"\nRecreated '{args.source}' in '{args.output_dir}' in {elapsed:.2f}s")
+    print(f"  - {counts['directories']} directories created.")
+    print(f"  - {counts['written']} files written ({counts['bytes']:,} bytes).")
+    if args.skip_unchanged:
+        print(f"  - {counts['unchanged']} files already up to date (sha256 matched), left untouched.")
+    if counts['no_content']:
+        print(f"  - {counts['no_content']} files have no stored content (managed, binary or unreadable) and were not written.")
+    if counts['unsafe_paths']:
+        print(f"  - {counts['unsafe_paths']} entries refused for unsafe paths.")
+    if counts['errors']:
+        print(f"  - {counts['errors']} files could not be written.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#source_spans.py
+
+"""
+Offset-based storage of symbol sources, shared by build_code_db.py and build_code_json.py.
+
+Every parsed symbol (Python function, method or class, CSS rule, JavaScript
+function, class, import, export or event listener) carries a 'source_code'
+string that is a copy of text already present in its file's full_content;
+a class's source repeats all of its methods' sources again. With source
+offsets enabled the builders pass each parsed file through
+replace_sources_with_offsets(), which swaps that copy for
+'source_start'/'source_end' character offsets into full_content and sets
+'source_code' to None. A symbol keeps its text when the slice would not
+reproduce it exactly (e.g. Python sources whose whitespace-only lines were
+normalized by textwrap.dedent), so readers never get a different string.
+
+Offsets count characters, not bytes: they index a Python str directly and
+match SQLite's substr() on TEXT columns, which is what the builders'
+*_expanded views use (see SOURCE_SQL).
+"""
+
+# SQL expression rebuilding a row's source; {t} is the symbol table alias and {content} the
+# file content expression (f.full_content, or decompress(f.full_content) in compressed databases).
+SOURCE_SQL = "COALESCE({t}.source_code, substr({content}, {t}.source_start + 1, {t}.source_end - {t}.source_start))"
+
+
+def iter_source_items(file_details):
+    """Yields every dict in a parsed file that carries a 'source_code' of its own."""
+    file_type = file_details.get('type')
+    if file_type == 'python':
+        yield from file_details.get('functions', {}).values()
+        for class_data in file_details.get('classes', {}).values():
+            yield class_data
+            yield from class_data.get('methods', {}).values()
+    elif file_type == 'css':
+        yield from file_details.get('rules', [])
+    elif file_type == 'javascript':
+        for key in ('functions', 'classes', 'imports', 'exports', 'event_listeners'):
+            yield from file_details.get(key, [])
+
+
+class _SourceLocator:
+    """Finds symbol sources in a file's content, starting the search at the symbol's first line."""
+
+    def __init__(self, content):
+        self.content = content
+        self.line_starts = [0]
+        position = content.find('\n')
+        while position != -1:
+            self.line_starts.append(position + 1)
+            position = content.find('\n', position + 1)
+
+    def locate(self, source_code, start_lineno):
+        """Returns the (start, end) offsets of source_code in the content, or None."""
+        content = self.content
+        hint = 0
+        if isinstance(start_lineno, int) and 0 < start_lineno <= len(self.line_starts):
+            hint = self.line_starts[start_lineno - 1]
+        start = content.find(source_code, hint)
+        if start == -1 or content.count('\n', hint, start) > 1:
+            # Decorators precede the reported line, and some parsers count
+            # line breaks other than '\n'; take the nearest occurrence before it.
+            before = content.rfind(source_code, 0, hint + len(source_code))
+            if before != -1:
+                start = before
+        if start == -1:
+            return None
+        return start, start + len(source_code)
+
+
+def replace_sources_with_offsets(file_details):
+    """
+    Replaces each symbol's 'source_code' in file_details with offsets into its
+    'full_content', in place. Returns the number of characters no longer stored.
+    """
+    content = file_details.get('full_content')
+    if not content:
+        return 0
+    locator = None
+    saved = 0
+    for item in iter_source_items(file_details):
+        source_code = item.get('source_code')
+        if not source_code:
+            continue
+        if locator is None:
+            locator = _SourceLocator(content)
+        span = locator.locate(source_code, item.get('start_lineno'))
+        if span is None:
+            continue
+        item['source_start'], item['source_end'] = span
+        item['source_code'] = None
+        saved += len(source_code)
+    return saved
+
+
+def symbol_source(full_content, item):
+    """Returns a symbol's source text, whether it was stored inline or as offsets."""
+    if item.get('source_code') is not None or item.get('source_start') is None:
+        return item.get('source_code')
+    return full_content[item['source_start']:item['source_end']]
+
+
+def restore_sources(file_details):
+    """Undoes replace_sources_with_offsets() in place, e.g. for consumers that expect 'source_code'."""
+    content = file_details.get('full_content') or ''
+    for item in iter_source_items(file_details):
+        if item.get('source_start') is not None:
+            item['source_code'] = symbol_source(content, item)
+            del item['source_start'], item['source_end']
+    return file_details